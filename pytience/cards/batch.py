@@ -0,0 +1,112 @@
+"""
+Shuffle and deal many decks at once with NumPy, for simulations that need millions of deals.  Decks are arrays of card
+codes, one row per deck, and never become Card objects.  Deals match deal_permutation() exactly, so any row can be
+replayed one at a time with Deck().shuffle(deal_number) or KlondikeGame(deal_number=deal_number).
+
+NumPy is an optional dependency: pip install pytience[batch]
+"""
+from typing import Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise ImportError('pytience.cards.batch requires NumPy: pip install pytience[batch]') from None
+
+from pytience.cards.deck import JOKER_CODE, SPLITMIX64_GAMMA
+
+KLONDIKE_TABLEAU_SIZE = 7
+
+
+def _mix64(values: np.ndarray) -> np.ndarray:
+    """The vectorized equivalent of pytience.cards.deck.mix64().  uint64 arithmetic wraps, like the & MASK64 there."""
+    values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return values ^ (values >> np.uint64(31))
+
+
+def random_deal_numbers(count: int, seed: int = None) -> np.ndarray:
+    """
+    :param count: The number of deal numbers
+    :param seed: Seed for the random number generator, so the deal numbers can be reproduced
+    :return: A (count,) uint64 array of random deal numbers
+    """
+    return np.random.default_rng(seed).integers(0, 1 << 64, size=count, dtype=np.uint64, endpoint=False)
+
+
+def deal_decks(deal_numbers: np.ndarray, num_cards: int = JOKER_CODE) -> np.ndarray:
+    """
+    Shuffle a deck for each deal number, with the same splitmix64 Fisher-Yates shuffle as deal_permutation(), one
+    vectorized step per card position.
+    :param deal_numbers: The deal numbers
+    :param num_cards: The number of cards in each deck, which are the card codes from 0 to num_cards - 1
+    :return: A (len(deal_numbers), num_cards) uint8 array of card codes, top card first
+    """
+    state = np.array(deal_numbers, dtype=np.uint64)
+    columns = np.arange(len(state))
+
+    # Work with one row per position, so each step reads and writes contiguous memory
+    decks = np.repeat(np.arange(num_cards, dtype=np.uint8)[:, np.newaxis], len(state), axis=1)
+    gamma = np.uint64(SPLITMIX64_GAMMA)
+    for position in range(num_cards - 1, 0, -1):
+        state += gamma
+        others = (_mix64(state) % np.uint64(position + 1)).astype(np.intp)
+        cards = decks[others, columns]
+        decks[others, columns] = decks[position]
+        decks[position] = cards
+    return np.ascontiguousarray(decks.T)
+
+
+def shuffled_decks(count: int, seed: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param count: The number of decks
+    :param seed: Seed for the random number generator, so the decks can be reproduced
+    :return: A (count,) uint64 array of deal numbers, and the (count, 52) uint8 array of their decks
+    """
+    deal_numbers = random_deal_numbers(count, seed)
+    return deal_numbers, deal_decks(deal_numbers)
+
+
+def klondike_deal_order(tableau_size: int = KLONDIKE_TABLEAU_SIZE) -> np.ndarray:
+    """
+    The deck position of each tableau card, pile by pile and bottom card first.  Cards are dealt one per pile, from
+    left to right, starting one pile further right each round, as Tableau does.
+    :param tableau_size: The number of tableau piles
+    :return: The deck positions of the tableau_size * (tableau_size + 1) / 2 tableau cards
+    """
+    positions = [[] for _ in range(tableau_size)]
+    position = 0
+    for starting_pile_num in range(tableau_size):
+        for pile_num in range(starting_pile_num, tableau_size):
+            positions[pile_num].append(position)
+            position += 1
+    return np.array([position for pile in positions for position in pile], dtype=np.intp)
+
+
+def klondike_layouts(decks: np.ndarray, tableau_size: int = KLONDIKE_TABLEAU_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Split decks into their starting Klondike tableau and stock.  Pile n of the tableau holds n + 1 cards, of which only
+    the top one is revealed, and its cards start at column n * (n + 1) / 2.
+    :param decks: A (count, num_cards) array of decks, top card first
+    :param tableau_size: The number of tableau piles
+    :return: A (count, num_tableau_cards) array of tableau cards, pile by pile and bottom card first, and a
+    (count, num_cards - num_tableau_cards) array of stock cards, top card first
+    """
+    deal_order = klondike_deal_order(tableau_size)
+    return decks[:, deal_order], decks[:, len(deal_order):]
+
+
+def klondike_packed(tableau: np.ndarray, stock: np.ndarray) -> Tuple:
+    """
+    Pack one row of klondike_layouts() as a starting KlondikeGame position, for KlondikeGame(packed=...).
+    :param tableau: One row of tableau cards
+    :param stock: One row of stock cards
+    :return: The packed position
+    """
+    piles = []
+    start = 0
+    pile_num = 0
+    while start < len(tableau):
+        piles.append(bytes([pile_num]) + tableau[start:start + pile_num + 1].tobytes())
+        start += pile_num + 1
+        pile_num += 1
+    return 0, stock.tobytes(), b'', (b'', b'', b'', b''), tuple(piles)
@@ -1,10 +1,11 @@
 # -*- coding: utf-8 -*-
 import random
 from collections import deque
-from dataclasses import dataclass
+from copy import copy
+from dataclasses import dataclass, field
 from enum import Enum
-from itertools import product
-from typing import Iterable
+from struct import Struct
+from typing import Dict, Iterable, List, NoReturn, Optional
 
 from pytience.cards.exception import NoCardsRemainingException
 
@@ -13,6 +14,9 @@ class Color(Enum):
     Black = 1
     Red = 2
 
+    # Members are singletons, so identity hashing is equivalent to, and much cheaper than, Enum's name hashing
+    __hash__ = object.__hash__
+
     def __str__(self):
         return str(self.name)
 
@@ -23,6 +27,8 @@ class Suit(Enum):
     Clubs = '♣'
     Hearts = '♥'
 
+    __hash__ = object.__hash__
+
     @property
     def color(self):
         if self in [Suit.Clubs, Suit.Spades]:
@@ -48,15 +54,65 @@ class Pip(Enum):
     Queen = 'Q'
     King = 'K'
 
+    __hash__ = object.__hash__
+
     def __str__(self):
         return str(self.value)
 
 
+SUITS = tuple(Suit)
+PIPS = tuple(Pip)
+JOKER_CODE = len(SUITS) * len(PIPS)
+NUM_CARD_CODES = JOKER_CODE + 1
+
+_SUIT_CODES = {suit: suit_num for suit_num, suit in enumerate(SUITS)}
+_PIP_CODES = {pip: rank for rank, pip in enumerate(PIPS)}
+
+
+@dataclass(frozen=True)
+class CardIdentity:
+    """
+    The immutable identity of a card, independent of whether it is revealed.
+    There is exactly one interned instance per card code in CARD_IDENTITIES.
+    """
+    code: int
+    pip: Optional[Pip]
+    suit: Optional[Suit]
+    rank: int  # 1 for an Ace through 13 for a King, 0 for a Joker
+    color: Optional[Color]
+
+    def __str__(self):
+        return '*' if self.pip is None else '{}{}'.format(self.pip.value, self.suit.value)
+
+
+CARD_IDENTITIES = tuple(
+    CardIdentity(suit_num * len(PIPS) + rank, pip, suit, rank + 1, suit.color)
+    for suit_num, suit in enumerate(SUITS) for rank, pip in enumerate(PIPS)
+) + (CardIdentity(JOKER_CODE, None, None, 0, None),)
+
+# Every possible card string, indexed by [is_revealed][code].  Concealed cards are prefixed with '|'.
+CARD_STRINGS = tuple(
+    tuple('{}{}'.format('' if is_revealed else '|', identity) for identity in CARD_IDENTITIES)
+    for is_revealed in (False, True)
+)
+
+# The reverse of CARD_STRINGS: card string -> (code, is_revealed)
+PARSED_CARD_STRINGS = {
+    card_string: (code, bool(is_revealed))
+    for is_revealed, card_strings in enumerate(CARD_STRINGS) for code, card_string in enumerate(card_strings)
+}
+
+
 @dataclass
 class Card:
     pip: Pip
     suit: Suit
     is_revealed: bool = False
+    code: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # The compact integer code for this card: suit * 13 + rank, or JOKER_CODE.  A card's pip and suit never change.
+        self.code = JOKER_CODE if self.pip is None else _SUIT_CODES[self.suit] * len(PIPS) + _PIP_CODES[self.pip]
 
     @property
     def is_concealed(self):
@@ -70,6 +126,15 @@ class Card:
     def color(self):
         return self.suit.color
 
+    @property
+    def identity(self) -> CardIdentity:
+        return CARD_IDENTITIES[self.code]
+
+    @classmethod
+    def from_code(cls, code: int, is_revealed: bool = False) -> 'Card':
+        identity = CARD_IDENTITIES[code]
+        return Card(identity.pip, identity.suit, is_revealed)
+
     def reveal(self):
         self.is_revealed = True
         return self
@@ -78,15 +143,25 @@ class Card:
         self.is_revealed = False
         return self
 
+    def revealed(self) -> 'Card':
+        """
+        The card revealed, without changing it.  Piles treat their cards as immutable, so clones can share them.
+        :return: The card itself if it's already revealed, otherwise a revealed copy
+        """
+        return self if self.is_revealed else Card(self.pip, self.suit, True)
+
+    def concealed(self) -> 'Card':
+        """
+        The card concealed, without changing it.
+        :return: The card itself if it's already concealed, otherwise a concealed copy
+        """
+        return Card(self.pip, self.suit) if self.is_revealed else self
+
     def __repr__(self):
         return self.__str__()
 
     def __str__(self):
-        state = '|' if self.is_concealed else ''
-        if self.pip is None:
-            return '{}*'.format(state)
-        else:
-            return '{}{}{}'.format(state, self.pip.value, self.suit.value)
+        return CARD_STRINGS[self.is_revealed][self.code]
 
     @classmethod
     def parse_card(cls, card_string) -> 'Card':
@@ -95,40 +170,205 @@ class Card:
         :param card_string: The string representing the card
         :return: new Card object
         """
+        try:
+            code, is_revealed = PARSED_CARD_STRINGS[card_string]
+        except KeyError:
+            raise ValueError('Invalid card string: {!r}'.format(card_string)) from None
+        identity = CARD_IDENTITIES[code]
+        return Card(identity.pip, identity.suit, is_revealed)
+
+
+def pack_cards(cards: Iterable[Card]) -> bytes:
+    """
+    Packs cards into one byte per card code.  The revealed state of the cards is not kept, since it's a property
+    of the pile holding them.
+    :param cards: The cards to pack
+    :return: The card codes as bytes
+    """
+    return bytes(card.code for card in cards)
+
+
+def unpack_cards(packed: bytes, is_revealed: bool = False) -> List[Card]:
+    """
+    Creates new cards from the codes previously packed by pack_cards()
+    :param packed: The packed card codes
+    :param is_revealed: The revealed state for all the new cards
+    :return: A list of new Card objects
+    """
+    return [Card.from_code(code, is_revealed) for code in packed]
+
+
+# Set in the bytes of encode_cards() for revealed cards
+REVEALED_BIT = 0x80
+
+# The number of decks, the number of jokers per deck and whether the deck is shuffled, in Deck.to_bytes()
+_DECK_HEADER = Struct('<HHB')
+
+
+def encode_cards(cards: Iterable[Card]) -> bytes:
+    """
+    Encodes cards into one byte per card: the card code, with REVEALED_BIT set for revealed cards.  Unlike
+    pack_cards(), the revealed state of every card is kept, so any pile can be saved exactly.
+    :param cards: The cards to encode
+    :return: The encoded cards
+    """
+    return bytes(card.code | REVEALED_BIT if card.is_revealed else card.code for card in cards)
+
+
+def decode_cards(encoded: bytes) -> List[Card]:
+    """
+    Creates new cards from the bytes previously encoded by encode_cards()
+    :param encoded: The encoded cards
+    :return: A list of new Card objects
+    """
+    return [Card.from_code(byte & ~REVEALED_BIT, byte >= REVEALED_BIT) for byte in encoded]
+
+
+class ZobristKeys:
+    """
+    Random 64-bit keys, one per (position, card code, revealed state) in a pile.  The hash of a pile is the XOR of the
+    keys of its cards, so adding, removing or flipping a card updates the hash with a single XOR.  Keys are generated
+    on demand from a generator seeded by the pile's name, so hashes are stable from one run to the next.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._random = random.Random(name)
+        self._keys: List[int] = []
+
+    def key(self, position: int, code: int, is_revealed: bool = False) -> int:
+        """
+        :param position: The card's position in the pile, counting from the bottom
+        :param code: The card's code
+        :param is_revealed: Whether the card is revealed
+        :return: The key for the card at that position
+        """
+        index = (position * 2 + is_revealed) * NUM_CARD_CODES + code
+        keys = self._keys
+        while index >= len(keys):
+            keys.extend(self._random.getrandbits(64) for _ in range(2 * NUM_CARD_CODES))
+        return keys[index]
 
-        is_revealed = True
-        if card_string[0] == '|':
-            is_revealed = False
-            card_string = card_string[1:]
+    def hash(self, cards: Iterable[Card], track_revealed: bool = False) -> int:
+        """
+        The hash of a whole pile.
+        :param cards: The cards in the pile, bottom card first
+        :param track_revealed: Whether the revealed state of the cards is part of the hash.  It isn't for piles
+        whose cards are all either concealed or revealed.
+        :return: The hash of the pile
+        """
+        pile_hash = 0
+        for position, card in enumerate(cards):
+            pile_hash ^= self.key(position, card.code, track_revealed and card.is_revealed)
+        return pile_hash
+
+    def hash_codes(self, codes: bytes) -> int:
+        """
+        The hash of a whole pile of concealed cards, from their codes alone.
+        :param codes: The codes of the cards in the pile, bottom card first
+        :return: The hash of the pile, equal to hash() of the same cards
+        """
+        if not codes:
+            return 0
+        self.key(len(codes) - 1, NUM_CARD_CODES - 1)
+        keys = self._keys
+        pile_hash = 0
+        for offset, code in zip(range(0, len(codes) * 2 * NUM_CARD_CODES, 2 * NUM_CARD_CODES), codes):
+            pile_hash ^= keys[offset + code]
+        return pile_hash
+
+
+_ZOBRIST_KEYS: Dict[str, ZobristKeys] = {}
+
+
+def zobrist_keys(name: str) -> ZobristKeys:
+    """The shared keys for the named pile"""
+    if name not in _ZOBRIST_KEYS:
+        _ZOBRIST_KEYS[name] = ZobristKeys(name)
+    return _ZOBRIST_KEYS[name]
+
+
+MASK64 = (1 << 64) - 1
 
-        if card_string == '*':
-            pip, suit = None, None
-        else:
-            pip = Pip(card_string[:-1]) or None
-            suit = Suit(card_string[-1]) or None
 
-        return Card(pip, suit, is_revealed)
+def mix64(value: int) -> int:
+    """The splitmix64 finalizer, which scrambles a 64-bit value so that similar values give unrelated results"""
+    value = (value ^ (value >> 30)) * 0xbf58476d1ce4e5b9 & MASK64
+    value = (value ^ (value >> 27)) * 0x94d049bb133111eb & MASK64
+    return value ^ (value >> 31)
+
+
+SPLITMIX64_GAMMA = 0x9e3779b97f4a7c15
+MAX_DEAL_NUMBER = MASK64
+
+
+def deal_permutation(deal_number: int, num_cards: int = JOKER_CODE) -> List[int]:
+    """
+    The order of the cards for a deal number.  A Fisher-Yates shuffle is driven by a splitmix64 stream seeded with the
+    deal number, so the same number gives the same deal on any platform and in any process.  Every deal number from 0
+    to MAX_DEAL_NUMBER is valid, so a deal can be stored in 8 bytes.
+    :param deal_number: The deal number
+    :param num_cards: The number of cards to shuffle
+    :return: For each position in the shuffled deck, the position of its card in the ordered deck
+    """
+    if not 0 <= deal_number <= MAX_DEAL_NUMBER:
+        raise ValueError('Deal numbers must be from 0 to {}: {}'.format(MAX_DEAL_NUMBER, deal_number))
+    permutation = list(range(num_cards))
+    state = deal_number
+    for position in range(num_cards - 1, 0, -1):
+        state = (state + SPLITMIX64_GAMMA) & MASK64
+        other = mix64(state) % (position + 1)
+        permutation[position], permutation[other] = permutation[other], permutation[position]
+    return permutation
 
 
 class Deck:
-    def __init__(self, num_decks: int = 1, num_jokers_per_deck: int = 0, deck_dump: object = None):
+    def __init__(self, num_decks: int = 1, num_jokers_per_deck: int = 0, deck_dump: object = None,
+                 packed: bytes = None, seed: int = None):
+        """
+        :param seed: Seed a random number generator for this deck alone, so its shuffles can be reproduced.  Without
+        a seed, shuffles use the global random number generator.
+        """
+        self._random = random if seed is None else random.Random(seed)
+        self._state_hash = 0
         if deck_dump:
             self.load(deck_dump)
         else:
             self.num_decks = num_decks
             self.num_jokers = num_jokers_per_deck
-            self.cards = deque(
-                [Card(pip, suit) for suit, pip in product(Suit, Pip)] * num_decks +
-                [Card(None, None)] * num_jokers_per_deck * num_decks
-            )
             self.is_shuffled = False
+            if packed is None:
+                packed = bytes(range(JOKER_CODE)) * num_decks + bytes([JOKER_CODE]) * num_jokers_per_deck * num_decks
+            self.unpack(packed)
 
-    def shuffle(self):
-        """Ensure the deck is shuffled"""
-        random.shuffle(self.cards)
+    def shuffle(self, deal_number: int = None):
+        """
+        Ensure the deck is shuffled
+        :param deal_number: Put the cards in the order given by deal_permutation() for this deal number instead of a
+        random order.  The result doesn't depend on the current order of the cards.
+        """
+        if deal_number is None:
+            self._random.shuffle(self.cards)
+        else:
+            ordered = sorted(self.cards, key=lambda card: card.code)
+            self.cards = deque(ordered[position] for position in deal_permutation(deal_number, len(ordered)))
         self.is_shuffled = True
+        self.rehash()
         return self
 
+    @property
+    def state_hash(self) -> int:
+        """
+        The Zobrist hash of the remaining cards, kept up to date by deal(), undeal() and replenish().
+        Call rehash() after changing the cards directly.
+        """
+        return self._state_hash
+
+    def rehash(self) -> int:
+        """Recompute the hash of the remaining cards from scratch"""
+        self._state_hash = zobrist_keys('stock').hash(reversed(self.cards))
+        return self._state_hash
+
     @property
     def remaining(self) -> int:
         """Number of cards remaining in the deck"""
@@ -138,21 +378,26 @@ class Deck:
         """Deal a single concealed card from the top of the deck"""
         if not self.cards:
             raise NoCardsRemainingException("No cards remaining in the deck.")
-        return self.cards.popleft()
+        card = self.cards.popleft()
+        # Cards are hashed by their position from the bottom of the deck, so the others are unaffected
+        self._state_hash ^= zobrist_keys('stock').key(len(self.cards), card.code)
+        return card
 
     def deal_all(self) -> Iterable[Card]:
         """Deal all the cards"""
-        while len(self.cards) > 0:
-            yield self.cards.popleft()
+        while self.remaining > 0:
+            yield self.deal()
 
     def undeal(self, card: Card) -> object:
         """Add a single card to the top of the deck"""
+        self._state_hash ^= zobrist_keys('stock').key(len(self.cards), card.code)
         self.cards.appendleft(card)
         return self
 
     def replenish(self, cards: Iterable[Card]) -> object:
         """Add a list of cards to the bottom of the deck"""
         self.cards.extend(cards)
+        self.rehash()
         return self
 
     def dump(self):
@@ -168,6 +413,160 @@ class Deck:
         self.num_jokers = deck_dump["num_jokers"]
         self.is_shuffled = deck_dump["is_shuffled"]
         self.cards = deque([Card.parse_card(card_string) for card_string in deck_dump["cards"]])
+        self.rehash()
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes the deck compactly: the number of decks and the number of jokers per deck as 2-byte integers and whether
+        it's shuffled as one byte, followed by the remaining cards, top first, as encoded by encode_cards()
+        :return: The encoded deck
+        """
+        return _DECK_HEADER.pack(self.num_decks, self.num_jokers, self.is_shuffled) + encode_cards(self.cards)
+
+    def load_bytes(self, deck_bytes: bytes) -> NoReturn:
+        """
+        Import the deck previously encoded with to_bytes()
+        :param deck_bytes: The encoded deck
+        """
+        self.num_decks, self.num_jokers, is_shuffled = _DECK_HEADER.unpack_from(deck_bytes)
+        self.is_shuffled = bool(is_shuffled)
+        self.cards = deque(decode_cards(deck_bytes[_DECK_HEADER.size:]))
+        self.rehash()
+
+    def pack(self) -> bytes:
+        """
+        Packs the remaining cards, top first.  Deck cards are always concealed.
+        :return: The card codes as bytes
+        """
+        return pack_cards(self.cards)
+
+    def unpack(self, packed: bytes) -> NoReturn:
+        """
+        Replaces the remaining cards with concealed cards previously packed by pack()
+        :param packed: The packed card codes
+        """
+        self.cards = deque(unpack_cards(packed))
+        self.rehash()
+
+    def clone(self) -> 'Deck':
+        """
+        Copies the deck without dumping or deep copying it.  The copy shares the Card objects, which are never changed
+        once they're in a deck, and has its own list of them.  A seeded deck's random number generator is copied, so
+        both decks shuffle alike.
+        :return: The new deck
+        """
+        # pylint: disable=protected-access
+        clone = object.__new__(type(self))
+        clone.__dict__.update(self.__dict__)
+        if self._random is not random:
+            clone._random = copy(self._random)
+        clone._copy_cards()
+        return clone
+
+    def _copy_cards(self) -> NoReturn:
+        """
+        Replace the cards shared with the deck this one was cloned from with a copy.
+        Intended for internal use only.
+        """
+        self.cards = self.cards.copy()
 
     def __len__(self):
         return self.remaining
+
+
+class Shoe(Deck):
+    """
+    A deck for large multi-deck shoes, which keeps its remaining cards as a buffer of card codes, top first.  Dealing
+    moves a head index along the buffer instead of shifting the cards, shuffling swaps codes rather than Card objects,
+    and Card objects are only created as cards are dealt.  The cards property builds a new list of concealed cards
+    each time it's read, so change the cards by assigning to it.
+    """
+
+    @property
+    def cards(self) -> List[Card]:
+        return unpack_cards(self._buffer[self._head:])
+
+    @cards.setter
+    def cards(self, cards: Iterable[Card]):
+        self.unpack(pack_cards(cards))
+
+    def shuffle(self, deal_number: int = None):
+        """
+        Ensure the shoe is shuffled.  Shuffles match those of a Deck with the same cards and the same seed.
+        :param deal_number: Put the cards in the order given by deal_permutation() for this deal number instead of a
+        random order.  The result doesn't depend on the current order of the cards.
+        """
+        self._compact()
+        if deal_number is None:
+            self._random.shuffle(self._buffer)
+        else:
+            ordered = sorted(self._buffer)
+            self._buffer = bytearray(ordered[position] for position in deal_permutation(deal_number, len(ordered)))
+        self.is_shuffled = True
+        self.rehash()
+        return self
+
+    def rehash(self) -> int:
+        """Recompute the hash of the remaining cards from scratch"""
+        self._state_hash = zobrist_keys('stock').hash_codes(self._buffer[self._head:][::-1])
+        return self._state_hash
+
+    @property
+    def remaining(self) -> int:
+        """Number of cards remaining in the shoe"""
+        return len(self._buffer) - self._head
+
+    def deal(self) -> Card:
+        """Deal a single concealed card from the top of the shoe"""
+        if self._head == len(self._buffer):
+            raise NoCardsRemainingException("No cards remaining in the deck.")
+        code = self._buffer[self._head]
+        self._head += 1
+        self._state_hash ^= zobrist_keys('stock').key(len(self._buffer) - self._head, code)
+        return Card.from_code(code)
+
+    def undeal(self, card: Card) -> object:
+        """Add a single card to the top of the shoe"""
+        if self._head == 0:
+            # Open a gap before the top card as big as the buffer, so a run of undeals takes constant time per card
+            gap = max(len(self._buffer), 1)
+            self._buffer[0:0] = bytes(gap)
+            self._head = gap
+        self._state_hash ^= zobrist_keys('stock').key(self.remaining, card.code)
+        self._head -= 1
+        self._buffer[self._head] = card.code
+        return self
+
+    def replenish(self, cards: Iterable[Card]) -> object:
+        """Add a list of cards to the bottom of the shoe"""
+        self._buffer.extend(card.code for card in cards)
+        self.rehash()
+        return self
+
+    def pack(self) -> bytes:
+        """
+        Packs the remaining cards, top first.  Shoe cards are always concealed.
+        :return: The card codes as bytes
+        """
+        return bytes(self._buffer[self._head:])
+
+    def unpack(self, packed: bytes) -> NoReturn:
+        """
+        Replaces the remaining cards with those previously packed by pack()
+        :param packed: The packed card codes
+        """
+        self._buffer = bytearray(packed)
+        self._head = 0
+        self.rehash()
+
+    def _compact(self) -> NoReturn:
+        """
+        Drop the codes of the cards already dealt from the front of the buffer.
+        Intended for internal use only.
+        """
+        del self._buffer[:self._head]
+        self._head = 0
+
+    def _copy_cards(self) -> NoReturn:
+        self._buffer = self._buffer[self._head:]
+        self._head = 0
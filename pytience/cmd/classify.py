@@ -0,0 +1,154 @@
+"""
+Classify a range of Klondike deals as solved, unsolvable, not found or over budget, on a pool of worker processes.
+
+Each worker is sent a range of deal numbers and sends back one compact tuple per deal, with the solution packed by
+pack_moves().  Results are written to a JSON lines file as each range finishes, one object per deal, which doubles as
+the checkpoint: with --resume, deals already in the file are skipped and the rest are appended.
+"""
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterable, Iterator, List, Set, Tuple
+
+from pytience.games.solitaire.klondike import KlondikeGame
+from pytience.games.solitaire.solver import DEFAULT_MAX_NODES, KlondikeSolver, SolverStatus, pack_moves, unpack_moves
+
+DEFAULT_CHUNK_SIZE = 16
+
+# (deal number, SolverStatus value, nodes, seconds, packed moves)
+ClassifiedDeal = Tuple[int, int, int, float, bytes]
+
+
+def classify_range(deal_range: Tuple[int, int], max_nodes: int = DEFAULT_MAX_NODES) -> List[ClassifiedDeal]:
+    """
+    Solve each deal in a range.  This is the work sent to each worker process.
+    :param deal_range: The first deal number, and the deal number after the last
+    :param max_nodes: The node budget for each deal
+    :return: The result of each deal
+    """
+    solver = KlondikeSolver(max_nodes)
+    results = []
+    for deal_number in range(*deal_range):
+        result = solver.solve(KlondikeGame(deal_number=deal_number))
+        results.append((deal_number, result.status.value, result.nodes, result.seconds, pack_moves(result.moves)))
+    return results
+
+
+def pending_ranges(start: int, stop: int, done: Set[int], chunk_size: int = DEFAULT_CHUNK_SIZE) \
+        -> Iterator[Tuple[int, int]]:
+    """
+    Split the deals that aren't done yet into ranges of at most chunk_size deals.
+    :param start: The first deal number
+    :param stop: The deal number after the last
+    :param done: The deal numbers already classified
+    :param chunk_size: The most deals in a range
+    :return: The ranges, as (first deal number, deal number after the last)
+    """
+    range_start = None
+    for deal_number in range(start, stop):
+        if deal_number in done:
+            if range_start is not None:
+                yield range_start, deal_number
+                range_start = None
+        elif range_start is None:
+            range_start = deal_number
+        elif deal_number - range_start == chunk_size:
+            yield range_start, deal_number
+            range_start = deal_number
+    if range_start is not None:
+        yield range_start, stop
+
+
+def to_record(classified_deal: ClassifiedDeal) -> dict:
+    """
+    :param classified_deal: A result from classify_range()
+    :return: The JSON-ready result, with the solution as klondike commands
+    """
+    deal_number, status, nodes, seconds, moves = classified_deal
+    return {
+        "deal_number": deal_number,
+        "status": SolverStatus(status).name,
+        "nodes": nodes,
+        "seconds": round(seconds, 6),
+        "moves": list(map(str, unpack_moves(moves)))
+    }
+
+
+def read_done(output: Path) -> Set[int]:
+    """
+    Find the deals already classified in an output file, dropping any partly written last line left by an
+    interrupted run so new results can be appended.
+    :param output: The output file
+    :return: The deal numbers in the file
+    """
+    if not output.exists():
+        return set()
+    with open(output, 'rb+') as f:
+        contents = f.read()
+        end = contents.rfind(b'\n') + 1
+        if end < len(contents):
+            f.truncate(end)
+    return {json.loads(line)["deal_number"] for line in contents[:end].splitlines() if line.strip()}
+
+
+def classify(start: int, stop: int, output: Path, max_nodes: int = DEFAULT_MAX_NODES, workers: int = None,
+             chunk_size: int = DEFAULT_CHUNK_SIZE, resume: bool = False) -> Counter:
+    """
+    Classify every deal in a range, writing one JSON line per deal to the output file as each chunk finishes.
+    :param start: The first deal number
+    :param stop: The deal number after the last
+    :param output: The JSON lines file to write
+    :param max_nodes: The node budget for each deal
+    :param workers: The number of worker processes, or None for one per CPU.  With 1, deals are solved in this process.
+    :param chunk_size: The number of deals sent to a worker at a time
+    :param resume: Skip the deals already in the output file and append the rest, rather than starting over
+    :return: The number of deals classified in this run, by status name
+    """
+    done = read_done(output) if resume else set()
+    ranges = list(pending_ranges(start, stop, done, chunk_size))
+    counts = Counter()
+    with open(output, 'a' if resume else 'w') as f:
+        def write(results: Iterable[List[ClassifiedDeal]]):
+            for chunk in results:
+                for classified_deal in chunk:
+                    record = to_record(classified_deal)
+                    counts[record["status"]] += 1
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+
+        classify_chunk = partial(classify_range, max_nodes=max_nodes)
+        if workers == 1:
+            write(map(classify_chunk, ranges))
+        else:
+            with Pool(workers) as pool:
+                write(pool.imap_unordered(classify_chunk, ranges))
+    return counts
+
+
+def main(args: List[str] = None):
+    parser = ArgumentParser(description='Classify Klondike deals as solved, unsolvable, not found or over budget.')
+    parser.add_argument('start', type=int, help='The first deal number')
+    parser.add_argument('stop', type=int, help='The deal number after the last')
+    parser.add_argument('-o', '--output', type=Path, default=Path('klondike-deals.jsonl'),
+                        help='The JSON lines file to write (default: %(default)s)')
+    parser.add_argument('-n', '--max-nodes', type=int, default=DEFAULT_MAX_NODES,
+                        help='The node budget for each deal (default: %(default)s)')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                        help='The number of worker processes (default: %(default)s)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='The number of deals sent to a worker at a time (default: %(default)s)')
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='Skip the deals already in the output file and append the rest')
+    options = parser.parse_args(args)
+    counts = classify(options.start, options.stop, options.output, options.max_nodes, options.workers,
+                      options.chunk_size, options.resume)
+    print(', '.join('{}: {}'.format(status.name, counts[status.name]) for status in SolverStatus), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,15 +3,25 @@ from functools import wraps
 from io import StringIO
 from itertools import zip_longest
 from pathlib import Path
+from threading import Lock, Thread
+from typing import List, NoReturn, Optional, Tuple
 import json
 
 from colorama import Style, Fore, Back
 
 from pytience.cards.deck import Card, Suit, Color
+from pytience.games.solitaire.journal import KlondikeJournal
 from pytience.games.solitaire.klondike import KlondikeGame
 
 PROMPT = 'klondike{}> '
 DEFAULT_SAVE_FILE = Path.home().joinpath('.pytience').joinpath('klondike.save')
+# The game is saved to the journal after every change, and resumed from it at startup
+DEFAULT_JOURNAL_FILE = Path.home().joinpath('.pytience').joinpath('klondike.journal')
+# Save files with this suffix use the compact binary format of KlondikeGame.to_bytes() rather than JSON
+BINARY_SAVE_SUFFIX = '.bin'
+# The most moves that can be undone, which keeps the save written after every command from growing
+MAX_UNDO_DEPTH = 1000
+JOURNAL_WRITER_THREAD_NAME = 'klondike-journal-writer'
 
 
 def error_handler(function):
@@ -29,6 +39,71 @@ def error_handler(function):
     return _error_handler
 
 
+class JournalWriter:
+    """
+    Writes changes to the journal on a background thread, so commands never wait on the disk.  Each change is queued
+    with a copy of the game as it was just after it, and the thread runs while there are changes to write, taking
+    everything queued at once.  A queued snapshot replaces every change queued before it, and changes that would be
+    followed by a compaction anyway are written as a single snapshot of the last one.
+    """
+
+    def __init__(self, journal: KlondikeJournal, errors: List[Exception]):
+        """
+        :param journal: The journal to write
+        :param errors: Where to report errors writing the journal
+        """
+        self.journal = journal
+        self.errors = errors
+        self._changes: List[Tuple[KlondikeGame, Optional[str], tuple]] = []
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    def record(self, game: KlondikeGame, action: str, *args) -> NoReturn:
+        """Queue a change that was just made to the game, as for KlondikeJournal.record()"""
+        self._queue(game.clone(), action, args)
+
+    def snapshot(self, game: KlondikeGame) -> NoReturn:
+        """Queue a snapshot of the game, replacing every change queued before it"""
+        self._queue(game.clone(), None, ())
+
+    def _queue(self, game: KlondikeGame, action: Optional[str], args: tuple) -> NoReturn:
+        with self._lock:
+            if action is None:
+                self._changes.clear()
+            self._changes.append((game, action, args))
+            if self._thread is None:
+                self._thread = Thread(target=self._write, name=JOURNAL_WRITER_THREAD_NAME)
+                self._thread.start()
+
+    def _write(self) -> NoReturn:
+        """Write queued changes until there are none left.  Runs on the writer thread."""
+        journal = self.journal
+        while True:
+            with self._lock:
+                changes, self._changes = self._changes, []
+                if not changes:
+                    self._thread = None
+                    return
+            if journal.num_records is None or journal.num_records + len(changes) > journal.snapshot_interval:
+                changes = [(changes[-1][0], None, ())]
+            for game, action, args in changes:
+                try:
+                    if action is None:
+                        journal.snapshot(game)
+                    else:
+                        journal.record(game, action, *args)
+                except Exception as error:  # pylint: disable=broad-except
+                    journal.num_records = None  # the journal may be missing a change, so start it again
+                    self.errors.append(error)
+
+    def flush(self) -> NoReturn:
+        """Wait until every queued change has been written"""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
 class KlondikeCmd(Cmd):
 
     def __init__(self, *args):
@@ -42,18 +117,47 @@ class KlondikeCmd(Cmd):
             'f': self.do_foundation,
             'n': self.do_new,
             'u': self.do_undo,
+            'r': self.do_redo,
+            'a': self.do_autoplay,
             'h': self.do_help,
             'q': self.do_quit,
             'EOF': self.do_quit
         }
         self.errors = []
+        self.journal = KlondikeJournal(DEFAULT_JOURNAL_FILE)
+        self.writer = JournalWriter(self.journal, self.errors)
         try:
-            self.klondike = self.load(DEFAULT_SAVE_FILE)
+            self.klondike = self.resume()
         except FileNotFoundError as _:
-            self.klondike = KlondikeGame()
+            self.klondike = KlondikeGame(max_undo_depth=MAX_UNDO_DEPTH)
+            self.writer.snapshot(self.klondike)
         except Exception as e:  # pylint: disable=broad-except
             self.errors.append(e)
-            self.klondike = KlondikeGame()
+            self.klondike = KlondikeGame(max_undo_depth=MAX_UNDO_DEPTH)
+
+    def resume(self) -> KlondikeGame:
+        """Load the game from the journal, or from the default save file if there's no journal yet"""
+        try:
+            return self.journal.load(max_undo_depth=MAX_UNDO_DEPTH)
+        except FileNotFoundError:
+            return self.load(DEFAULT_SAVE_FILE)
+
+    def play(self, action: str, *args):
+        """
+        Change the game by calling one of its methods, and record the change in the journal if there was one
+        :param action: The name of the method, one of JOURNALED_ACTIONS
+        :param args: The arguments to call it with
+        """
+        result = getattr(self.klondike, action)(*args)
+        # undo, redo and goto return whether they changed anything, and autoplay and solve return the moves they made.
+        # Every other action changes the game unless it raises.
+        if result is None or result:
+            self.writer.record(self.klondike, action, *args)
+
+    def close(self):
+        """Finish writing the journal"""
+        self.writer.flush()
+        self.journal.close()
 
     def preloop(self):
         self.print_game()
@@ -68,25 +172,41 @@ class KlondikeCmd(Cmd):
         except EOFError:
             pass
 
-    @staticmethod
-    def do_quit(_):
+    def do_quit(self, _):
         """Quit to terminal"""
+        self.close()
         return True
 
     @error_handler
-    def do_new(self, _):
-        """Reset the game with a new shuffled deck"""
-        self.klondike = KlondikeGame()
+    def do_new(self, line):
+        """Usage: new [<deal number>]
+        Reset the game with a new shuffled deck.
+        If a deal number is given, replay that deal.
+        """
+        self.klondike = KlondikeGame(deal_number=int(line) if line else None, max_undo_depth=MAX_UNDO_DEPTH)
+        self.writer.snapshot(self.klondike)
 
     @error_handler
     def do_undo(self, _):
         """Undo the last move"""
-        self.klondike.undo()
+        self.play('undo')
+
+    @error_handler
+    def do_redo(self, _):
+        """Redo the last move undone"""
+        self.play('redo')
+
+    @error_handler
+    def do_goto(self, line):
+        """Usage: goto <move number>
+        Undo or redo moves until the given number of moves have been made, where 0 is the start of the game.
+        """
+        self.play('goto', int(line))
 
     @error_handler
     def do_deal(self, _):
         """Deal a new card from the top of the stock"""
-        self.klondike.deal()
+        self.play('deal')
 
     @error_handler
     def do_waste(self, line):
@@ -96,7 +216,7 @@ class KlondikeCmd(Cmd):
         """
         args = tuple(map(int, line.split()))
         tableau_destination_pile = args[0] if args else None
-        self.klondike.select_waste(tableau_destination_pile)
+        self.play('select_waste', tableau_destination_pile)
 
     @error_handler
     def do_foundation(self, line):
@@ -116,7 +236,7 @@ class KlondikeCmd(Cmd):
         if not suit:
             raise Exception("Usage: foundation <c|d|s|h> [<tableau pile num>]")
         tableau_destination_pile = int(args[1]) if len(args) > 1 else None
-        self.klondike.select_foundation(suit, tableau_destination_pile)
+        self.play('select_foundation', suit, tableau_destination_pile)
 
     @error_handler
     def do_tableau(self, line):
@@ -131,22 +251,33 @@ class KlondikeCmd(Cmd):
         pile_num = args[0]
         card_num = args[1] if len(args) > 1 else -1
         destination_pile_num = args[2] if len(args) > 2 else None
-        self.klondike.select_tableau(pile_num, card_num, destination_pile_num)
+        self.play('select_tableau', pile_num, card_num, destination_pile_num)
 
     @error_handler
     def do_solve(self, _):
-        """Pick a card from the tableau to move to the foundation.
+        """Move all the remaining tableau cards to the foundation.
         All cards must be dealt and revealed.
         """
-        self.klondike.solve()
+        self.play('solve')
+
+    @error_handler
+    def do_autoplay(self, _):
+        """Move every waste and tableau card that can safely go to the foundation.
+        A card is safe to move once both cards of the opposite color and one rank lower are in the foundation.
+        """
+        self.play('autoplay')
 
     @staticmethod
     def save(klondike, filename):
         if isinstance(filename, str):
             filename = Path(filename)
         filename.parent.mkdir(parents=True, exist_ok=True)
-        with open(filename, 'w') as f:
-            json.dump(klondike.dump(), f)
+        if filename.suffix == BINARY_SAVE_SUFFIX:
+            with open(filename, 'wb') as f:
+                f.write(klondike.to_bytes())
+        else:
+            with open(filename, 'w') as f:
+                json.dump(klondike.dump(), f)
 
     @error_handler
     def do_save(self, line):
@@ -158,18 +289,21 @@ class KlondikeCmd(Cmd):
     def load(filename):
         if isinstance(filename, str):
             filename = Path(filename)
+        if filename.suffix == BINARY_SAVE_SUFFIX:
+            with open(filename, 'rb') as f:
+                return KlondikeGame.from_bytes(f.read(), max_undo_depth=MAX_UNDO_DEPTH)
         with open(filename, 'r') as f:
             game_dump = json.load(f)
-            return KlondikeGame(game_dump=game_dump)
+            return KlondikeGame(game_dump=game_dump, max_undo_depth=MAX_UNDO_DEPTH)
 
     @error_handler
     def do_load(self, line):
         """Usage: load [filename]"""
         filename = line or DEFAULT_SAVE_FILE
         self.klondike = self.load(filename)
+        self.writer.snapshot(self.klondike)
 
     def postcmd(self, stop, line):
-        self.save(self.klondike, DEFAULT_SAVE_FILE)
         self.print_game()
         return stop
 
@@ -238,9 +372,11 @@ class KlondikeCmd(Cmd):
             waste = '[{}]'.format(', '.join([_paint_card(card) for card in self.klondike.waste]))
             buffer.write('Waste: {}\n'.format(waste))
 
-            # Print foundation
+            # Print foundation.  The piles are read through the foundation and the tableau themselves, since reading
+            # their piles properties would have the next move rebuild their hashes and indexes.
             foundation = []
-            for suit, pile in self.klondike.foundation.piles.items():
+            for suit in self.klondike.foundation:
+                pile = self.klondike.foundation[suit]
                 if not pile:
                     foundation.append('[{}]'.format(_paint_suit(suit)))
                 else:
@@ -252,12 +388,12 @@ class KlondikeCmd(Cmd):
             column_width = 3
             spacer = ' ' * 2
             buffer.write(
-                '{}\n'.format(spacer.join(str(p).ljust(column_width) for p in range(len(self.klondike.tableau.piles)))))
+                '{}\n'.format(spacer.join(str(p).ljust(column_width) for p in range(len(self.klondike.tableau)))))
             buffer.write(
-                '{}\n'.format(spacer.join('-' * column_width for _ in range(len(self.klondike.tableau.piles)))))
+                '{}\n'.format(spacer.join('-' * column_width for _ in range(len(self.klondike.tableau)))))
 
             # Transpose the piles so they can be written as equal-length rows
-            transposed_piles = dict(enumerate(zip_longest(*self.klondike.tableau.piles)))
+            transposed_piles = dict(enumerate(zip_longest(*self.klondike.tableau)))
             for row_num, row in transposed_piles.items():
                 buffer.write('{}\n'.format(
                     spacer.join(
@@ -274,12 +410,13 @@ class KlondikeCmd(Cmd):
 
 def play():
     while True:
+        klondike = KlondikeCmd()
         try:
-            KlondikeCmd().cmdloop()
+            klondike.cmdloop()
 
             break
         except KeyboardInterrupt:
-            pass
+            klondike.close()  # the next game resumes from the journal
 
 
 if __name__ == '__main__':
@@ -1,4 +1,6 @@
-from pytience.cards.deck import Pip
+from enum import IntEnum
+
+from pytience.cards.deck import Pip, CARD_IDENTITIES, JOKER_CODE
 
 CARD_VALUES = {
     Pip.Ace: 1,
@@ -14,4 +16,35 @@ CARD_VALUES = {
     Pip.Jack: 11,
     Pip.Queen: 12,
     Pip.King: 13
-}
\ No newline at end of file
+}
+
+_CARDS = CARD_IDENTITIES[:JOKER_CODE]
+
+# Card codes that may start an empty pile
+ACE_CODES = frozenset(card.code for card in _CARDS if card.pip == Pip.Ace)
+KING_CODES = frozenset(card.code for card in _CARDS if card.pip == Pip.King)
+
+# The code of the Ace that starts each suit's foundation pile
+SUIT_ACE_CODES = {card.suit: card.code for card in _CARDS if card.pip == Pip.Ace}
+
+# For each card code, the codes of the cards that may be built on it in the tableau: one value lower, other color
+TABLEAU_BUILDS = tuple(
+    tuple(other.code for other in _CARDS if other.rank == card.rank - 1 and other.color != card.color)
+    for card in CARD_IDENTITIES
+)
+
+# For each card code, the code of the next card in its suit's foundation pile, or None after the King
+FOUNDATION_SUCCESSORS = tuple(
+    None if card.pip in (None, Pip.King) else card.code + 1 for card in CARD_IDENTITIES
+)
+
+
+class UndoOp(IntEnum):
+    """The ops of the undo records shared by KlondikeGame, Tableau and Foundation"""
+    TableauGet = 1  # pile, number of cards, whether the new top card was revealed
+    TableauPut = 2  # pile, number of cards, whether the cards came from the hand
+    FoundationGet = 3  # suit number, 1
+    FoundationPut = 4  # suit number, 1, whether the card came from the hand
+    Deal = 5  # whether the waste was recycled first
+    WasteGet = 6
+    Score = 7  # points, whether they were subtracted
@@ -0,0 +1,426 @@
+"""
+Play many Klondike games in lockstep with NumPy, for training and simulations that step thousands of games at once.
+A KlondikeBatch holds every game as rows of arrays rather than as Card objects, lists each game's legal moves as one
+row of a boolean mask over a fixed set of actions, and applies one action per game with a handful of vectorized
+operations.  The rules are exactly those of KlondikeGame, so any row can be packed and replayed one move at a time.
+
+NumPy is an optional dependency: pip install pytience[batch]
+"""
+from typing import Iterable, NoReturn, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise ImportError('pytience.games.solitaire.batch requires NumPy: pip install pytience[batch]') from None
+
+from pytience.cards.batch import KLONDIKE_TABLEAU_SIZE, deal_decks, klondike_deal_order, klondike_layouts
+from pytience.cards.deck import CARD_IDENTITIES, JOKER_CODE, PIPS, SUITS, Color
+from pytience.games.solitaire import TABLEAU_BUILDS
+from pytience.games.solitaire.exception import IllegalMoveException
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType, POINTS_WASTE_FOUNDATION, \
+    POINTS_WASTE_TABLEAU, POINTS_TABLEAU_FOUNDATION
+
+NUM_RANKS = len(PIPS)
+
+# The most cards a tableau move can take: a revealed run from King to Ace
+MAX_RUN = NUM_RANKS
+
+# The actions, in the order KlondikeGame.legal_moves() lists the moves they make, as (kind, origin, number of cards,
+# destination).  The origin of a tableau move is a pile number and that of a foundation move is a suit number.
+ACTIONS: Tuple[Tuple[MoveType, int, int, int], ...] = tuple(
+    [(MoveType.WasteToFoundation, 0, 1, 0)] +
+    [(MoveType.WasteToTableau, 0, 1, destination) for destination in range(KLONDIKE_TABLEAU_SIZE)] +
+    [action for origin in range(KLONDIKE_TABLEAU_SIZE) for action in
+     [(MoveType.TableauToFoundation, origin, 1, 0)] +
+     [(MoveType.TableauToTableau, origin, num_cards, destination) for num_cards in range(1, MAX_RUN + 1)
+      for destination in range(KLONDIKE_TABLEAU_SIZE) if destination != origin]] +
+    [(MoveType.FoundationToTableau, suit_num, 1, destination) for suit_num in range(len(SUITS))
+     for destination in range(KLONDIKE_TABLEAU_SIZE)] +
+    [(MoveType.Deal, 0, 0, 0)]
+)
+NUM_ACTIONS = len(ACTIONS)
+ACTION_INDEX = {action: action_num for action_num, action in enumerate(ACTIONS)}
+
+_ACTION_KINDS = np.array([kind.value for kind, _, _, _ in ACTIONS], dtype=np.int8)
+_ACTION_ORIGINS = np.array([origin for _, origin, _, _ in ACTIONS], dtype=np.intp)
+_ACTION_COUNTS = np.array([num_cards for _, _, num_cards, _ in ACTIONS], dtype=np.intp)
+_ACTION_DESTINATIONS = np.array([destination for _, _, _, destination in ACTIONS], dtype=np.intp)
+_ACTION_POINTS = np.array([{
+    MoveType.WasteToFoundation: POINTS_WASTE_FOUNDATION,
+    MoveType.WasteToTableau: POINTS_WASTE_TABLEAU,
+    MoveType.TableauToFoundation: POINTS_TABLEAU_FOUNDATION,
+    MoveType.FoundationToTableau: -POINTS_TABLEAU_FOUNDATION
+}.get(kind, 0) for kind, _, _, _ in ACTIONS], dtype=np.int32)
+
+# The suit number, rank from 0 and color (0 for black, 1 for red) of each card code
+_CARD_SUITS = np.array([SUITS.index(card.suit) for card in CARD_IDENTITIES[:JOKER_CODE]], dtype=np.intp)
+_CARD_RANKS = np.array([card.rank - 1 for card in CARD_IDENTITIES[:JOKER_CODE]], dtype=np.int16)
+_CARD_COLORS = np.array([card.color == Color.Red for card in CARD_IDENTITIES[:JOKER_CODE]], dtype=np.int16)
+
+# The wanted rank and color of a tableau pile that takes no cards, and the color of one that takes either color
+_NO_RANK = -2 * MAX_RUN
+_ANY_COLOR = -1
+
+# The action moving each number of cards from each tableau pile to each other pile, by [origin, num_cards - 1,
+# destination], or -1 where the origin and destination are the same pile
+_TABLEAU_ACTIONS = np.array([[[
+    ACTION_INDEX.get((MoveType.TableauToTableau, origin, num_cards, destination), -1)
+    for destination in range(KLONDIKE_TABLEAU_SIZE)] for num_cards in range(1, MAX_RUN + 1)]
+    for origin in range(KLONDIKE_TABLEAU_SIZE)
+], dtype=np.intp)
+_TABLEAU_TO_FOUNDATION_ACTIONS = np.array([ACTION_INDEX[MoveType.TableauToFoundation, origin, 1, 0]
+                                           for origin in range(KLONDIKE_TABLEAU_SIZE)], dtype=np.intp)
+_FOUNDATION_TO_TABLEAU_START = ACTION_INDEX[MoveType.FoundationToTableau, 0, 1, 0]
+
+
+class KlondikeBatch:
+    """
+    A batch of Klondike games, one row per game in each of these arrays:
+
+    tableau: (games, 7, depth) uint8 card codes, bottom card first, of which each pile's first heights are in play
+    heights: (games, 7) number of cards in each tableau pile
+    concealed: (games, 7) number of concealed cards at the bottom of each tableau pile
+    foundation: (games, 4) number of cards on each suit's foundation pile, in suit order
+    talon: (games, width) uint8 card codes of the waste, bottom card first, followed by the stock, top card first.
+    Dealing moves the boundary rather than the cards, and recycling the waste puts it back at the start.
+    talon_sizes: (games,) number of cards in the waste and stock together
+    waste_sizes: (games,) number of cards in the waste
+    scores: (games,) score of each game
+    deal_numbers: (games,) uint64 deal number of each game, which is 0 for positions without one
+
+    As in any game played by the rules, the revealed cards of each tableau pile must form a build.
+    """
+
+    def __init__(self, count: int, depth: int = KLONDIKE_TABLEAU_SIZE - 1 + MAX_RUN,
+                 width: int = JOKER_CODE - len(klondike_deal_order())):
+        """
+        Allocate a batch of empty games.  Use from_deals(), from_packed() or from_games() to start with cards.
+        :param count: The number of games
+        :param depth: The most cards any tableau pile may hold
+        :param width: The most cards the waste and stock may hold together
+        """
+        self.tableau = np.zeros((count, KLONDIKE_TABLEAU_SIZE, depth), dtype=np.uint8)
+        self.heights = np.zeros((count, KLONDIKE_TABLEAU_SIZE), dtype=np.int16)
+        self.concealed = np.zeros((count, KLONDIKE_TABLEAU_SIZE), dtype=np.int16)
+        self.foundation = np.zeros((count, len(SUITS)), dtype=np.int16)
+        self.talon = np.zeros((count, width), dtype=np.uint8)
+        self.talon_sizes = np.zeros(count, dtype=np.int16)
+        self.waste_sizes = np.zeros(count, dtype=np.int16)
+        self.scores = np.zeros(count, dtype=np.int32)
+        self.deal_numbers = np.zeros(count, dtype=np.uint64)
+
+    @classmethod
+    def from_deals(cls, deal_numbers: Sequence[int]) -> 'KlondikeBatch':
+        """
+        :param deal_numbers: The deal numbers, as for KlondikeGame(deal_number=...)
+        :return: A batch starting each deal
+        """
+        batch = cls(len(deal_numbers))
+        batch.reset(deal_numbers)
+        return batch
+
+    @classmethod
+    def from_packed(cls, positions: Sequence[Tuple], deal_numbers: Sequence[int] = None) -> 'KlondikeBatch':
+        """
+        :param positions: Positions packed by KlondikeGame.pack(), with 7 tableau piles whose revealed cards form builds
+        :param deal_numbers: The deal number of each position, if they're known, or 0s
+        :return: A batch starting from each position
+        """
+        if any(len(tableau) != KLONDIKE_TABLEAU_SIZE for _, _, _, _, tableau in positions):
+            raise ValueError('Batched games must have {} tableau piles.'.format(KLONDIKE_TABLEAU_SIZE))
+        depth = max((max(len(pile) - 1, pile[0] + MAX_RUN) for position in positions for pile in position[4]),
+                    default=1)
+        width = max((len(stock) + len(waste) for _, stock, waste, _, _ in positions), default=1)
+        batch = cls(len(positions), depth, max(width, 1))
+        for game_num, (score, stock, waste, foundation, tableau) in enumerate(positions):
+            batch.scores[game_num] = score
+            batch.talon_sizes[game_num] = len(waste) + len(stock)
+            batch.waste_sizes[game_num] = len(waste)
+            batch.talon[game_num, :len(waste) + len(stock)] = np.frombuffer(waste + stock, dtype=np.uint8)
+            batch.foundation[game_num] = [len(pile) for pile in foundation]
+            for pile_num, pile in enumerate(tableau):
+                revealed = pile[pile[0] + 1:]
+                if any(upper not in TABLEAU_BUILDS[lower] for lower, upper in zip(revealed, revealed[1:])):
+                    raise ValueError('The revealed cards of tableau pile {} must form a build.'.format(pile_num))
+                batch.heights[game_num, pile_num] = len(pile) - 1
+                batch.concealed[game_num, pile_num] = pile[0]
+                batch.tableau[game_num, pile_num, :len(pile) - 1] = np.frombuffer(pile[1:], dtype=np.uint8)
+        if deal_numbers is not None:
+            batch.deal_numbers[:] = deal_numbers
+        return batch
+
+    @classmethod
+    def from_games(cls, games: Iterable[KlondikeGame]) -> 'KlondikeBatch':
+        """
+        :param games: The games to copy.  Their undo logs aren't included.
+        :return: A batch starting from each game's position
+        """
+        games = list(games)
+        return cls.from_packed([game.pack() for game in games], [game.deal_number or 0 for game in games])
+
+    def reset(self, deal_numbers: Sequence[int], game_nums: Sequence[int] = None) -> NoReturn:
+        """
+        Start new deals in place, as KlondikeGame.reset() does, such as for the games of a batch that have finished.
+        :param deal_numbers: The deal numbers, one per game to reset
+        :param game_nums: The games to reset, or None for every game
+        """
+        game_nums = np.arange(len(self)) if game_nums is None else np.asarray(game_nums, dtype=np.intp)
+        deal_numbers = np.asarray(deal_numbers, dtype=np.uint64)
+        tableau, stock = klondike_layouts(deal_decks(deal_numbers))
+        for pile_num in range(KLONDIKE_TABLEAU_SIZE):
+            first = pile_num * (pile_num + 1) // 2
+            self.tableau[game_nums, pile_num, :pile_num + 1] = tableau[:, first:first + pile_num + 1]
+            self.heights[game_nums, pile_num] = pile_num + 1
+            self.concealed[game_nums, pile_num] = pile_num
+        self.talon[game_nums, :stock.shape[1]] = stock
+        self.talon_sizes[game_nums] = stock.shape[1]
+        self.waste_sizes[game_nums] = 0
+        self.foundation[game_nums] = 0
+        self.scores[game_nums] = 0
+        self.deal_numbers[game_nums] = deal_numbers
+
+    def __len__(self):
+        return len(self.scores)
+
+    def pack(self, game_num: int) -> Tuple:
+        """
+        :param game_num: The game to pack
+        :return: The game's position as packed by KlondikeGame.pack()
+        """
+        talon = self.talon[game_num, :self.talon_sizes[game_num]].tobytes()
+        waste_size = self.waste_sizes[game_num]
+        foundation = tuple(
+            bytes(range(suit_num * NUM_RANKS, suit_num * NUM_RANKS + num_cards))
+            for suit_num, num_cards in enumerate(self.foundation[game_num].tolist())
+        )
+        tableau = tuple(
+            bytes([num_concealed]) + pile[:height].tobytes()
+            for pile, height, num_concealed in zip(self.tableau[game_num], self.heights[game_num].tolist(),
+                                                   self.concealed[game_num].tolist())
+        )
+        return int(self.scores[game_num]), talon[waste_size:], talon[:waste_size], foundation, tableau
+
+    def to_game(self, game_num: int) -> KlondikeGame:
+        """
+        :param game_num: The game to copy
+        :return: A new KlondikeGame at the game's position, with an empty undo log
+        """
+        game = KlondikeGame(packed=self.pack(game_num))
+        game.deal_number = int(self.deal_numbers[game_num])
+        game.stock.is_shuffled = True  # Klondike stocks are always what's left of a shuffled deck
+        return game
+
+    def is_solved(self) -> np.ndarray:
+        """
+        :return: A (games,) bool array of whether each game is solved
+        """
+        return (self.foundation == NUM_RANKS).all(axis=1)
+
+    def legal_masks(self) -> np.ndarray:
+        """
+        Finds every game's legal moves, by the same rules as KlondikeGame.legal_moves().
+        :return: A (games, NUM_ACTIONS) bool array of whether each action is legal in each game
+        """
+        count = len(self)
+        game_nums = np.arange(count)
+        heights = self.heights
+        run_lengths = heights - self.concealed
+        masks = np.zeros((count, NUM_ACTIONS), dtype=bool)
+
+        # The rank and color of each pile's top card, and those of the cards the pile wants
+        tops = self.tableau[game_nums[:, np.newaxis], np.arange(KLONDIKE_TABLEAU_SIZE), np.maximum(heights - 1, 0)]
+        top_ranks = _CARD_RANKS[tops]
+        top_colors = _CARD_COLORS[tops]
+        wanted_ranks = np.where(heights == 0, NUM_RANKS - 1, np.where(run_lengths > 0, top_ranks - 1, _NO_RANK))
+        wanted_colors = np.where(heights == 0, _ANY_COLOR, 1 - top_colors)
+
+        def fits(codes: np.ndarray) -> np.ndarray:
+            """Whether each of a (games, cards) array of cards fits on each pile, as a (games, cards, piles) array"""
+            colors = _CARD_COLORS[codes][:, :, np.newaxis]
+            return (_CARD_RANKS[codes][:, :, np.newaxis] == wanted_ranks[:, np.newaxis, :]) & \
+                ((wanted_colors[:, np.newaxis, :] == colors) | (wanted_colors[:, np.newaxis, :] == _ANY_COLOR))
+
+        has_waste = self.waste_sizes > 0
+        waste_tops = self.talon[game_nums, np.maximum(self.waste_sizes - 1, 0)]
+        masks[:, 0] = has_waste & (self.foundation[game_nums, _CARD_SUITS[waste_tops]] == _CARD_RANKS[waste_tops])
+        masks[:, 1:1 + KLONDIKE_TABLEAU_SIZE] = has_waste[:, np.newaxis] & fits(waste_tops[:, np.newaxis])[:, 0]
+
+        masks[:, _TABLEAU_TO_FOUNDATION_ACTIONS] = (run_lengths > 0) & (
+                self.foundation[game_nums[:, np.newaxis], _CARD_SUITS[tops]] == top_ranks)
+
+        # The revealed cards of a pile always form a build, so the only card of an origin pile that can fit on a
+        # destination pile is the one of the wanted rank, which is num_cards - 1 ranks above the origin's top card,
+        # and whose color alternates with each rank.
+        num_cards = wanted_ranks[:, np.newaxis, :] - top_ranks[:, :, np.newaxis] + 1
+        colors = top_colors[:, :, np.newaxis] ^ ((num_cards - 1) & 1)
+        tableau_to_tableau = (num_cards >= 1) & (num_cards <= run_lengths[:, :, np.newaxis]) & (
+                (wanted_colors[:, np.newaxis, :] == colors) | (wanted_colors[:, np.newaxis, :] == _ANY_COLOR))
+        moves, origins, destinations = np.nonzero(tableau_to_tableau)
+        actions = _TABLEAU_ACTIONS[origins, num_cards[moves, origins, destinations] - 1, destinations]
+        masks[moves[actions >= 0], actions[actions >= 0]] = True
+
+        foundation_codes = np.arange(len(SUITS)) * NUM_RANKS + np.maximum(self.foundation - 1, 0)
+        foundation_to_tableau = (self.foundation > 0)[:, :, np.newaxis] & fits(foundation_codes)
+        masks[:, _FOUNDATION_TO_TABLEAU_START:_FOUNDATION_TO_TABLEAU_START + foundation_to_tableau[0].size] = \
+            foundation_to_tableau.reshape(count, -1)
+
+        masks[:, -1] = self.talon_sizes > 0
+        return masks
+
+    def apply(self, actions: np.ndarray, masks: np.ndarray = None) -> NoReturn:
+        """
+        Make one move in each game, by the same rules as KlondikeGame.apply().  Every game's move is checked before any
+        game changes.
+        :param actions: A (games,) array of action numbers, of which negative ones leave their game unchanged, such as
+        for games that have finished
+        :param masks: The games' legal_masks(), if they're already known, to save finding them again
+        """
+        actions = np.asarray(actions, dtype=np.intp)
+        game_nums = np.flatnonzero(actions >= 0)
+        actions = actions[game_nums]
+        if masks is None:
+            masks = self.legal_masks()
+        illegal = ~masks[game_nums, actions]
+        if illegal.any():
+            raise IllegalMoveException('Illegal actions {} in games {}'.format(actions[illegal].tolist(),
+                                                                              game_nums[illegal].tolist()))
+
+        kinds = _ACTION_KINDS[actions]
+        origins = _ACTION_ORIGINS[actions]
+        counts = _ACTION_COUNTS[actions]
+        destinations = _ACTION_DESTINATIONS[actions]
+        self.scores[game_nums] += _ACTION_POINTS[actions]
+
+        # Take the cards from their origins, keeping them as a (moves, MAX_RUN) array, bottom card first
+        cards = np.zeros((len(game_nums), MAX_RUN), dtype=np.uint8)
+
+        from_waste = np.flatnonzero((kinds == MoveType.WasteToFoundation.value) |
+                                    (kinds == MoveType.WasteToTableau.value))
+        if len(from_waste):
+            waste_game_nums = game_nums[from_waste]
+            tops = self.waste_sizes[waste_game_nums] - 1
+            cards[from_waste, 0] = self.talon[waste_game_nums, tops]
+            # Close the gap, shifting the stock down over the card
+            columns = np.arange(self.talon.shape[1])
+            sources = np.minimum(columns + (columns >= tops[:, np.newaxis]), self.talon.shape[1] - 1)
+            self.talon[waste_game_nums] = np.take_along_axis(self.talon[waste_game_nums], sources, axis=1)
+            self.talon_sizes[waste_game_nums] -= 1
+            self.waste_sizes[waste_game_nums] -= 1
+
+        from_tableau = np.flatnonzero((kinds == MoveType.TableauToFoundation.value) |
+                                      (kinds == MoveType.TableauToTableau.value))
+        if len(from_tableau):
+            tableau_game_nums = game_nums[from_tableau]
+            pile_nums = origins[from_tableau]
+            heights = self.heights[tableau_game_nums, pile_nums] - counts[from_tableau]
+            positions = np.minimum(heights[:, np.newaxis] + np.arange(MAX_RUN), self.tableau.shape[2] - 1)
+            cards[from_tableau] = self.tableau[tableau_game_nums[:, np.newaxis], pile_nums[:, np.newaxis], positions]
+            self.heights[tableau_game_nums, pile_nums] = heights
+            # Reveal the card beneath, as Tableau.get() does
+            num_concealed = self.concealed[tableau_game_nums, pile_nums]
+            self.concealed[tableau_game_nums, pile_nums] = num_concealed - ((heights == num_concealed) &
+                                                                            (num_concealed > 0))
+
+        from_foundation = np.flatnonzero(kinds == MoveType.FoundationToTableau.value)
+        if len(from_foundation):
+            foundation_game_nums = game_nums[from_foundation]
+            suit_nums = origins[from_foundation]
+            self.foundation[foundation_game_nums, suit_nums] -= 1
+            cards[from_foundation, 0] = suit_nums * NUM_RANKS + self.foundation[foundation_game_nums, suit_nums]
+
+        # Put them on their destinations
+        to_foundation = np.flatnonzero((kinds == MoveType.WasteToFoundation.value) |
+                                       (kinds == MoveType.TableauToFoundation.value))
+        if len(to_foundation):
+            self.foundation[game_nums[to_foundation], _CARD_SUITS[cards[to_foundation, 0]]] += 1
+
+        to_tableau = np.flatnonzero((kinds == MoveType.WasteToTableau.value) |
+                                    (kinds == MoveType.TableauToTableau.value) |
+                                    (kinds == MoveType.FoundationToTableau.value))
+        if len(to_tableau):
+            tableau_game_nums = game_nums[to_tableau]
+            pile_nums = destinations[to_tableau]
+            heights = self.heights[tableau_game_nums, pile_nums]
+            moves, card_nums = np.nonzero(np.arange(MAX_RUN) < counts[to_tableau, np.newaxis])
+            self.tableau[tableau_game_nums[moves], pile_nums[moves], heights[moves] + card_nums] = \
+                cards[to_tableau[moves], card_nums]
+            self.heights[tableau_game_nums, pile_nums] = heights + counts[to_tableau]
+
+        # Deal, recycling the waste first if the stock is empty, as KlondikeGame.deal() does
+        deal_game_nums = game_nums[kinds == MoveType.Deal.value]
+        if len(deal_game_nums):
+            waste_sizes = self.waste_sizes[deal_game_nums]
+            self.waste_sizes[deal_game_nums] = np.where(waste_sizes == self.talon_sizes[deal_game_nums], 1,
+                                                        waste_sizes + 1)
+
+    def to_move(self, game_num: int, action: int) -> Move:
+        """
+        :param game_num: The game the action is for, since tableau moves are numbered by card in KlondikeGame
+        :param action: The action number
+        :return: The equivalent move, for KlondikeGame.apply()
+        """
+        return action_to_move(action, self.heights[game_num].tolist())
+
+    def from_move(self, game_num: int, move: Move) -> int:
+        """
+        :param game_num: The game the move is for
+        :param move: A move, such as one from KlondikeGame.legal_moves()
+        :return: The equivalent action number
+        """
+        return move_to_action(move, self.heights[game_num].tolist())
+
+
+def action_to_move(action: int, heights: Sequence[int]) -> Move:
+    """
+    :param action: The action number
+    :param heights: The number of cards in each tableau pile, since tableau moves are numbered by card in KlondikeGame
+    :return: The equivalent move, for KlondikeGame.apply()
+    """
+    kind, origin, num_cards, destination = ACTIONS[action]
+    if kind in (MoveType.Deal, MoveType.WasteToFoundation):
+        return Move(kind)
+    if kind == MoveType.WasteToTableau:
+        return Move(kind, destination=destination)
+    if kind == MoveType.FoundationToTableau:
+        return Move(kind, SUITS[origin], destination=destination)
+    return Move(kind, origin, heights[origin] - num_cards, destination if kind == MoveType.TableauToTableau else None)
+
+
+def move_to_action(move: Move, heights: Sequence[int]) -> int:
+    """
+    :param move: A move, such as one from KlondikeGame.legal_moves()
+    :param heights: The number of cards in each tableau pile
+    :return: The equivalent action number
+    """
+    kind = move.kind
+    if kind == MoveType.Deal:
+        action = (kind, 0, 0, 0)
+    elif kind == MoveType.WasteToFoundation:
+        action = (kind, 0, 1, 0)
+    elif kind == MoveType.WasteToTableau:
+        action = (kind, 0, 1, move.destination)
+    elif kind == MoveType.FoundationToTableau:
+        action = (kind, SUITS.index(move.origin), 1, move.destination)
+    else:
+        height = heights[move.origin]
+        card_num = move.card_num + height if move.card_num < 0 else move.card_num
+        action = (kind, move.origin % KLONDIKE_TABLEAU_SIZE, height - card_num,
+                  move.destination if kind == MoveType.TableauToTableau else 0)
+    if action not in ACTION_INDEX:
+        raise IllegalMoveException('No action for {}'.format(move))
+    return ACTION_INDEX[action]
+
+
+def random_actions(masks: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Choose a legal action uniformly for each game.
+    :param masks: A (games, NUM_ACTIONS) bool array from KlondikeBatch.legal_masks()
+    :param rng: The random number generator
+    :return: A (games,) array of action numbers, which is -1 for games without legal moves
+    """
+    legal = np.flatnonzero(masks)
+    num_legal = np.bincount(legal // masks.shape[1], minlength=len(masks))
+    choices = np.cumsum(num_legal) - num_legal + (rng.random(len(masks)) * num_legal).astype(np.intp)
+    if not len(legal):
+        return np.full(len(masks), -1, dtype=np.intp)
+    return np.where(num_legal > 0, legal[np.minimum(choices, len(legal) - 1)] % masks.shape[1], -1)
@@ -0,0 +1,208 @@
+"""
+A gym-style environment around KlondikeGame, for training agents one game at a time.  Actions are the fixed, discrete
+action numbers of pytience.games.solitaire.batch, with a mask of the legal ones, and observations are a fixed-size
+uint8 array that's allocated once and updated in place, pile by pile, as moves change the game.
+
+NumPy is an optional dependency: pip install pytience[batch]
+"""
+from typing import Dict, List, NoReturn, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    raise ImportError('pytience.games.solitaire.env requires NumPy: pip install pytience[batch]') from None
+
+from pytience.cards.batch import KLONDIKE_TABLEAU_SIZE, klondike_deal_order
+from pytience.cards.deck import JOKER_CODE, SUITS
+from pytience.games.solitaire.batch import ACTION_INDEX, MAX_RUN, NUM_ACTIONS, action_to_move
+from pytience.games.solitaire.exception import IllegalMoveException
+from pytience.games.solitaire.klondike import KlondikeGame, MoveType
+from pytience.games.solitaire.simulation import DEFAULT_MAX_MOVES
+
+# Observation values for a face down card and for a slot without a card.  Face up cards are their codes.
+CONCEALED_CARD = JOKER_CODE
+NO_CARD = JOKER_CODE + 1
+
+# The observation is the tableau, pile by pile and bottom card first, then the waste, bottom card first, then the
+# number of cards on each suit's foundation pile, in suit order, and finally the number of cards in the stock and in
+# the waste.  Stock cards are face down, so only their number is observed.
+TABLEAU_DEPTH = KLONDIKE_TABLEAU_SIZE - 1 + MAX_RUN
+WASTE_SIZE = JOKER_CODE - len(klondike_deal_order())
+TABLEAU_START = 0
+WASTE_START = TABLEAU_START + KLONDIKE_TABLEAU_SIZE * TABLEAU_DEPTH
+FOUNDATION_START = WASTE_START + WASTE_SIZE
+STOCK_SIZE_INDEX = FOUNDATION_START + len(SUITS)
+WASTE_SIZE_INDEX = STOCK_SIZE_INDEX + 1
+OBSERVATION_SIZE = WASTE_SIZE_INDEX + 1
+
+# The action number of each move, so the action mask can be filled without making Move objects.  Tableau to tableau
+# actions are by [origin][num_cards - 1][destination], and foundation to tableau actions by [suit_num][destination].
+_WASTE_TO_FOUNDATION_ACTION = ACTION_INDEX[MoveType.WasteToFoundation, 0, 1, 0]
+_WASTE_TO_TABLEAU_ACTIONS = [ACTION_INDEX[MoveType.WasteToTableau, 0, 1, destination]
+                             for destination in range(KLONDIKE_TABLEAU_SIZE)]
+_TABLEAU_TO_FOUNDATION_ACTIONS = [ACTION_INDEX[MoveType.TableauToFoundation, origin, 1, 0]
+                                  for origin in range(KLONDIKE_TABLEAU_SIZE)]
+_TABLEAU_TO_TABLEAU_ACTIONS = [[[
+    ACTION_INDEX.get((MoveType.TableauToTableau, origin, num_cards, destination))
+    for destination in range(KLONDIKE_TABLEAU_SIZE)] for num_cards in range(1, MAX_RUN + 1)]
+    for origin in range(KLONDIKE_TABLEAU_SIZE)]
+_FOUNDATION_TO_TABLEAU_ACTIONS = [[ACTION_INDEX[MoveType.FoundationToTableau, suit_num, 1, destination]
+                                   for destination in range(KLONDIKE_TABLEAU_SIZE)] for suit_num in range(len(SUITS))]
+_DEAL_ACTION = ACTION_INDEX[MoveType.Deal, 0, 0, 0]
+
+
+class KlondikeEnv:
+    """
+    Plays one Klondike game at a time.  reset() starts a deal and step() makes one move, each returning the
+    observation, which is the same array every time, and an info dict whose "action_mask" is likewise the same bool
+    array every time.  The reward for a move is the points it scores.  A game terminates when it's won or there are no
+    legal moves, and is truncated after max_steps moves.
+    """
+
+    def __init__(self, max_steps: int = DEFAULT_MAX_MOVES):
+        """
+        :param max_steps: The most moves in a game
+        """
+        self.max_steps = max_steps
+        self.game: KlondikeGame = None
+        self.num_steps = 0
+        self.observation = np.full(OBSERVATION_SIZE, NO_CARD, dtype=np.uint8)
+        self.action_mask = np.zeros(NUM_ACTIONS, dtype=bool)
+        self.info: Dict[str, object] = {"action_mask": self.action_mask, "deal_number": None}
+        self._slots = memoryview(self.observation)
+        self._heights: List[int] = [0] * KLONDIKE_TABLEAU_SIZE
+        self._waste_size = 0
+
+    def reset(self, seed: int = None, deal_number: int = None) -> Tuple[np.ndarray, dict]:
+        """
+        Start a new game, reusing the last one's piles.
+        :param seed: Seed the choice of deal, so it can be reproduced
+        :param deal_number: Play this deal, as numbered by deal_permutation()
+        :return: The observation and the info dict
+        """
+        if self.game is None:
+            self.game = KlondikeGame(seed=seed, deal_number=deal_number, max_undo_depth=1)  # moves aren't taken back
+        else:
+            self.game.reset(seed, deal_number)
+        self.num_steps = 0
+        self.observation[TABLEAU_START:WASTE_START] = NO_CARD
+        self._heights[:] = [0] * KLONDIKE_TABLEAU_SIZE
+        for pile_num in range(KLONDIKE_TABLEAU_SIZE):
+            self._observe_tableau(pile_num)
+        self._observe_waste()
+        self._observe_foundation()
+        self._observe_legal_moves()
+        self.info["deal_number"] = self.game.deal_number
+        return self.observation, self.info
+
+    def step(self, action: int) -> Tuple[np.ndarray, int, bool, bool, dict]:
+        """
+        Make a move, raising IllegalMoveException if the action isn't legal.
+        :param action: The action number
+        :return: The observation, the reward, whether the game terminated, whether it was truncated, and the info dict
+        """
+        if not self.action_mask[action]:
+            raise IllegalMoveException('Illegal action: {}'.format(action))
+        game = self.game
+        move = action_to_move(action, self._heights)
+        score = game.score
+        game.apply(move)
+        self.num_steps += 1
+
+        kind = move.kind
+        if kind in (MoveType.TableauToFoundation, MoveType.TableauToTableau):
+            self._observe_tableau(move.origin)
+        if move.destination is not None:
+            self._observe_tableau(move.destination)
+        if kind in (MoveType.Deal, MoveType.WasteToFoundation, MoveType.WasteToTableau):
+            self._observe_waste()
+        if kind not in (MoveType.Deal, MoveType.WasteToTableau, MoveType.TableauToTableau):
+            self._observe_foundation()
+        self._observe_legal_moves()
+
+        terminated = game.is_solved() or not self.action_mask.any()
+        truncated = not terminated and self.num_steps >= self.max_steps
+        return self.observation, game.score - score, terminated, truncated, self.info
+
+    def _observe_tableau(self, pile_num: int) -> NoReturn:
+        """
+        Update the observation of a tableau pile from the card below its old or new top card, whichever is lower, since
+        that card may have been revealed.
+        Intended for internal use only.
+        """
+        pile = self.game.tableau[pile_num]
+        slots = self._slots
+        start = TABLEAU_START + pile_num * TABLEAU_DEPTH
+        old_height = self._heights[pile_num]
+        for card_num in range(max(min(old_height, len(pile)) - 1, 0), len(pile)):
+            card = pile[card_num]
+            slots[start + card_num] = card.code if card.is_revealed else CONCEALED_CARD
+        for card_num in range(len(pile), old_height):
+            slots[start + card_num] = NO_CARD
+        self._heights[pile_num] = len(pile)
+
+    def _observe_waste(self) -> NoReturn:
+        """
+        Update the observation of the waste, and the number of cards in the stock and the waste.
+        Intended for internal use only.
+        """
+        waste = self.game.waste
+        slots = self._slots
+        for card_num in range(len(waste)):
+            slots[WASTE_START + card_num] = waste[card_num].code
+        for card_num in range(len(waste), self._waste_size):
+            slots[WASTE_START + card_num] = NO_CARD
+        self._waste_size = len(waste)
+        slots[STOCK_SIZE_INDEX] = self.game.stock.remaining
+        slots[WASTE_SIZE_INDEX] = len(waste)
+
+    def _observe_foundation(self) -> NoReturn:
+        """
+        Update the observation of the number of cards on each foundation pile.
+        Intended for internal use only.
+        """
+        foundation = self.game.foundation
+        for suit_num, suit in enumerate(foundation):
+            self._slots[FOUNDATION_START + suit_num] = len(foundation[suit])
+
+    def _observe_legal_moves(self) -> NoReturn:
+        """
+        Update the action mask with the moves KlondikeGame.legal_moves() would list, looking each card up in the
+        tableau's destination index rather than making a Move for each.
+        Intended for internal use only.
+        """
+        action_mask = self.action_mask
+        action_mask[:] = False
+        game = self.game
+        foundation = game.foundation
+        fits = game.tableau.destination_index
+
+        if game.waste:
+            card = game.waste[-1]
+            if foundation.can_put(card):
+                action_mask[_WASTE_TO_FOUNDATION_ACTION] = True
+            for destination in fits.get(card.code, ()):
+                action_mask[_WASTE_TO_TABLEAU_ACTIONS[destination]] = True
+
+        for pile_num, pile in enumerate(game.tableau):
+            card_num = len(pile) - 1
+            if card_num < 0 or not pile[card_num].is_revealed:
+                continue
+            if foundation.can_put(pile[card_num]):
+                action_mask[_TABLEAU_TO_FOUNDATION_ACTIONS[pile_num]] = True
+            actions = _TABLEAU_TO_TABLEAU_ACTIONS[pile_num]
+            while card_num >= 0 and pile[card_num].is_revealed:
+                run_actions = actions[len(pile) - card_num - 1]
+                for destination in fits.get(pile[card_num].code, ()):
+                    if destination != pile_num:
+                        action_mask[run_actions[destination]] = True
+                card_num -= 1
+
+        for suit_num, suit in enumerate(foundation):
+            if foundation.can_get(suit):
+                actions = _FOUNDATION_TO_TABLEAU_ACTIONS[suit_num]
+                for destination in fits.get(foundation[suit][-1].code, ()):
+                    action_mask[actions[destination]] = True
+
+        if game.stock.remaining or game.waste:
+            action_mask[_DEAL_ACTION] = True
@@ -1,64 +1,232 @@
 from enum import Enum
-from typing import Dict, List, Iterable, Union, Type, NoReturn
+from typing import Dict, List, Iterable, Iterator, Optional, Union, Type, NoReturn, Tuple
 
-from pytience.cards.deck import Suit, Card, Pip
+from pytience.cards.deck import SUITS, Suit, Card, pack_cards, unpack_cards, encode_cards, decode_cards, \
+    zobrist_keys
 from pytience.cards.exception import NoCardsRemainingException
-from pytience.games.solitaire import CARD_VALUES
+from pytience.games.solitaire import SUIT_ACE_CODES, FOUNDATION_SUCCESSORS, UndoOp
 from pytience.games.solitaire.exception import ConcealedCardNotAllowedException, NoSuchSuitException, \
     IllegalFoundationBuildOrderException
-from pytience.games.util import Undoable, UndoAction
+from pytience.games.util import Undoable
 
 
 class Foundation(Undoable):
+    UNDO_HANDLERS = {UndoOp.FoundationGet: ('undo_get', 'redo_get'), UndoOp.FoundationPut: ('undo_put', 'redo_put')}
 
-    def __init__(self, suits: Union[Type[Enum], Iterable] = Suit, foundation_dump: object = None):
+    def __init__(self, suits: Union[Type[Enum], Iterable] = Suit, foundation_dump: object = None,
+                 packed: Tuple[bytes] = None):
+        super().__init__()
+        self._state_hash = 0
+        self._suits: List[Suit] = []
+        self._wanted: Dict[Suit, Optional[int]] = {}
         if foundation_dump:
             self.load(foundation_dump)
         else:
-            self.piles: Dict[Suit, List[Card]] = {suit: [] for suit in suits}
-            super().__init__()
+            self.piles = {suit: [] for suit in suits}
+            if packed:
+                self.unpack(packed)
 
-    def undo_get(self, card: str):
-        _card = Card.parse_card(card)
-        pile = self.piles.get(_card.suit)
-        pile.append(_card)
+    @property
+    def piles(self) -> Dict[Suit, List[Card]]:
+        """
+        The piles for each suit, bottom card first.  Since the piles may be changed directly through this property, the
+        hash and the index of wanted cards are rebuilt the next time they're needed.  Use indexing by suit or
+        iteration over the suits on the foundation itself for read-only access.
+        """
+        for suit in list(self._shared_suits):
+            self._own(suit)
+        self._is_stale = True
+        return self._piles
 
-    def get(self, suit: Suit) -> Card:
-        if suit not in self.piles:
+    @piles.setter
+    def piles(self, piles: Dict[Suit, List[Card]]):
+        self._piles = piles
+        self._shared_suits = set()
+        self._is_stale = True
+
+    def _own(self, suit: Suit) -> List[Card]:
+        """
+        Get a suit's pile to change, first copying it if it's shared with a clone.
+        Intended for internal use only.
+        :param suit: The suit of the pile
+        :return: The pile
+        """
+        pile = self._piles[suit]
+        if suit in self._shared_suits:
+            pile = self._piles[suit] = pile.copy()
+            self._shared_suits.discard(suit)
+        return pile
+
+    def _copy(self) -> 'Foundation':
+        """
+        Copies the piles for clone().  The pile lists themselves are shared, and copied by whichever foundation changes
+        one first.
+        Intended for internal use only.
+        """
+        self._refresh()
+        # pylint: disable=protected-access
+        clone = object.__new__(type(self))
+        clone._piles = self._piles.copy()
+        clone._shared_suits = set(self._piles)
+        self._shared_suits = set(self._piles)
+        clone._is_stale = False
+        clone._state_hash = self._state_hash
+        clone._suits = self._suits
+        clone._wanted = self._wanted.copy()
+        return clone
+
+    def undo_get(self, suit_num: int, *_):
+        """Return the card on top of the undo log's hand to its pile"""
+        self._refresh()
+        card = self.undo_log.hand.pop()
+        pile = self._own(self._suits[suit_num])
+        self._state_hash ^= zobrist_keys('foundation').key(len(pile), card.code)
+        pile.append(card)
+        self._index(card.suit)
+
+    def redo_get(self, suit_num: int, *_):
+        self._refresh()
+        suit = self._suits[suit_num]
+        pile = self._own(suit)
+        card = pile.pop()
+        self._state_hash ^= zobrist_keys('foundation').key(len(pile), card.code)
+        self._index(suit)
+        self.undo_log.hand.append(card)
+
+    def can_get(self, suit: Suit) -> bool:
+        """Checks whether get() would succeed, without changing anything"""
+        return bool(self._piles.get(suit))
+
+    def peek(self, suit: Suit) -> Card:
+        """Returns the card that get() would take, raising the same exceptions, without removing it"""
+        if suit not in self._piles:
             raise NoSuchSuitException('No such suit.')
-        pile = self.piles.get(suit)
+        pile = self._piles.get(suit)
         if not pile:
             raise NoCardsRemainingException('No foundation cards for suit {}'.format(suit))
+        return pile[-1]
 
+    def get(self, suit: Suit) -> Card:
+        self.peek(suit)
+        self._refresh()
+        pile = self._own(suit)
         card = pile.pop()
-        self.undo_stack.append(UndoAction(self.undo_get, [str(card)]))
+        self._state_hash ^= zobrist_keys('foundation').key(len(pile), card.code)
+        self._index(suit)
+        self.undo_log.hand.append(card)
+        self.undo_log.push(UndoOp.FoundationGet, self._suits.index(suit), 1)
         return card
 
-    def undo_put(self, suit: str):
-        _suit = Suit(suit)
-        pile = self.piles.get(_suit)
-        pile.pop()
+    def undo_put(self, suit_num: int, _: int = 1, to_hand: int = 0):
+        """
+        :param to_hand: Move the card back into the undo log's hand, which it came from, rather than its discards
+        """
+        self._refresh()
+        suit = self._suits[suit_num]
+        pile = self._own(suit)
+        card = pile.pop()
+        self._state_hash ^= zobrist_keys('foundation').key(len(pile), card.code)
+        self._index(suit)
+        (self.undo_log.hand if to_hand else self.undo_log.discards).append(card)
+
+    def redo_put(self, suit_num: int, _: int, from_hand: int):
+        self._refresh()
+        card = (self.undo_log.hand if from_hand else self.undo_log.discards).pop()
+        suit = self._suits[suit_num]
+        pile = self._own(suit)
+        self._state_hash ^= zobrist_keys('foundation').key(len(pile), card.code)
+        pile.append(card)
+        self._index(suit)
+
+    def can_put(self, card: Card) -> bool:
+        """
+        Checks whether put() would accept the card, without changing anything.
+        :param card: The card to build on its suit's pile
+        :return: True if the card is the next one in its suit
+        """
+        self._refresh()
+        return card.is_revealed and self._wanted.get(card.suit) == card.code
+
+    def can_put_safely(self, card: Card) -> bool:
+        """
+        Checks whether put() would accept the card, and the card can't be needed in the tableau any more because both
+        cards of the opposite color and one rank lower are already on the foundation.  Aces and twos are always safe.
+        :param card: The card to build on its suit's pile
+        :return: True if the card may be put on the foundation without risk
+        """
+        if not self.can_put(card):
+            return False
+        rank = card.identity.rank
+        return rank <= 2 or all(len(pile) >= rank - 1 for suit, pile in self._piles.items() if suit.color != card.color)
 
     def put(self, card: Card):
         if card.is_concealed:
             raise ConcealedCardNotAllowedException('Foundation cards must be revealed')
-        pile = self.piles[card.suit]
-        if card.pip == Pip.Ace:
-            pile.append(card)
-            self.undo_stack.append(UndoAction(self.undo_put, [str(card.suit)]))
-        elif not pile:
+        if not self.can_put(card):
             raise IllegalFoundationBuildOrderException('Foundation cards must be built sequentially per suit.')
-        else:
-            value = CARD_VALUES[card.pip]
-            top_value = CARD_VALUES[pile[-1].pip]
-            if value != top_value + 1:
-                raise IllegalFoundationBuildOrderException('Foundation cards must be build sequentially per suit.')
-            pile.append(card)
-            self.undo_stack.append(UndoAction(self.undo_put, [str(card.suit)]))
+        from_hand = self.undo_log.holds([card])
+        if from_hand:
+            self.undo_log.hand.pop()
+        pile = self._own(card.suit)
+        self._state_hash ^= zobrist_keys('foundation').key(len(pile), card.code)
+        pile.append(card)
+        self._index(card.suit)
+        self.undo_log.push(UndoOp.FoundationPut, self._suits.index(card.suit), 1, from_hand)
+
+    def clear(self) -> NoReturn:
+        """Empty every pile.  This isn't recorded in the undo log."""
+        self.piles = {suit: [] for suit in self._piles}
 
     @property
     def is_full(self) -> bool:
-        return all(len(pile) == 13 for pile in list(self.piles.values()))
+        return all(len(pile) == 13 for pile in list(self._piles.values()))
+
+    @property
+    def state_hash(self) -> int:
+        """The Zobrist hash of the piles, kept up to date by every put(), get() and undo"""
+        self._refresh()
+        return self._state_hash
+
+    def rehash(self) -> int:
+        """Recompute the hash and the index of wanted cards from scratch"""
+        self._state_hash = 0
+        for pile in self._piles.values():
+            self._state_hash ^= zobrist_keys('foundation').hash(pile)
+        self._suits = list(self._piles)
+        self._wanted = {}
+        for suit in self._piles:
+            self._index(suit)
+        self._is_stale = False
+        return self._state_hash
+
+    def _refresh(self) -> NoReturn:
+        """
+        Rebuild the hash and the index of wanted cards if the piles may have been changed directly.
+        Intended for internal use only.
+        """
+        if self._is_stale:
+            self.rehash()
+
+    def _index(self, suit: Suit) -> NoReturn:
+        """
+        Update the index of wanted cards after a pile changes.  An empty pile wants the Ace of its suit, and any
+        other pile wants the next card of its top card's suit, or nothing once it's complete.
+        Intended for internal use only.
+        :param suit: The suit of the pile that changed
+        """
+        pile = self._piles[suit]
+        if pile:
+            self._wanted[suit] = FOUNDATION_SUCCESSORS[pile[-1].code]
+        else:
+            self._wanted[suit] = SUIT_ACE_CODES.get(suit)
+
+    def __getitem__(self, suit: Suit) -> List[Card]:
+        """Read-only access to a suit's pile, bottom card first.  Change piles through the piles property."""
+        return self._piles[suit]
+
+    def __iter__(self) -> Iterator[Suit]:
+        """The suits of the piles, in order"""
+        return iter(self._piles)
 
     def dump(self) -> object:
         """
@@ -66,7 +234,7 @@ class Foundation(Undoable):
         :return: A JSON-ready object
         """
         return {
-            "piles": {str(suit): list(map(str, pile)) for suit, pile in self.piles.items()},
+            "piles": {str(suit): list(map(str, pile)) for suit, pile in self._piles.items()},
             "undo_stack": self.dump_undo_stack()
         }
 
@@ -81,3 +249,54 @@ class Foundation(Undoable):
         }
         self.load_undo_stack(foundation_dump["undo_stack"])
 
+    def load_legacy_undo_action(self, action: dict) -> NoReturn:
+        self._refresh()
+        if action["action"] == "undo_put":
+            self.undo_log.push(UndoOp.FoundationPut, self._suits.index(Suit(action["args"][0])), 1)
+        elif action["action"] == "undo_get":
+            card = Card.parse_card(action["args"][0])
+            self.undo_log.hand.append(card)
+            self.undo_log.push(UndoOp.FoundationGet, self._suits.index(card.suit), 1)
+        else:
+            super().load_legacy_undo_action(action)
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes the piles compactly, in suit order: each pile is its suit's number in SUITS and its number of cards,
+        one byte each, followed by its cards, bottom card first, as encoded by encode_cards().  The undo log is not
+        included.
+        :return: The encoded piles
+        """
+        return b''.join(bytes([SUITS.index(suit), len(pile)]) + encode_cards(pile)
+                        for suit, pile in self._piles.items())
+
+    def load_bytes(self, foundation_bytes: bytes) -> NoReturn:
+        """
+        Replace the piles with those previously encoded by to_bytes()
+        :param foundation_bytes: The encoded piles
+        """
+        piles = {}
+        position = 0
+        while position < len(foundation_bytes):
+            suit_num, num_cards = foundation_bytes[position:position + 2]
+            piles[SUITS[suit_num]] = decode_cards(foundation_bytes[position + 2:position + 2 + num_cards])
+            position += 2 + num_cards
+        self.piles = piles
+
+    def pack(self) -> Tuple[bytes]:
+        """
+        Packs the piles into one bytes object each, in suit order.  Foundation cards are always revealed.
+        The undo stack is not included.
+        :return: A tuple of packed piles
+        """
+        return tuple(pack_cards(pile) for pile in self._piles.values())
+
+    def unpack(self, packed: Tuple[bytes]) -> NoReturn:
+        """
+        Replace the cards in each suit's pile with those previously packed by pack()
+        :param packed: A tuple of packed piles, in suit order
+        """
+        for suit, pile in zip(list(self._piles), packed):
+            self._piles[suit] = unpack_cards(pile, is_revealed=True)
+            self._shared_suits.discard(suit)
+        self._is_stale = True
@@ -0,0 +1,98 @@
+"""
+An append-only save journal for KlondikeGame, so a game can be saved after every move for the cost of the move rather
+than the whole game.  A journal is a text file whose first line is a snapshot, the game's dump() as JSON, followed by
+one line for each change made since, naming the game method called and its arguments as a JSON list.  Loading replays
+the changes on the snapshot.  Every so often the journal is compacted to a new snapshot, which is written to a
+temporary file and renamed over the journal, so the journal is always either the old one or the new one.
+
+Changes are flushed as they're written.  A change that was only partly written when the program stopped is the last
+line, and it's ignored along with anything after it, so the game is loaded as it was before that change.
+"""
+import json
+import os
+from pathlib import Path
+from typing import IO, NoReturn, Optional, Union
+
+from pytience.cards.deck import Suit
+from pytience.games.solitaire.klondike import KlondikeGame
+
+# The most changes written after a snapshot before the journal is compacted
+DEFAULT_SNAPSHOT_INTERVAL = 100
+
+# The KlondikeGame methods that can be journaled.  Each one must change the game the same way whenever it's called on
+# the same game with the same arguments.
+JOURNALED_ACTIONS = frozenset({'deal', 'undo', 'redo', 'goto', 'select_waste', 'select_foundation', 'select_tableau',
+                               'solve', 'autoplay'})
+
+
+class KlondikeJournal:
+    def __init__(self, filename: Union[str, Path], snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        """
+        :param filename: The journal file
+        :param snapshot_interval: The most changes to write after a snapshot before writing a new one
+        """
+        self.filename = Path(filename)
+        self.snapshot_interval = snapshot_interval
+        self.num_records: Optional[int] = None  # None until this journal has written a snapshot
+        # The journal opened for appending by record(), which is kept open between changes until close()
+        self._file: Optional[IO] = None
+
+    def load(self, max_undo_depth: int = None) -> KlondikeGame:
+        """
+        Load the game from the snapshot, replaying every change that was completely written after it
+        :param max_undo_depth: The most moves that can be undone, as for a new game
+        :return: The game
+        """
+        with open(self.filename, 'r', encoding='utf-8') as f:
+            game = KlondikeGame(game_dump=json.loads(f.readline()), max_undo_depth=max_undo_depth)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # the last change was only partly written
+                try:
+                    action, *args = json.loads(line)
+                    if action not in JOURNALED_ACTIONS:
+                        break
+                    if action == 'select_foundation':
+                        args[0] = Suit(args[0])
+                    getattr(game, action)(*args)
+                except Exception:  # pylint: disable=broad-except
+                    break
+        return game
+
+    def snapshot(self, game: KlondikeGame) -> NoReturn:
+        """
+        Replace the journal with a snapshot of the game.  The snapshot is synced to disk before it replaces the journal.
+        :param game: The game
+        """
+        self.close()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        temporary_filename = self.filename.with_name(self.filename.name + '.tmp')
+        with open(temporary_filename, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(game.dump()) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_filename, self.filename)
+        self.num_records = 0
+
+    def record(self, game: KlondikeGame, action: str, *args) -> NoReturn:
+        """
+        Write a change that was just made to the game.  The first change this journal writes, and every change once
+        snapshot_interval changes have been written since the last snapshot, is written as a new snapshot instead.
+        :param game: The game, after the change
+        :param action: The name of the game method called, one of JOURNALED_ACTIONS
+        :param args: The arguments it was called with
+        """
+        if self.num_records is None or self.num_records >= self.snapshot_interval:
+            self.snapshot(game)
+            return
+        if self._file is None:
+            self._file = open(self.filename, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+        self._file.write(json.dumps([action] + [arg.value if isinstance(arg, Suit) else arg for arg in args]) + '\n')
+        self._file.flush()
+        self.num_records += 1
+
+    def close(self) -> NoReturn:
+        """Close the journal file.  It's reopened by the next change written."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
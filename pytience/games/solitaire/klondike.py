@@ -1,191 +1,522 @@
-from typing import List, NoReturn
+import random
+from enum import Enum
+from struct import Struct
+from typing import List, NoReturn, Optional, Tuple, NamedTuple, Union
 
-from pytience.cards.deck import Deck, Card, Suit
+from pytience.cards.deck import Deck, Card, Suit, pack_cards, unpack_cards, encode_cards, decode_cards, zobrist_keys
+from pytience.games.solitaire import UndoOp
 from pytience.games.solitaire.foundation import Foundation
 from pytience.games.solitaire.tableau import Tableau
-from pytience.games.util import Undoable, UndoAction
+from pytience.games.util import Undoable
 from pytience.games.solitaire.exception import IllegalMoveException, IllegalTableauMoveException, \
-    IllegalFoundationMoveException, TableauPileIndexError
+    IllegalFoundationBuildOrderException, IllegalTableauBuildOrderException, TableauPileIndexError
 from pytience.cards.exception import NoCardsRemainingException
 
 POINTS_WASTE_FOUNDATION = 10
 POINTS_WASTE_TABLEAU = 5
 POINTS_TABLEAU_FOUNDATION = 15
 
+# The binary save format of KlondikeGame.to_bytes(): a header of the magic bytes, the format version, flags, the deal
+# number and the score, followed by the stock, waste, foundation, tableau and undo log, each prefixed by its length
+SAVE_MAGIC = b'PYTK'
+SAVE_VERSION = 1
+SAVE_HAS_DEAL_NUMBER = 0x01
+_SAVE_HEADER = Struct('<4sBBQi')
+_SAVE_SECTION_SIZE = Struct('<I')
+
+
+class MoveType(Enum):
+    WasteToFoundation = 1
+    WasteToTableau = 2
+    TableauToFoundation = 3
+    TableauToTableau = 4
+    FoundationToTableau = 5
+    Deal = 6
+
+
+class Move(NamedTuple):
+    """
+    A single Klondike move.  The origin is a tableau pile number or a foundation suit, the card_num is the index of
+    the first tableau card to move, and the destination is a tableau pile number.  Unused fields are None.
+    """
+    kind: MoveType
+    origin: Union[int, Suit, None] = None
+    card_num: Optional[int] = None
+    destination: Optional[int] = None
+
+    def __str__(self):
+        """The equivalent klondike command"""
+        if self.kind == MoveType.Deal:
+            return 'deal'
+        if self.kind == MoveType.WasteToFoundation:
+            return 'waste'
+        if self.kind == MoveType.WasteToTableau:
+            return 'waste {}'.format(self.destination)
+        if self.kind == MoveType.TableauToFoundation:
+            return 'tableau {} {}'.format(self.origin, self.card_num)
+        if self.kind == MoveType.TableauToTableau:
+            return 'tableau {} {} {}'.format(self.origin, self.card_num, self.destination)
+        suit = self.origin.name[0].lower() if isinstance(self.origin, Suit) else self.origin
+        return 'foundation {} {}'.format(suit, self.destination)
+
 
 class KlondikeGame(Undoable):
-    def __init__(self, game_dump: object = None):
+    UNDO_HANDLERS = {
+        UndoOp.Deal: ('undo_deal', 'redo_deal'),
+        UndoOp.WasteGet: ('undo_waste_get', 'redo_waste_get'),
+        UndoOp.Score: ('undo_score', 'redo_score')
+    }
+
+    def __init__(self, game_dump: object = None, packed: Tuple = None, seed: int = None, deal_number: int = None,
+                 max_undo_depth: int = None, game_bytes: bytes = None):
+        """
+        :param seed: Seed the choice of deal, so it can be reproduced.  Without a seed or a deal number, the deal is
+        chosen with the global random number generator.
+        :param deal_number: Play this deal, as numbered by deal_permutation()
+        :param max_undo_depth: The most moves that can be undone.  Older moves are folded away as new ones are made,
+        so the undo log and the dump stay the same size however long the game runs.  Unlimited by default.
+        :param game_bytes: Load a game previously saved by to_bytes()
+        """
+        super().__init__()
+        self.undo_log.max_depth = max_undo_depth
         if game_dump:
             self.load(game_dump)
+        elif game_bytes:
+            self.load_bytes(game_bytes)
+        elif packed:
+            self.deal_number = None
+            self.unpack(packed)
         else:
-            self.stock: Deck = Deck().shuffle()
-            self.tableau: Tableau = Tableau(7, self.stock)
+            self.stock: Deck = Deck()
+            self.tableau: Tableau = Tableau(7)
             self.waste: List[Card] = []
-            self.score = 0
             self.foundation = Foundation(suits=Suit)
-            super().__init__()
+            self._share_undo_log()
+            self.reset(seed, deal_number)
+
+    def reset(self, seed: int = None, deal_number: int = None) -> NoReturn:
+        """
+        Start a new deal in place, gathering every card back into the stock and reusing the piles and the undo log,
+        which is cleared.  Simulations reset one game for each deal rather than creating a new one.
+        :param seed: Seed the choice of deal, as for a new game
+        :param deal_number: Play this deal, as numbered by deal_permutation()
+        """
+        if deal_number is None:
+            deal_number = (random if seed is None else random.Random(seed)).getrandbits(64)
+        cards = [card.concealed() for card in self.waste]
+        for pile in self.tableau:
+            cards.extend(card.concealed() for card in pile)
+        for suit in self.foundation:
+            cards.extend(card.concealed() for card in self.foundation[suit])
+        self.stock.replenish(cards)
+        self.stock.shuffle(deal_number)
+        self.tableau.deal(self.stock)
+        self.foundation.clear()
+        self.waste.clear()
+        self._waste_hash = 0
+        self.score = 0
+        self.deal_number = deal_number
+        self.undo_log.clear()
+
+    def _share_undo_log(self) -> NoReturn:
+        """
+        Have the tableau and foundation record their changes in the game's undo log, so that each move is undone as a
+        single step.  Intended for internal use only.
+        """
+        self.tableau.join_undo_log(self.undo_log)
+        self.foundation.join_undo_log(self.undo_log)
+
+    def clone(self, with_undo_log: bool = True) -> 'KlondikeGame':
+        """
+        Copies the game for searches, rollouts and hints, without dumping or deep copying it.  Cards are shared, piles
+        are shared until either game changes them, and the hashes are copied rather than recomputed.
+        :param with_undo_log: Copy the undo log, so the copy can undo and redo the same moves.  Otherwise the copy
+        starts with an empty log, which is cheaper.
+        :return: The new game
+        """
+        clone = super().clone(with_undo_log)
+        clone._share_undo_log()  # pylint: disable=protected-access
+        return clone
 
-    def undo_deal(self, undo_replenish: bool):
-        self.stock.undeal(self.waste.pop().conceal())
+    def _copy(self) -> 'KlondikeGame':
+        # pylint: disable=protected-access
+        clone = object.__new__(type(self))
+        clone.deal_number = self.deal_number
+        clone.score = self.score
+        clone.stock = self.stock.clone()
+        clone.waste = self.waste.copy()
+        clone._waste_hash = self._waste_hash
+        clone.foundation = self.foundation._copy()
+        clone.tableau = self.tableau._copy()
+        return clone
+
+    def _push_waste(self, card: Card) -> NoReturn:
+        """Put a card on top of the waste, keeping the waste hash up to date"""
+        self._waste_hash ^= zobrist_keys('waste').key(len(self.waste), card.code)
+        self.waste.append(card)
+
+    def _pop_waste(self) -> Card:
+        """Take the top card from the waste, keeping the waste hash up to date"""
+        card = self.waste.pop()
+        self._waste_hash ^= zobrist_keys('waste').key(len(self.waste), card.code)
+        return card
+
+    def undo_deal(self, _: int, __: int, undo_replenish: int):
+        self.stock.undeal(self._pop_waste().concealed())
         if undo_replenish:
-            self.waste.extend(map(lambda c: c.reveal(), self.stock.deal_all()))
+            for card in self.stock.deal_all():
+                self._push_waste(card.revealed())
+
+    def redo_deal(self, *_):
+        self._deal()
 
     def deal(self) -> NoReturn:
         """Deal n cards from the stock into the waste pile"""
+        self._checkpoint()
+        replenished = self._deal()
+        self.undo_log.push(UndoOp.Deal, 0, 0, replenished)  # we need to know about replenishing for the undo event
 
+    def _deal(self) -> bool:
+        """
+        Deal a card from the stock into the waste pile, recycling the waste first if the stock is empty.
+        Intended for internal use only.
+        :return: True if the waste was recycled
+        """
         replenished = False
         if self.stock.remaining == 0:
             if self.waste:
-                self.stock.replenish(c.conceal() for c in self.waste)
+                self.stock.replenish(c.concealed() for c in self.waste)
                 self.waste.clear()
-                replenished = True  # we need to know this for the undo event
+                self._waste_hash = 0
+                replenished = True
         try:
-            self.waste.append(self.stock.deal().reveal())
-            self.undo_stack.append(UndoAction(self.undo_deal, [replenished]))
+            self._push_waste(self.stock.deal().revealed())
         except NoCardsRemainingException:
             raise IllegalMoveException('No cards left in the stock or waste')
+        return replenished
 
     def adjust_score(self, points: int):
         self.score += points
 
-    def undo_select_foundation(self):
-        self.adjust_score(POINTS_TABLEAU_FOUNDATION)
-        self.tableau.undo()
-        self.foundation.undo()
+    def undo_score(self, _: int, points: int, subtracted: int):
+        self.adjust_score(points if subtracted else -points)
+
+    def redo_score(self, _: int, points: int, subtracted: int):
+        self.adjust_score(-points if subtracted else points)
+
+    def _score(self, points: int) -> NoReturn:
+        """
+        Adjust the score for a move, recording the change in the undo log.
+        Intended for internal use only.
+        """
+        self.adjust_score(points)
+        self.undo_log.push(UndoOp.Score, 0, abs(points), points < 0)
+
+    def undo_waste_get(self, *_):
+        """Return the card on top of the undo log's hand to the waste"""
+        self._push_waste(self.undo_log.hand.pop())
+
+    def redo_waste_get(self, *_):
+        self.undo_log.hand.append(self._pop_waste())
+
+    def _seek_tableau_destination(self, cards: List[Card], destination_pile_num: int = None,
+                                  origin_pile_num: int = None) -> Optional[int]:
+        """
+        Find the tableau pile the cards may be built on, without changing anything.
+        :param cards: The cards to build
+        :param destination_pile_num: The only pile to consider, or None to consider every pile
+        :param origin_pile_num: A pile to skip, since cards may not be moved onto their own pile
+        :return: The destination pile number, or None if there's no fit
+        """
+        if destination_pile_num is not None:
+            if destination_pile_num > len(self.tableau) - 1:
+                raise TableauPileIndexError('No such tableau pile: {}'.format(destination_pile_num))
+            return destination_pile_num if self.tableau.can_put(cards, destination_pile_num) else None
+        return min((pile_num for pile_num in self.tableau.destinations(cards[0]) if pile_num != origin_pile_num),
+                   default=None)
+
+    def _can_put_tableau(self, cards: List[Card], destination_pile_num: Optional[int]) -> bool:
+        """
+        Checks whether the cards may be built on one particular tableau pile, without changing anything.  Unlike
+        _seek_tableau_destination(), a destination of None is no pile at all rather than any pile.
+        Intended for internal use only.
+        :param cards: The cards to build
+        :param destination_pile_num: The destination pile
+        :return: True if the cards may be built on the pile
+        """
+        if destination_pile_num is None or not -len(self.tableau) <= destination_pile_num < len(self.tableau):
+            raise TableauPileIndexError('No such tableau pile: {}'.format(destination_pile_num))
+        return self.tableau.can_put(cards, destination_pile_num)
 
     def select_foundation(self, suit: Suit, tableau_destination_pile: int = None):
-        card = self.foundation.get(suit)
-
-        destinations = [tableau_destination_pile] if tableau_destination_pile is not None else range(len(self.tableau))
-        for pile_num in destinations:
-            try:
-                self.tableau.put([card], pile_num)
-                self.adjust_score(-POINTS_TABLEAU_FOUNDATION)
-                self.undo_stack.append(UndoAction(self.undo_select_foundation))
-                return
-            except TableauPileIndexError as e:
-                self.foundation.undo()
-                raise e
-            except IllegalTableauMoveException:
-                pass
-
-        self.foundation.undo()
-        raise IllegalMoveException('No tableau fit for {}'.format(str(card)))
-
-    def undo_select_waste(self, undo_foundation: bool, card_string: str):
-        if undo_foundation:
-            self.adjust_score(-POINTS_WASTE_FOUNDATION)
-            self.foundation.undo()
-        else:
-            self.adjust_score(-POINTS_WASTE_TABLEAU)
-            self.tableau.undo()
-        self.waste.append(Card.parse_card(card_string))
+        card = self.foundation.peek(suit)
+        destination = self._seek_tableau_destination([card], tableau_destination_pile)
+        if destination is None:
+            raise IllegalMoveException('No tableau fit for {}'.format(str(card)))
+        self.apply(Move(MoveType.FoundationToTableau, suit, destination=destination))
 
     def select_waste(self, tableau_destination_pile: int = None):
         """Try to find the best fit for the top waste card"""
 
         if not self.waste:
             raise IllegalMoveException('No cards in the waste.')
-        card = self.waste.pop()
-        if tableau_destination_pile is None:
-            try:
-                self.foundation.put(card)
-                self.adjust_score(POINTS_WASTE_FOUNDATION)
-                self.undo_stack.append(UndoAction(self.undo_select_waste, [True, str(card)]))
-                return
-            except IllegalFoundationMoveException:
-                pass
-
-        destinations = [tableau_destination_pile] if tableau_destination_pile is not None else range(len(self.tableau))
-        for pile_num in destinations:
-            try:
-                self.tableau.put([card], pile_num)
-                self.adjust_score(POINTS_WASTE_TABLEAU)
-                self.undo_stack.append(UndoAction(self.undo_select_waste, [False, str(card)]))
-                return
-            except IllegalTableauMoveException:
-                pass
-        self.waste.append(card)
-        raise IllegalMoveException(
-            'No {}tableau fit for {}'.format(
-                'foundation or ' if tableau_destination_pile is None else '',
-                str(card)
-            )
-        )
+        card = self.waste[-1]
+        if tableau_destination_pile is None and self.foundation.can_put(card):
+            self.apply(Move(MoveType.WasteToFoundation))
+            return
 
-    def undo_seek_tableau_to_foundation(self):
-        self.adjust_score(-POINTS_TABLEAU_FOUNDATION)
-        self.foundation.undo()
-        self.tableau.undo()
+        destination = self._seek_tableau_destination([card], tableau_destination_pile)
+        if destination is None:
+            raise IllegalMoveException(
+                'No {}tableau fit for {}'.format(
+                    'foundation or ' if tableau_destination_pile is None else '',
+                    str(card)
+                )
+            )
+        self.apply(Move(MoveType.WasteToTableau, destination=destination))
 
     def seek_tableau_to_foundation(self):
         # Seek a tableau pile whose top card fits in the foundation
-        for _pile_num in range(len(self.tableau)):
-            try:
-                cards = self.tableau.get(_pile_num, -1)
-                self.foundation.put(cards[0])
-                self.score += POINTS_TABLEAU_FOUNDATION
-                self.undo_stack.append(UndoAction(self.undo_seek_tableau_to_foundation))
+        for pile_num in range(len(self.tableau)):
+            if self.tableau.can_get(pile_num, -1) and self.foundation.can_put(self.tableau.peek(pile_num, -1)[0]):
+                self.apply(Move(MoveType.TableauToFoundation, pile_num, -1))
                 return
-            except IllegalTableauMoveException:
-                # The chosen pile has no cards.  No tableau undo needed.
-                pass
-            except IllegalFoundationMoveException:
-                # There was no fit in the foundation, so put the card back in the tableau and move on
-                self.tableau.undo()
         raise IllegalMoveException("No tableau cards fit in the foundation.")
 
-    def undo_select_tableau(self, undo_foundation: bool):
-        if undo_foundation:
-            self.adjust_score(-POINTS_TABLEAU_FOUNDATION)
-            self.foundation.undo()
-        else:
-            self.tableau.undo()
-        self.tableau.undo()
-
     def select_tableau(self, pile_num: int = None, card_num: int = None, destination_pile_num: int = None):
         if pile_num is None:
             self.seek_tableau_to_foundation()
             return
-        else:
-            # Instead of seeking a foundation pile
-            if pile_num == destination_pile_num:
-                raise IllegalTableauMoveException("Destination pile can't be the same as the origin.")
-
-            # A specific tableau pile was chosen, so use it
-            cards = self.tableau.get(pile_num, card_num)
-
-            # First see if it fits in the foundation
-            if len(cards) == 1 and destination_pile_num is None:
-                try:
-                    self.foundation.put(cards[0])
-                    self.score += POINTS_TABLEAU_FOUNDATION
-                    self.undo_stack.append(UndoAction(self.undo_select_tableau, [True]))
-                    return
-                except IllegalFoundationMoveException:
-                    pass  # Don't undo the tableau get because we need to search for another tableau destination now
-
-            # If it doesn't fit in the foundation, seek a tableau pile or use the given tableau destination
-            destinations = [destination_pile_num] if destination_pile_num else range(len(self.tableau.piles))
-            for destination in destinations:
-                if pile_num != destination:
-                    try:
-                        self.tableau.put(cards, destination)
-                        self.undo_stack.append(UndoAction(self.undo_select_tableau, [False]))
-                        return
-                    except IllegalTableauMoveException:
-                        pass
-            self.tableau.undo()
-        # We couldn't find a card in the tableau that fit in the foundation
-        # OR The chosen tableau card didn't fit in the foundation
+
+        if pile_num == destination_pile_num:
+            raise IllegalTableauMoveException("Destination pile can't be the same as the origin.")
+
+        # A specific tableau pile was chosen, so use it
+        cards = self.tableau.peek(pile_num, card_num)
+
+        # First see if it fits in the foundation
+        if len(cards) == 1 and destination_pile_num is None and self.foundation.can_put(cards[0]):
+            self.apply(Move(MoveType.TableauToFoundation, pile_num, card_num))
+            return
+
+        # If it doesn't fit in the foundation, seek a tableau pile or use the given tableau destination
+        destination = self._seek_tableau_destination(cards, destination_pile_num, pile_num)
+        if destination is not None:
+            self.apply(Move(MoveType.TableauToTableau, pile_num, card_num, destination))
+            return
+
+        # The chosen tableau card didn't fit in the foundation
         # OR The chosen tableau card didn't fit anywhere in the tableau
         # OR the chosen tableau card didn't fit in the chosen tableau pile
         raise IllegalMoveException('No fit for Pile {} Card {}'.format(pile_num, card_num))
 
+    def legal_moves(self) -> List[Move]:
+        """
+        Lists every legal move from the current position without changing anything.  Foundation moves are listed
+        first, and a deal (or a recycle of the waste) is listed last.
+        :return: The legal moves, each of which may be passed to apply()
+        """
+        moves = []
+        fits = self.tableau.destination_index
+
+        if self.waste:
+            card = self.waste[-1]
+            if self.foundation.can_put(card):
+                moves.append(Move(MoveType.WasteToFoundation))
+            for destination in sorted(fits.get(card.code, ())):
+                moves.append(Move(MoveType.WasteToTableau, destination=destination))
+
+        for pile_num, pile in enumerate(self.tableau):
+            card_num = len(pile) - 1
+            if card_num < 0 or not pile[card_num].is_revealed:
+                continue
+            if self.foundation.can_put(pile[card_num]):
+                moves.append(Move(MoveType.TableauToFoundation, pile_num, card_num))
+            while card_num >= 0 and pile[card_num].is_revealed:
+                for destination in sorted(fits.get(pile[card_num].code, ())):
+                    if destination != pile_num:
+                        moves.append(Move(MoveType.TableauToTableau, pile_num, card_num, destination))
+                card_num -= 1
+
+        for suit in self.foundation:
+            if self.foundation.can_get(suit):
+                for destination in sorted(fits.get(self.foundation[suit][-1].code, ())):
+                    moves.append(Move(MoveType.FoundationToTableau, suit, destination=destination))
+
+        if self.stock.remaining or self.waste:
+            moves.append(Move(MoveType.Deal))
+        return moves
+
+    def apply(self, move: Move) -> NoReturn:
+        """
+        Make a move, such as one returned by legal_moves(), and record it in the undo log as a single step.  Moves are
+        checked before anything changes, and cards are taken from their origin before they're put on their destination,
+        so the records of each move follow the cards.
+        :param move: The move to make
+        """
+        self._checkpoint()
+        kind = move.kind
+        if kind == MoveType.Deal:
+            self.deal()
+        elif kind in (MoveType.WasteToFoundation, MoveType.WasteToTableau):
+            if not self.waste:
+                raise IllegalMoveException('No cards in the waste.')
+            card = self.waste[-1]
+            if kind == MoveType.WasteToFoundation:
+                if not self.foundation.can_put(card):
+                    raise IllegalFoundationBuildOrderException('Foundation cards must be built sequentially per suit.')
+            elif not self._can_put_tableau([card], move.destination):
+                raise IllegalTableauBuildOrderException('No tableau fit for {}'.format(str(card)))
+            with self.undo_log.group():
+                self.undo_log.hand.append(self._pop_waste())
+                self.undo_log.push(UndoOp.WasteGet)
+                if kind == MoveType.WasteToFoundation:
+                    self.foundation.put(card)
+                    self._score(POINTS_WASTE_FOUNDATION)
+                else:
+                    self.tableau.put([card], move.destination)
+                    self._score(POINTS_WASTE_TABLEAU)
+        elif kind == MoveType.TableauToFoundation:
+            cards = self.tableau.peek(move.origin, move.card_num)
+            if len(cards) != 1 or not self.foundation.can_put(cards[0]):
+                raise IllegalFoundationBuildOrderException('Foundation cards must be built sequentially per suit.')
+            with self.undo_log.group():
+                self.foundation.put(self.tableau.get(move.origin, move.card_num)[0])
+                self._score(POINTS_TABLEAU_FOUNDATION)
+        elif kind == MoveType.TableauToTableau:
+            cards = self.tableau.peek(move.origin, move.card_num)
+            if move.origin == move.destination or not self._can_put_tableau(cards, move.destination):
+                raise IllegalTableauBuildOrderException('No fit for Pile {} Card {} on Pile {}'.format(
+                    move.origin, move.card_num, move.destination))
+            with self.undo_log.group():
+                self.tableau.put(self.tableau.get(move.origin, move.card_num), move.destination)
+        elif kind == MoveType.FoundationToTableau:
+            card = self.foundation.peek(move.origin)
+            if not self._can_put_tableau([card], move.destination):
+                raise IllegalTableauBuildOrderException('No tableau fit for {}'.format(str(card)))
+            with self.undo_log.group():
+                self.tableau.put([self.foundation.get(move.origin)], move.destination)
+                self._score(-POINTS_TABLEAU_FOUNDATION)
+
+    def unapply(self, move: Move) -> NoReturn:
+        """
+        Take back a move made with apply().  Moves must be taken back in the reverse order they were made.
+        :param move: The most recently applied move
+        """
+        if not self.undo_log:
+            raise IllegalMoveException('No moves to take back: {}'.format(move))
+        self.undo()
+
+    def goto(self, move_index: int) -> bool:
+        """
+        Undo or redo steps until the given number of steps from the start of the history have been played.  Each move
+        is one step, and so is each autoplay.  Long jumps start from the nearest checkpoint, which is a packed position
+        taken every undo_log.checkpoint_interval steps, so a jump costs at most that many steps once the checkpoints
+        along the way exist.  Checkpoints are taken as moves are made or passed over, and aren't saved.
+        :param move_index: The number of steps, from undo_log.num_folded_steps, which is 0 unless the undo depth is
+        limited, to undo_log.step + undo_log.num_redo_steps
+        :return: True if any steps were undone or redone
+        """
+        log = self.undo_log
+        if move_index == log.step:
+            return False
+        if not log.num_folded_steps <= move_index <= log.step + log.num_redo_steps:
+            raise IllegalMoveException('No such move: {}'.format(move_index))
+        checkpoint = log.nearest_checkpoint(move_index)
+        if checkpoint is not None and move_index - checkpoint < abs(move_index - log.step):
+            self._restore(log.restore_checkpoint(checkpoint))
+        while log.step < move_index:
+            self._checkpoint()
+            log.redo()
+        while log.step > move_index:
+            log.undo()
+            self._checkpoint()
+        return True
+
+    def _checkpoint(self) -> NoReturn:
+        """
+        Store the packed position in the undo log if it's due for a checkpoint.  Called between steps.
+        Intended for internal use only.
+        """
+        if self.undo_log.is_checkpoint_due:
+            self.undo_log.checkpoint(self.pack())
+
+    def _restore(self, packed: Tuple) -> NoReturn:
+        """
+        Replace the position with one previously packed by pack(), keeping the piles and the undo log.
+        Intended for internal use only.
+        """
+        score, stock, waste, foundation, tableau = packed
+        self.score = score
+        self.stock.unpack(stock)
+        self.waste = unpack_cards(waste, is_revealed=True)
+        self._waste_hash = zobrist_keys('waste').hash(self.waste)
+        self.foundation.unpack(foundation)
+        self.tableau.unpack(tableau)
+
+    @property
+    def state_hash(self) -> int:
+        """
+        A 64-bit Zobrist hash of the position: the stock, waste, foundation and tableau.  The score isn't included.
+        Every move and undo updates it incrementally.  Call rehash() after changing any of the piles directly.
+        """
+        return self.stock.state_hash ^ self._waste_hash ^ self.foundation.state_hash ^ self.tableau.state_hash
+
+    @property
+    def canonical_hash(self) -> int:
+        """
+        Like state_hash, but positions that differ only in the order of the tableau piles hash equally, since they
+        play identically.  Every move and undo updates it incrementally.
+        """
+        return self.stock.state_hash ^ self._waste_hash ^ self.foundation.state_hash ^ self.tableau.canonical_hash
+
+    def canonical_key(self) -> Tuple[bytes, bytes, bytes, bytes]:
+        """
+        A compact key for the position that is equal for positions that play identically, whatever the order of
+        the tableau piles.  The foundation is reduced to the number of cards per suit, and the score isn't included.
+        :return: A tuple of (stock, waste, foundation, tableau) keys
+        """
+        return (
+            self.stock.pack(),
+            pack_cards(self.waste),
+            bytes(len(self.foundation[suit]) for suit in self.foundation),
+            self.tableau.canonical_key()
+        )
+
+    def rehash(self) -> int:
+        """Recompute the hash of the position from scratch"""
+        self._waste_hash = zobrist_keys('waste').hash(self.waste)
+        return self.stock.rehash() ^ self._waste_hash ^ self.foundation.rehash() ^ self.tableau.rehash()
+
+    def autoplay(self, safe: bool = True) -> List[Move]:
+        """
+        Move every card that fits from the waste and the tableau to the foundation, until none are left.  All the
+        moves are recorded as a single undo action.
+        :param safe: Only move cards that can't be needed in the tableau any more, per Foundation.can_put_safely()
+        :return: The moves made, in order
+        """
+        fits = self.foundation.can_put_safely if safe else self.foundation.can_put
+        self._checkpoint()
+        moves = []
+        progress = True
+        with self.undo_log.group():
+            while progress:
+                progress = False
+                while self.waste and fits(self.waste[-1]):
+                    moves.append(Move(MoveType.WasteToFoundation))
+                    self.apply(moves[-1])
+                    progress = True
+                for pile_num, pile in enumerate(self.tableau):
+                    while pile and pile[-1].is_revealed and fits(pile[-1]):
+                        moves.append(Move(MoveType.TableauToFoundation, pile_num, len(pile) - 1))
+                        self.apply(moves[-1])
+                        progress = True
+        return moves
+
     def is_solvable(self) -> bool:
         if len(self.stock) + len(self.waste) > 0:
             return False
-        for pile in self.tableau.piles:
+        for pile in self.tableau:
             if pile and pile[0].is_concealed:
                 return False
         return True
@@ -193,15 +524,20 @@ class KlondikeGame(Undoable):
     def is_solved(self) -> bool:
         return self.foundation.is_full
 
-    def solve(self):
+    def solve(self) -> List[Move]:
+        """
+        Finish a solvable game by moving every remaining tableau card to the foundation, as a single undo action.
+        :return: The moves made, in order
+        """
         if not self.is_solvable():
             raise IllegalMoveException("Can't solve with cards remaining in the stock or waste.")
 
-        if not self.is_solved():
-            self.seek_tableau_to_foundation()
+        # With every card revealed, the lowest remaining card is always on top of its pile, so nothing can get stuck
+        return self.autoplay(safe=False)
 
     def dump(self) -> object:
         return {
+            "deal_number": self.deal_number,
             "score": self.score,
             "stock": self.stock.dump(),
             "waste": list(map(str, self.waste)),
@@ -211,9 +547,160 @@ class KlondikeGame(Undoable):
         }
 
     def load(self, game_dump: object) -> NoReturn:
+        self.deal_number = game_dump.get("deal_number")
         self.score = game_dump.get("score", 0)
         self.stock = Deck(deck_dump=game_dump.get("stock", dict()))
         self.waste = list(map(Card.parse_card, game_dump.get("waste", list())))
         self.foundation = Foundation(foundation_dump=game_dump.get("foundation", dict()))
         self.tableau = Tableau(tableau_dump=game_dump.get("tableau", dict()))
-        self.load_undo_stack(game_dump.get("undo_stack", list()))
+        self._waste_hash = zobrist_keys('waste').hash(self.waste)
+        self._share_undo_log()
+        undo_stack = game_dump.get("undo_stack", list())
+        if isinstance(undo_stack, list):
+            self._load_legacy_undo_stacks(undo_stack, game_dump.get("tableau", dict()).get("undo_stack") or list(),
+                                          game_dump.get("foundation", dict()).get("undo_stack") or list())
+        else:
+            self.load_undo_stack(undo_stack)
+
+    def _load_legacy_undo_stacks(self, undo_stack: List[dict], tableau_undo_stack: List[dict],
+                                 foundation_undo_stack: List[dict]) -> NoReturn:
+        """
+        Convert the separate undo stacks of the game, tableau and foundation exported by earlier versions into a single
+        undo log.  Each game action undid the latest tableau and foundation actions it needed, so those are matched up
+        from the end.  Intended for internal use only.
+        """
+        tableau_actions = list(tableau_undo_stack)
+        foundation_actions = list(foundation_undo_stack)
+        steps = [self._legacy_undo_records(action, tableau_actions, foundation_actions)
+                 for action in reversed(undo_stack)]
+        self.undo_log.clear()
+        for records in reversed(steps):
+            with self.undo_log.group():
+                for record in records:
+                    self.undo_log.push(*record)
+
+    def _legacy_undo_records(self, action: dict, tableau_actions: List[dict],
+                             foundation_actions: List[dict]) -> List[Tuple[int, int, int, int]]:
+        """
+        The records equivalent to one game action exported by earlier versions, in the order they would be pushed.
+        Intended for internal use only.
+        :param action: An {'action', 'args'} dict
+        :param tableau_actions: The tableau's remaining undo actions, from which the ones this action undid are popped
+        :param foundation_actions: The foundation's remaining undo actions, likewise
+        :return: A list of (op, pile, count, flag) records
+        """
+        suits = list(self.foundation)
+
+        def tableau_record():
+            tableau_action = tableau_actions.pop()
+            if tableau_action["action"] == "undo_put":
+                pile_num, num_cards = tableau_action["args"]
+                return UndoOp.TableauPut, pile_num, num_cards, True
+            pile_num, card_strings, re_conceal = tableau_action["args"]
+            return UndoOp.TableauGet, pile_num, len(card_strings), re_conceal
+
+        def foundation_record():
+            foundation_action = foundation_actions.pop()
+            if foundation_action["action"] == "undo_put":
+                return UndoOp.FoundationPut, suits.index(Suit(foundation_action["args"][0])), 1, True
+            return UndoOp.FoundationGet, suits.index(Card.parse_card(foundation_action["args"][0]).suit), 1, False
+
+        def score_record(points):
+            return UndoOp.Score, 0, abs(points), points < 0
+
+        name, args = action["action"], action["args"]
+        if name == "undo_deal":
+            return [(UndoOp.Deal, 0, 0, args[0])]
+        if name == "undo_select_waste":
+            if args[0]:
+                return [(UndoOp.WasteGet, 0, 0, 0), foundation_record(), score_record(POINTS_WASTE_FOUNDATION)]
+            return [(UndoOp.WasteGet, 0, 0, 0), tableau_record(), score_record(POINTS_WASTE_TABLEAU)]
+        if name == "undo_seek_tableau_to_foundation" or name == "undo_select_tableau" and args[0]:
+            put = foundation_record()
+            return [tableau_record(), put, score_record(POINTS_TABLEAU_FOUNDATION)]
+        if name == "undo_select_tableau":
+            put = tableau_record()
+            return [tableau_record(), put]
+        if name == "undo_select_foundation":
+            put = tableau_record()
+            return [foundation_record(), put, score_record(-POINTS_TABLEAU_FOUNDATION)]
+        if name == "undo_autoplay":
+            records = []
+            for autoplay_action in reversed(args[0]):
+                records[:0] = self._legacy_undo_records(autoplay_action, tableau_actions, foundation_actions)
+            return records
+        raise ValueError('Unknown undo action: {}'.format(name))
+
+    def to_bytes(self) -> bytes:
+        """
+        Saves the game, including the undo log, in a compact versioned binary format with one byte per card, which
+        keeps whether the card is concealed, and the undo records as they are.  Checkpoints aren't saved.
+        :return: The saved game, for from_bytes()
+        """
+        header = _SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, 0 if self.deal_number is None else SAVE_HAS_DEAL_NUMBER,
+                                   self.deal_number or 0, self.score)
+        sections = (self.stock.to_bytes(), encode_cards(self.waste), self.foundation.to_bytes(),
+                    self.tableau.to_bytes(), self.undo_log.to_bytes())
+        return header + b''.join(_SAVE_SECTION_SIZE.pack(len(section)) + section for section in sections)
+
+    @classmethod
+    def from_bytes(cls, game_bytes: bytes, max_undo_depth: int = None) -> 'KlondikeGame':
+        """
+        :param game_bytes: A game saved by to_bytes()
+        :param max_undo_depth: The most moves that can be undone, as for a new game
+        :return: The saved game
+        """
+        return cls(game_bytes=game_bytes, max_undo_depth=max_undo_depth)
+
+    def load_bytes(self, game_bytes: bytes) -> NoReturn:
+        """
+        Replace the game with one previously saved by to_bytes()
+        :param game_bytes: The saved game
+        """
+        if len(game_bytes) < _SAVE_HEADER.size or not game_bytes.startswith(SAVE_MAGIC):
+            raise ValueError('Not a saved Klondike game')
+        _, version, flags, deal_number, score = _SAVE_HEADER.unpack_from(game_bytes)
+        if version > SAVE_VERSION:
+            raise ValueError('Unsupported save format version: {}'.format(version))
+        sections = []
+        position = _SAVE_HEADER.size
+        while position < len(game_bytes):
+            end = position + _SAVE_SECTION_SIZE.size + _SAVE_SECTION_SIZE.unpack_from(game_bytes, position)[0]
+            sections.append(game_bytes[position + _SAVE_SECTION_SIZE.size:end])
+            position = end
+        stock, waste, foundation, tableau, undo_log = sections
+
+        self.deal_number = deal_number if flags & SAVE_HAS_DEAL_NUMBER else None
+        self.score = score
+        self.stock = Deck(packed=b'')
+        self.stock.load_bytes(stock)
+        self.waste = decode_cards(waste)
+        self.foundation = Foundation(suits=())
+        self.foundation.load_bytes(foundation)
+        self.tableau = Tableau()
+        self.tableau.load_bytes(tableau)
+        self._waste_hash = zobrist_keys('waste').hash(self.waste)
+        self._share_undo_log()
+        self.undo_log.load_bytes(undo_log)
+
+    def pack(self) -> Tuple:
+        """
+        Packs the position into a compact tuple of (score, stock, waste, foundation, tableau), where every card is a
+        single byte and the revealed state is implied by the pile holding it.  The undo stack is not included.
+        :return: The packed position
+        """
+        return self.score, self.stock.pack(), pack_cards(self.waste), self.foundation.pack(), self.tableau.pack()
+
+    def unpack(self, packed: Tuple) -> NoReturn:
+        """
+        Replace the position with one previously packed by pack()
+        :param packed: The packed position
+        """
+        score, stock, waste, foundation, tableau = packed
+        self.score = score
+        self.stock = Deck(packed=stock)
+        self.waste = unpack_cards(waste, is_revealed=True)
+        self.foundation = Foundation(suits=Suit, packed=foundation)
+        self.tableau = Tableau(packed=tableau)
+        self._waste_hash = zobrist_keys('waste').hash(self.waste)
+        self._share_undo_log()
@@ -0,0 +1,251 @@
+"""
+An immutable Klondike engine for tree search.  A KlondikePosition is a named tuple of packed piles, in the format of
+KlondikeGame.pack(), and apply() returns a new position that shares every unchanged pile with the old one.  Positions
+need no undo log and no copying, so a search can keep as many siblings alive as it likes, and they can be compared,
+hashed and used as dict keys like any other tuple.
+"""
+from typing import Dict, List, NamedTuple, NoReturn, Optional, Tuple
+
+from pytience.cards.deck import SUITS, CARD_STRINGS
+from pytience.cards.exception import NoCardsRemainingException
+from pytience.games.solitaire import KING_CODES, TABLEAU_BUILDS
+from pytience.games.solitaire.exception import IllegalMoveException, IllegalTableauBuildOrderException, \
+    IllegalFoundationBuildOrderException, NoSuchSuitException, TableauCardIndexError, TableauPileIndexError, \
+    TableauCardNotAvailableException
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType, POINTS_WASTE_FOUNDATION, \
+    POINTS_WASTE_TABLEAU, POINTS_TABLEAU_FOUNDATION
+
+NUM_RANKS = 13
+
+
+class KlondikePosition(NamedTuple):
+    """
+    A Klondike position as an immutable value.  Cards are codes, as in KlondikeGame.pack(): the stock is top card
+    first, the waste and the foundation piles are bottom card first, and each tableau pile is its number of concealed
+    cards followed by its codes, bottom card first.  Foundation piles are in suit order.
+    """
+    score: int
+    stock: bytes
+    waste: bytes
+    foundation: Tuple[bytes, ...]
+    tableau: Tuple[bytes, ...]
+    deal_number: Optional[int] = None
+
+    @classmethod
+    def from_game(cls, game: KlondikeGame) -> 'KlondikePosition':
+        """
+        :param game: The game to convert.  Its undo log isn't included.
+        :return: The game's current position
+        """
+        return cls(*game.pack(), deal_number=game.deal_number)
+
+    def to_game(self) -> KlondikeGame:
+        """
+        :return: A new game at this position, with an empty undo log
+        """
+        game = KlondikeGame(packed=self.packed)
+        game.deal_number = self.deal_number
+        game.stock.is_shuffled = True  # Klondike stocks are always what's left of a shuffled deck
+        return game
+
+    @classmethod
+    def from_dump(cls, game_dump: object) -> 'KlondikePosition':
+        """
+        :param game_dump: An object exported by KlondikeGame.dump().  The undo log isn't included.
+        :return: The dumped position
+        """
+        return cls.from_game(KlondikeGame(game_dump=game_dump))
+
+    def to_dump(self) -> object:
+        """
+        Dumps the position as KlondikeGame.dump() would, so KlondikeGame(game_dump=...) can load it
+        :return: A JSON-ready object, with an empty undo log
+        """
+        return self.to_game().dump()
+
+    @property
+    def packed(self) -> Tuple:
+        """The position as packed by KlondikeGame.pack(), for KlondikeGame(packed=...)"""
+        return self[:5]
+
+    def is_solved(self) -> bool:
+        return all(len(pile) == NUM_RANKS for pile in self.foundation)
+
+    def _fits_foundation(self, code: int) -> bool:
+        """Checks whether a card is the next one on its suit's foundation pile"""
+        return len(self.foundation[code // NUM_RANKS]) == code % NUM_RANKS
+
+    def _destinations(self) -> Dict[int, List[int]]:
+        """
+        :return: The tableau piles that accept each card code, like Tableau.destination_index, in pile order
+        """
+        destinations = {}
+        for pile_num, pile in enumerate(self.tableau):
+            if len(pile) == 1:
+                wanted = KING_CODES
+            elif len(pile) - 1 > pile[0]:
+                wanted = TABLEAU_BUILDS[pile[-1]]
+            else:
+                wanted = ()
+            for code in wanted:
+                destinations.setdefault(code, []).append(pile_num)
+        return destinations
+
+    def legal_moves(self) -> List[Move]:
+        """
+        Lists every legal move, in the same order as KlondikeGame.legal_moves()
+        :return: The legal moves, each of which may be passed to apply()
+        """
+        moves = []
+        fits = self._destinations()
+
+        if self.waste:
+            code = self.waste[-1]
+            if self._fits_foundation(code):
+                moves.append(Move(MoveType.WasteToFoundation))
+            for destination in fits.get(code, ()):
+                moves.append(Move(MoveType.WasteToTableau, destination=destination))
+
+        for pile_num, pile in enumerate(self.tableau):
+            if len(pile) - 1 <= pile[0]:
+                continue
+            card_num = len(pile) - 2
+            if self._fits_foundation(pile[-1]):
+                moves.append(Move(MoveType.TableauToFoundation, pile_num, card_num))
+            while card_num >= pile[0]:
+                for destination in fits.get(pile[card_num + 1], ()):
+                    if destination != pile_num:
+                        moves.append(Move(MoveType.TableauToTableau, pile_num, card_num, destination))
+                card_num -= 1
+
+        for suit, pile in zip(SUITS, self.foundation):
+            if pile:
+                for destination in fits.get(pile[-1], ()):
+                    moves.append(Move(MoveType.FoundationToTableau, suit, destination=destination))
+
+        if self.stock or self.waste:
+            moves.append(Move(MoveType.Deal))
+        return moves
+
+    def apply(self, move: Move) -> 'KlondikePosition':
+        """
+        Make a move, such as one returned by legal_moves(), raising the same exceptions as KlondikeGame.apply()
+        :param move: The move to make
+        :return: The new position, which shares every pile the move didn't change with this one
+        """
+        kind = move.kind
+        if kind == MoveType.Deal:
+            if self.stock:
+                return self._replace(stock=self.stock[1:], waste=self.waste + self.stock[:1])
+            if self.waste:
+                return self._replace(stock=self.waste[1:], waste=self.waste[:1])
+            raise IllegalMoveException('No cards left in the stock or waste')
+
+        if kind in (MoveType.WasteToFoundation, MoveType.WasteToTableau):
+            if not self.waste:
+                raise IllegalMoveException('No cards in the waste.')
+            code = self.waste[-1]
+            position = self._replace(waste=self.waste[:-1])
+            if kind == MoveType.WasteToFoundation:
+                if not self._fits_foundation(code):
+                    raise IllegalFoundationBuildOrderException('Foundation cards must be built sequentially per suit.')
+                return position._put_foundation(code, POINTS_WASTE_FOUNDATION)
+            destination = self._check_tableau_fit(code, move.destination)
+            return position._put_tableau(bytes([code]), destination, POINTS_WASTE_TABLEAU)
+
+        if kind == MoveType.TableauToFoundation:
+            codes = self._peek_tableau(move.origin, move.card_num)
+            if len(codes) != 1 or not self._fits_foundation(codes[0]):
+                raise IllegalFoundationBuildOrderException('Foundation cards must be built sequentially per suit.')
+            return self._get_tableau(move.origin, 1)._put_foundation(codes[0], POINTS_TABLEAU_FOUNDATION)
+
+        if kind == MoveType.TableauToTableau:
+            codes = self._peek_tableau(move.origin, move.card_num)
+            origin = move.origin % len(self.tableau)
+            destination = self._check_tableau_fit(codes[0], move.destination)
+            if origin == destination:
+                raise IllegalTableauBuildOrderException('No fit for Pile {} Card {} on Pile {}'.format(
+                    move.origin, move.card_num, move.destination))
+            return self._get_tableau(origin, len(codes))._put_tableau(codes, destination)
+
+        if kind == MoveType.FoundationToTableau:
+            if move.origin not in SUITS:
+                raise NoSuchSuitException('No such suit.')
+            suit_num = SUITS.index(move.origin)
+            pile = self.foundation[suit_num]
+            if not pile:
+                raise NoCardsRemainingException('No foundation cards for suit {}'.format(move.origin))
+            destination = self._check_tableau_fit(pile[-1], move.destination)
+            foundation = self.foundation[:suit_num] + (pile[:-1],) + self.foundation[suit_num + 1:]
+            position = self._replace(foundation=foundation)
+            return position._put_tableau(pile[-1:], destination, -POINTS_TABLEAU_FOUNDATION)
+
+        raise IllegalMoveException('Unknown move: {}'.format(move))
+
+    def _check_tableau_fit(self, code: int, destination: int) -> int:
+        """
+        Raise an exception unless a card may be built on a tableau pile, which may be numbered from the end as for
+        KlondikeGame.apply().
+        Intended for internal use only.
+        :return: The pile number, counted from the first pile
+        """
+        if destination is None or not -len(self.tableau) <= destination < len(self.tableau):
+            raise TableauPileIndexError('No such tableau pile: {}'.format(destination))
+        destination %= len(self.tableau)
+        pile = self.tableau[destination]
+        if len(pile) == 1:
+            if code in KING_CODES:
+                return destination
+        elif len(pile) - 1 > pile[0] and code in TABLEAU_BUILDS[pile[-1]]:
+            return destination
+        raise IllegalTableauBuildOrderException('No tableau fit for {}'.format(CARD_STRINGS[True][code]))
+
+    def _peek_tableau(self, pile_num: int, card_num: int) -> bytes:
+        """
+        Finds the cards that a tableau get would take, raising the same exceptions as Tableau.peek().
+        Intended for internal use only.
+        :return: The codes of the card and any cards on top of it
+        """
+        if card_num is None:
+            raise TableauCardIndexError('Card num not specified')
+        if not -len(self.tableau) <= pile_num < len(self.tableau):
+            raise TableauPileIndexError('No such tableau pile: {}'.format(pile_num))
+        pile = self.tableau[pile_num]
+        num_cards = len(pile) - 1
+        if card_num < 0:
+            card_num = max(num_cards + card_num, 0)
+        if card_num >= num_cards:
+            raise TableauCardIndexError('No card at pile [{}][{}]'.format(pile_num, card_num))
+        if card_num < pile[0]:
+            raise TableauCardNotAvailableException('Pile {} Card {} is concealed'.format(pile_num, card_num))
+        return pile[card_num + 1:]
+
+    def _get_tableau(self, pile_num: int, num_cards: int) -> 'KlondikePosition':
+        """
+        Remove cards from the top of a tableau pile, revealing the card beneath them.
+        Intended for internal use only.
+        """
+        pile = self.tableau[pile_num][:-num_cards]
+        if len(pile) - 1 == pile[0] > 0:
+            pile = bytes([pile[0] - 1]) + pile[1:]
+        pile_num %= len(self.tableau)
+        return self._replace(tableau=self.tableau[:pile_num] + (pile,) + self.tableau[pile_num + 1:])
+
+    def _put_tableau(self, codes: bytes, pile_num: int, points: int = 0) -> 'KlondikePosition':
+        """
+        Add cards to the top of a tableau pile.
+        Intended for internal use only.
+        """
+        pile = self.tableau[pile_num] + codes
+        return self._replace(score=self.score + points,
+                             tableau=self.tableau[:pile_num] + (pile,) + self.tableau[pile_num + 1:])
+
+    def _put_foundation(self, code: int, points: int) -> 'KlondikePosition':
+        """
+        Add a card to its suit's foundation pile.
+        Intended for internal use only.
+        """
+        suit_num = code // NUM_RANKS
+        pile = self.foundation[suit_num] + bytes([code])
+        return self._replace(score=self.score + points,
+                             foundation=self.foundation[:suit_num] + (pile,) + self.foundation[suit_num + 1:])
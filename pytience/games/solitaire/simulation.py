@@ -0,0 +1,191 @@
+"""
+Play many complete Klondike games with a policy, to measure how scoring or rule changes play out.  Each worker resets
+a single KlondikeGame for every deal it plays, and workers may be threads or processes.  Deal numbers are drawn from
+the seed up front, so a seeded simulation plays the same games however it's split between workers.
+"""
+import random
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType
+from pytience.games.solitaire.solver import KlondikeSolver
+
+DEFAULT_MAX_MOVES = 1000
+
+
+class Policy(ABC):
+    """
+    Chooses the move to make from a position.  A deterministic policy always chooses the same move from the same
+    position, so a position seen twice in one game means it will loop forever, and the game is stopped as a loss.
+    """
+    is_deterministic = True
+
+    @abstractmethod
+    def choose(self, game: KlondikeGame, moves: List[Move], rng: random.Random) -> Optional[Move]:
+        """
+        :param game: The position, which must not be changed
+        :param moves: The legal moves, in the order of KlondikeGame.legal_moves(), of which there's at least one
+        :param rng: The random number generator for the game, for policies that need one
+        :return: The move to make, or None to give up
+        """
+
+
+class RandomPolicy(Policy):
+    """Any legal move, chosen uniformly"""
+    is_deterministic = False
+
+    def choose(self, game: KlondikeGame, moves: List[Move], rng: random.Random) -> Optional[Move]:
+        return rng.choice(moves)
+
+
+class GreedyPolicy(Policy):
+    """
+    The solver's most promising move: foundation moves first, then tableau moves, the waste, a deal, and finally moves
+    back from the foundation.  Tableau moves that can't make progress are never made.
+    """
+
+    def choose(self, game: KlondikeGame, moves: List[Move], rng: random.Random) -> Optional[Move]:
+        return next(iter(KlondikeSolver.candidate_moves(game, moves)), None)
+
+
+class ScriptedPolicy(Policy):
+    """The first legal move of the highest priority kind.  Kinds that aren't listed are never played."""
+
+    def __init__(self, priorities: Sequence[MoveType]):
+        """
+        :param priorities: The kinds of moves to make, most preferred first
+        """
+        self.priorities = {kind: priority for priority, kind in enumerate(priorities)}
+
+    def choose(self, game: KlondikeGame, moves: List[Move], rng: random.Random) -> Optional[Move]:
+        priorities = self.priorities
+        return min((move for move in moves if move.kind in priorities), key=lambda move: priorities[move.kind],
+                   default=None)
+
+
+@dataclass
+class SimulationReport:
+    games: int = 0
+    wins: int = 0
+    total_score: int = 0
+    total_moves: int = 0
+    seconds: float = 0.0
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games else 0.0
+
+    @property
+    def mean_score(self) -> float:
+        return self.total_score / self.games if self.games else 0.0
+
+    @property
+    def mean_moves(self) -> float:
+        return self.total_moves / self.games if self.games else 0.0
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.seconds if self.seconds else 0.0
+
+    def add(self, other: 'SimulationReport') -> 'SimulationReport':
+        """Count the games of another report, such as one from another worker.  The time isn't added."""
+        self.games += other.games
+        self.wins += other.wins
+        self.total_score += other.total_score
+        self.total_moves += other.total_moves
+        return self
+
+    def __str__(self):
+        return '{} games, {:.1%} won, mean score {:.1f}, mean moves {:.1f}, {:.1f} games/s'.format(
+            self.games, self.win_rate, self.mean_score, self.mean_moves, self.games_per_second)
+
+
+def play(game: KlondikeGame, policy: Policy, rng: random.Random,
+         max_moves: int = DEFAULT_MAX_MOVES) -> Tuple[bool, int]:
+    """
+    Play a game to the end with a policy.  The game ends when it's won, when there are no legal moves, when the policy
+    gives up or loops, or after max_moves.  Once every card is available, the game is finished with solve().
+    :param game: The game to play, which is changed
+    :param policy: The policy choosing each move
+    :param rng: The random number generator for the policy
+    :param max_moves: The most moves to make
+    :return: Whether the game was won, and the number of moves made
+    """
+    num_moves = 0
+    seen = set()
+    while num_moves < max_moves:
+        if game.is_solvable():
+            num_moves += len(game.solve())
+            break
+        moves = game.legal_moves()
+        if not moves:
+            break
+        if policy.is_deterministic:
+            key = game.state_hash
+            if key in seen:
+                break
+            seen.add(key)
+        move = policy.choose(game, moves, rng)
+        if move is None:
+            break
+        game.apply(move)
+        num_moves += 1
+    return game.is_solved(), num_moves
+
+
+def play_deals(policy: Policy, deal_numbers: Sequence[int], max_moves: int = DEFAULT_MAX_MOVES) -> SimulationReport:
+    """
+    Play each deal with a policy, resetting a single game for each one.  This is the work given to each worker.
+    :param policy: The policy choosing each move
+    :param deal_numbers: The deals to play.  Each deal number also seeds the policy's random number generator.
+    :param max_moves: The most moves to make in each game
+    :return: The results, timed
+    """
+    started = time.perf_counter()
+    report = SimulationReport()
+    game = None
+    for deal_number in deal_numbers:
+        if game is None:
+            game = KlondikeGame(deal_number=deal_number, max_undo_depth=1)  # moves are never taken back
+        else:
+            game.reset(deal_number=deal_number)
+        won, num_moves = play(game, policy, random.Random(deal_number), max_moves)
+        report.games += 1
+        report.wins += won
+        report.total_score += game.score
+        report.total_moves += num_moves
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def simulate(policy: Policy, num_games: int, seed: int = None, max_moves: int = DEFAULT_MAX_MOVES, workers: int = 1,
+             use_processes: bool = False) -> SimulationReport:
+    """
+    Play random deals with a policy and report how it did.
+    :param policy: The policy choosing each move.  It must be picklable to use processes.
+    :param num_games: The number of games to play
+    :param seed: Seed the choice of deals, so the simulation can be reproduced
+    :param max_moves: The most moves to make in each game
+    :param workers: The number of threads or processes to split the games between.  With 1, games are played in this
+    thread.
+    :param use_processes: Use processes rather than threads.  Pure Python policies only play in parallel in processes.
+    :return: The combined results, timed from start to finish
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    deal_numbers = [rng.getrandbits(64) for _ in range(num_games)]
+    if workers == 1:
+        report = play_deals(policy, deal_numbers, max_moves)
+    else:
+        chunks = [deal_numbers[worker::workers] for worker in range(workers)]
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(workers) as executor:
+            reports = executor.map(play_deals, [policy] * workers, chunks, [max_moves] * workers)
+            report = SimulationReport()
+            for worker_report in reports:
+                report.add(worker_report)
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,205 @@
+import time
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import List, Hashable, NoReturn, Tuple
+
+from pytience.cards.deck import SUITS
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType
+
+DEFAULT_MAX_NODES = 200000
+
+# Packed moves are 4 bytes each: kind, origin, card_num and destination, with NO_FIELD for the unused fields
+PACKED_MOVE_SIZE = 4
+NO_FIELD = 255
+
+
+class SolverStatus(Enum):
+    Solved = 1
+    Unsolvable = 2  # every move was searched without finding a win
+    BudgetExceeded = 3
+    NotFound = 4  # no win was found, but some run splits were skipped, so the deal may still be winnable
+
+
+@dataclass
+class SolverResult:
+    status: SolverStatus
+    moves: List[Move] = field(default_factory=list)
+    nodes: int = 0
+    seconds: float = 0.0
+
+    @property
+    def is_solved(self) -> bool:
+        return self.status == SolverStatus.Solved
+
+
+class KlondikeSolver:
+    """
+    A depth-first search over every Klondike move, including dealing and recycling the stock.  Positions that have
+    already been explored are skipped using a transposition table of position keys, so the search always terminates.
+    Splitting a run is only searched when it frees a card for the foundation, so a search that skipped any other run
+    split and found no win ends as NotFound rather than Unsolvable, which is only reported when nothing was skipped.
+    """
+
+    def __init__(self, max_nodes: int = DEFAULT_MAX_NODES, max_seconds: float = None):
+        """
+        :param max_nodes: The most moves to make before giving up, or None for no limit
+        :param max_seconds: The most time to spend before giving up, or None for no limit
+        """
+        self.max_nodes = max_nodes
+        self.max_seconds = max_seconds
+
+    @staticmethod
+    def position_key(game: KlondikeGame) -> Hashable:
+        """
+        The transposition table key for a position.  Neither the score nor the order of the tableau piles affects
+        how a position plays.
+        """
+        return game.canonical_hash
+
+    @staticmethod
+    def candidate_moves(game: KlondikeGame, moves: List[Move] = None) -> List[Move]:
+        """
+        The legal moves worth searching, most promising first.  Tableau moves that can't make progress are dropped:
+        moving a pile's bottom card to an empty pile, which only reorders the piles, and splitting a run unless it
+        frees a card for the foundation.
+        :param game: The position to search from
+        :param moves: The position's legal moves, if they've already been listed
+        :return: The ordered candidate moves
+        """
+        return KlondikeSolver._rank_moves(game, game.legal_moves() if moves is None else moves)[0]
+
+    @staticmethod
+    def _rank_moves(game: KlondikeGame, moves: List[Move]) -> Tuple[List[Move], bool]:
+        """
+        Intended for internal use only.
+        :param moves: The position's legal moves
+        :return: The ordered candidate moves, and whether any run split was dropped.  Dropping a move that only
+        reorders the piles leads to the same position, so it isn't counted.
+        """
+        piles = game.tableau
+        ranked = []
+        is_pruned = False
+        for move in moves:
+            kind = move.kind
+            if kind in (MoveType.WasteToFoundation, MoveType.TableauToFoundation):
+                rank = 0
+            elif kind == MoveType.TableauToTableau:
+                pile = piles[move.origin]
+                first_revealed = move.card_num
+                while first_revealed > 0 and pile[first_revealed - 1].is_revealed:
+                    first_revealed -= 1
+                if move.card_num > first_revealed:
+                    if not game.foundation.can_put(pile[move.card_num - 1]):
+                        is_pruned = True
+                        continue
+                    rank = 3
+                elif move.card_num == 0:
+                    if not piles[move.destination]:
+                        continue
+                    rank = 1
+                else:
+                    rank = 1
+            elif kind == MoveType.WasteToTableau:
+                rank = 2
+            elif kind == MoveType.Deal:
+                rank = 4
+            else:
+                rank = 5
+            ranked.append((rank, len(ranked), move))
+        return [move for _, _, move in sorted(ranked)], is_pruned
+
+    @staticmethod
+    def _play(game: KlondikeGame, move: Move) -> List[Move]:
+        """Make a move followed by any safe moves to the foundation, which never need to be searched"""
+        game.apply(move)
+        return [move] + game.autoplay()
+
+    @staticmethod
+    def _take_back(game: KlondikeGame, moves: List[Move]) -> NoReturn:
+        """Take back the moves made by _play()"""
+        if len(moves) > 1:
+            game.undo()  # autoplay records its moves as one undo action
+        game.unapply(moves[0])
+
+    def solve(self, game: KlondikeGame) -> SolverResult:
+        """
+        Search for a sequence of moves that wins the game.  The game itself is not changed.
+        :param game: The position to solve
+        :return: The outcome, including the winning moves which can be replayed with KlondikeGame.apply()
+        """
+        started = time.perf_counter()
+        game = KlondikeGame(packed=game.pack())
+        path = [game.autoplay()]
+        seen = {self.position_key(game)}
+        moves, is_pruned = self._rank_moves(game, game.legal_moves())
+        candidates = [iter(moves)]
+        nodes = 0
+
+        while candidates:
+            if game.is_solvable():
+                path.append(game.solve())
+                moves = [move for moves in path for move in moves]
+                return SolverResult(SolverStatus.Solved, moves, nodes, time.perf_counter() - started)
+
+            move = next(candidates[-1], None)
+            if move is None:
+                candidates.pop()
+                if len(path) > 1:
+                    self._take_back(game, path.pop())
+                continue
+
+            if self.max_nodes is not None and nodes >= self.max_nodes or \
+                    self.max_seconds is not None and nodes % 1000 == 0 and \
+                    time.perf_counter() - started >= self.max_seconds:
+                return SolverResult(SolverStatus.BudgetExceeded, [], nodes, time.perf_counter() - started)
+
+            moves = self._play(game, move)
+            nodes += 1
+            key = self.position_key(game)
+            if key in seen:
+                self._take_back(game, moves)
+                continue
+            seen.add(key)
+            path.append(moves)
+            moves, is_split_pruned = self._rank_moves(game, game.legal_moves())
+            is_pruned = is_pruned or is_split_pruned
+            candidates.append(iter(moves))
+
+        status = SolverStatus.NotFound if is_pruned else SolverStatus.Unsolvable
+        return SolverResult(status, [], nodes, time.perf_counter() - started)
+
+
+def pack_moves(moves: List[Move]) -> bytes:
+    """
+    Packs moves into 4 bytes each, so solutions can be passed between processes and stored compactly.  Foundation
+    origins are packed as their suit number.
+    :param moves: The moves
+    :return: The packed moves
+    """
+    packed = bytearray()
+    for move in moves:
+        origin = SUITS.index(move.origin) if move.kind == MoveType.FoundationToTableau else move.origin
+        packed.extend(NO_FIELD if value is None else value
+                      for value in (move.kind.value, origin, move.card_num, move.destination))
+    return bytes(packed)
+
+
+def unpack_moves(packed: bytes) -> List[Move]:
+    """
+    :param packed: Moves previously packed by pack_moves()
+    :return: The moves
+    """
+    moves = []
+    for position in range(0, len(packed), PACKED_MOVE_SIZE):
+        kind, origin, card_num, destination = (None if value == NO_FIELD else value
+                                               for value in packed[position:position + PACKED_MOVE_SIZE])
+        kind = MoveType(kind)
+        if kind == MoveType.FoundationToTableau:
+            origin = SUITS[origin]
+        moves.append(Move(kind, origin, card_num, destination))
+    return moves
+
+
+def solve(game: KlondikeGame, max_nodes: int = DEFAULT_MAX_NODES, max_seconds: float = None) -> SolverResult:
+    """Convenience wrapper around KlondikeSolver(max_nodes, max_seconds).solve(game)"""
+    return KlondikeSolver(max_nodes, max_seconds).solve(game)
@@ -1,78 +1,255 @@
-from typing import List, NoReturn
+from typing import AbstractSet, Dict, Iterable, Iterator, List, Mapping, NoReturn, Set, Tuple
 
-from pytience.cards.deck import Deck, Card, Pip
-from pytience.games.solitaire import CARD_VALUES
+from pytience.cards.deck import Deck, Card, pack_cards, unpack_cards, encode_cards, decode_cards, zobrist_keys, \
+    mix64, MASK64, ZobristKeys
+from pytience.games.solitaire import KING_CODES, TABLEAU_BUILDS, UndoOp
 from pytience.games.solitaire.exception import TableauCardIndexError, TableauPileIndexError, \
     TableauCardNotAvailableException, IllegalTableauBuildOrderException, ConcealedCardNotAllowedException
-from pytience.games.util import Undoable, UndoAction
+from pytience.games.util import Undoable
+
+NO_DESTINATIONS: AbstractSet[int] = frozenset()
 
 
 class Tableau(Undoable):
-    def __init__(self, size: int = 7, deck: Deck = None, tableau_dump: object = None):
+    UNDO_HANDLERS = {UndoOp.TableauGet: ('undo_get', 'redo_get'), UndoOp.TableauPut: ('undo_put', 'redo_put')}
+
+    def __init__(self, size: int = 7, deck: Deck = None, tableau_dump: object = None, packed: Tuple[bytes] = None):
+        super().__init__()
+        self._zobrist_keys: List[ZobristKeys] = []
+        self._state_hash = 0
+        self._pile_hashes: List[int] = []
+        self._destinations: Dict[int, Set[int]] = {}
+        self._wanted: List[Iterable[int]] = []
         if tableau_dump:
             self.load(tableau_dump)
+        elif packed:
+            self.unpack(packed)
         else:
-            self.piles: List[List[Card]] = [[] for _ in range(max(size, 1))]
-
-            # Cards should be dealt one per tableau pile, revealing the top card as it's dealt.
+            self.piles = [[] for _ in range(max(size, 1))]
             if deck is not None:
-                for starting_pile_num in range(len(self.piles)):
-                    for pile_num in range(starting_pile_num, len(self.piles)):
-                        card = deck.deal()
-                        if pile_num == starting_pile_num:
-                            card.reveal()
-                        self.piles[pile_num].append(card)
+                self.deal(deck)
+
+    def deal(self, deck: Deck) -> NoReturn:
+        """
+        Replace the piles with new ones dealt from the deck.  This isn't recorded in the undo log.
+        :param deck: The deck to deal from
+        """
+        piles = [[] for _ in range(len(self._piles))]
+
+        # Cards should be dealt one per tableau pile, revealing the top card as it's dealt.
+        for starting_pile_num in range(len(piles)):
+            for pile_num in range(starting_pile_num, len(piles)):
+                card = deck.deal()
+                if pile_num == starting_pile_num:
+                    card = card.revealed()
+                piles[pile_num].append(card)
+        self.piles = piles
+
+    @property
+    def piles(self) -> List[List[Card]]:
+        """
+        The piles, bottom card first.  Since the piles may be changed directly through this property, the hashes and
+        the destination index are rebuilt the next time they're needed.  Use len(), iteration or indexing on the
+        tableau itself for read-only access.
+        """
+        if True in self._is_shared:
+            self._piles = [pile.copy() for pile in self._piles]
+            self._is_shared = [False] * len(self._piles)
+        self._is_stale = True
+        return self._piles
+
+    @piles.setter
+    def piles(self, piles: List[List[Card]]):
+        self._piles = piles
+        self._is_shared = [False] * len(piles)
+        self._is_stale = True
 
-            super().__init__()
+    def _own(self, pile_num: int) -> List[Card]:
+        """
+        Get a pile to change, first copying it if it's shared with a clone.
+        Intended for internal use only.
+        :param pile_num: The pile number
+        :return: The pile
+        """
+        pile = self._piles[pile_num]
+        if self._is_shared[pile_num]:
+            pile = self._piles[pile_num] = pile.copy()
+            self._is_shared[pile_num] = False
+        return pile
 
-    def undo_put(self, pile_num: int, num_cards: int):
-        pile = self.piles[pile_num]
-        for _ in range(num_cards):
-            pile.pop()
+    def _copy(self) -> 'Tableau':
+        """
+        Copies the piles for clone().  The pile lists themselves are shared, and copied by whichever tableau changes
+        one first, while the hashes and the destination index are copied outright.
+        Intended for internal use only.
+        """
+        self._refresh()
+        # pylint: disable=protected-access
+        clone = object.__new__(type(self))
+        clone._piles = self._piles.copy()
+        clone._is_shared = [True] * len(self._piles)
+        self._is_shared = [True] * len(self._piles)
+        clone._is_stale = False
+        clone._zobrist_keys = self._zobrist_keys
+        clone._state_hash = self._state_hash
+        clone._pile_hashes = self._pile_hashes.copy()
+        clone._destinations = {code: pile_nums.copy() for code, pile_nums in self._destinations.items() if pile_nums}
+        clone._wanted = self._wanted.copy()
+        return clone
+
+    def undo_put(self, pile_num: int, num_cards: int, to_hand: int = 0):
+        """
+        :param to_hand: Move the cards back into the undo log's hand, which they came from, rather than its discards
+        """
+        self._refresh()
+        pile = self._own(pile_num)
+        cards = pile[len(pile) - num_cards:]
+        self._xor_hash(pile_num, len(pile) - num_cards, cards)
+        del pile[len(pile) - num_cards:]
+        self._index(pile_num)
+        (self.undo_log.hand if to_hand else self.undo_log.discards).extend(cards)
+
+    def redo_put(self, pile_num: int, num_cards: int, from_hand: int):
+        self._refresh()
+        if from_hand:
+            cards = self.undo_log.take(num_cards)
+        else:
+            discards = self.undo_log.discards
+            cards = discards[len(discards) - num_cards:]
+            del discards[len(discards) - num_cards:]
+        pile = self._own(pile_num)
+        self._xor_hash(pile_num, len(pile), cards)
+        pile.extend(cards)
+        self._index(pile_num)
+
+    def destinations(self, card: Card) -> AbstractSet[int]:
+        """
+        Finds every pile the card, and any cards on top of it, may be built on with a single index lookup.
+        :param card: The first card to build
+        :return: The destination pile numbers.  The set must not be changed.
+        """
+        self._refresh()
+        if card.is_concealed:
+            return NO_DESTINATIONS
+        return self._destinations.get(card.code, NO_DESTINATIONS)
+
+    @property
+    def destination_index(self) -> Mapping[int, AbstractSet[int]]:
+        """
+        The destination index itself, mapping the code of each card that may be built on the tableau to the piles that
+        would accept it, for callers looking up many cards at once.  Concealed cards can't be built regardless.
+        The index must not be changed.
+        """
+        self._refresh()
+        return self._destinations
+
+    def can_put(self, cards: List[Card], pile_num: int) -> bool:
+        """
+        Checks whether put() would accept the cards, without changing anything.
+        :param cards: The cards to build on the pile
+        :param pile_num: The destination pile
+        :return: True if the cards may be built on the pile
+        """
+        if pile_num > len(self._piles) - 1:
+            return False
+        if pile_num < 0:
+            pile_num += len(self._piles)
+        return pile_num in self.destinations(cards[0])
 
     def put(self, cards: List[Card], pile_num: int) -> NoReturn:
         if cards[0].is_concealed:
             raise ConcealedCardNotAllowedException('Concealed cards may not be built on the tableau.')
-        if pile_num > len(self.piles) - 1:
+        if pile_num > len(self._piles) - 1:
             raise TableauPileIndexError('No such tableau pile: {}'.format(pile_num))
-        pile = self.piles[pile_num]
-        if not pile:
-            if cards[0].pip == Pip.King:
-                pile.extend(cards)
-                self.undo_stack.append(UndoAction(self.undo_put, [pile_num, len(cards)]))
-                return
-            else:
+        pile = self._piles[pile_num]
+        if pile_num < 0:
+            pile_num += len(self._piles)
+        if pile_num not in self.destinations(cards[0]):
+            if not pile:
                 raise IllegalTableauBuildOrderException('Only Kings may be built on empty tableau piles.')
-        elif cards[0].color == pile[-1].color or CARD_VALUES[cards[0].pip] != CARD_VALUES[pile[-1].pip] - 1:
             raise IllegalTableauBuildOrderException(
                 'Tableau cards must be built in descending order with alternate colors')
-        else:
-            pile.extend(cards)
-            self.undo_stack.append(UndoAction(self.undo_put, [pile_num, len(cards)]))
+        from_hand = self.undo_log.holds(cards)
+        if from_hand:
+            self.undo_log.take(len(cards))
+        pile = self._own(pile_num)
+        self._xor_hash(pile_num, len(pile), cards)
+        pile.extend(cards)
+        self._index(pile_num)
+        self.undo_log.push(UndoOp.TableauPut, pile_num, len(cards), from_hand)
 
-    def undo_get(self, pile_num: int, card_strings: List[str], re_conceal: bool):
+    def undo_get(self, pile_num: int, num_cards: int, re_conceal: int):
+        """
+        Return the cards on top of the undo log's hand to the pile
+        :param re_conceal: Conceal the pile's top card first, since it was revealed by the get
+        """
+        self._refresh()
         if re_conceal:
             self._conceal(pile_num)
-        self.piles[pile_num].extend(map(Card.parse_card, card_strings))
+        cards = self.undo_log.take(num_cards)
+        pile = self._own(pile_num)
+        self._xor_hash(pile_num, len(pile), cards)
+        pile.extend(cards)
+        self._index(pile_num)
 
-    def get(self, pile_num: int, card_num: int) -> List[Card]:
+    def redo_get(self, pile_num: int, num_cards: int, reveal: int):
+        self._refresh()
+        pile = self._own(pile_num)
+        cards = pile[len(pile) - num_cards:]
+        self._xor_hash(pile_num, len(pile) - num_cards, cards)
+        del pile[len(pile) - num_cards:]
+        self.undo_log.hand.extend(cards)
+        if not (reveal and self._reveal(pile_num)):
+            self._index(pile_num)
+
+    def can_get(self, pile_num: int, card_num: int) -> bool:
+        """
+        Checks whether get() would succeed, without changing anything.
+        :param pile_num: The pile to take cards from
+        :param card_num: The index of the first card to take
+        :return: True if the card and any cards on top of it may be taken
+        """
+        if card_num is None or pile_num > len(self._piles) - 1:
+            return False
+        pile = self._piles[pile_num]
+        if card_num < 0:
+            card_num = max(len(pile) + card_num, 0)
+        return card_num < len(pile) and pile[card_num].is_revealed
+
+    def peek(self, pile_num: int, card_num: int) -> List[Card]:
+        """
+        Returns the cards that get() would take, raising the same exceptions, without removing them from the pile.
+        :param pile_num: The pile to take cards from
+        :param card_num: The index of the first card to take
+        :return: The card and any cards on top of it
+        """
         if card_num is None:
             raise TableauCardIndexError('Card num not specified')
-        if pile_num > len(self.piles) - 1:
+        if pile_num > len(self._piles) - 1:
             raise TableauPileIndexError('No such tableau pile: {}'.format(pile_num))
-        pile = self.piles[pile_num]
 
-        cards = pile[card_num:]
+        cards = self._piles[pile_num][card_num:]
         if not cards:
             raise TableauCardIndexError('No card at pile [{}][{}]'.format(pile_num, card_num))
         if cards[0].is_concealed:
             raise TableauCardNotAvailableException('Pile {} Card {} is concealed'.format(pile_num, card_num))
+        return cards
+
+    def get(self, pile_num: int, card_num: int) -> List[Card]:
+        cards = self.peek(pile_num, card_num)
+        self._refresh()
+        if pile_num < 0:
+            pile_num += len(self._piles)
 
         # chop off the end of the pile
-        for _ in range(len(cards)):
-            pile.pop()
+        pile = self._own(pile_num)
+        self._xor_hash(pile_num, len(pile) - len(cards), cards)
+        del pile[-len(cards):]
         revealed = self._reveal(pile_num)
-        self.undo_stack.append(UndoAction(self.undo_get, [pile_num, list(map(str, cards)), revealed]))
+        if not revealed:
+            self._index(pile_num)
+        self.undo_log.hand.extend(cards)
+        self.undo_log.push(UndoOp.TableauGet, pile_num, len(cards), revealed)
         return cards
 
     def _reveal(self, pile_num: int) -> bool:
@@ -82,9 +259,14 @@ class Tableau(Undoable):
         :param pile_num:
         :return: True if card was flipped, False if it was already revealed
         """
-        pile = self.piles[pile_num]
+        self._refresh()
+        pile = self._piles[pile_num]
         if pile and pile[-1].is_concealed:
-            pile[-1].reveal()
+            pile = self._own(pile_num)
+            self._xor_hash(pile_num, len(pile) - 1, pile[-1:])
+            pile[-1] = pile[-1].revealed()
+            self._xor_hash(pile_num, len(pile) - 1, pile[-1:])
+            self._index(pile_num)
             return True
         else:
             return False
@@ -96,13 +278,99 @@ class Tableau(Undoable):
         :param pile_num:
         :return: True if card was flipped, False if it was already revealed
         """
-        pile = self.piles[pile_num]
+        self._refresh()
+        pile = self._piles[pile_num]
         if pile and pile[-1].is_revealed:
-            pile[-1].conceal()
+            pile = self._own(pile_num)
+            self._xor_hash(pile_num, len(pile) - 1, pile[-1:])
+            pile[-1] = pile[-1].concealed()
+            self._xor_hash(pile_num, len(pile) - 1, pile[-1:])
+            self._index(pile_num)
             return True
         else:
             return False
 
+    @property
+    def state_hash(self) -> int:
+        """The Zobrist hash of the piles, kept up to date by every put(), get() and undo"""
+        self._refresh()
+        return self._state_hash
+
+    @property
+    def canonical_hash(self) -> int:
+        """
+        A hash of the piles that doesn't depend on their order, so positions that differ only by which pile holds
+        which cards hash equally.  It's combined from per-pile hashes, which are kept up to date like state_hash.
+        """
+        self._refresh()
+        return sum(map(mix64, self._pile_hashes)) & MASK64
+
+    def rehash(self) -> int:
+        """Recompute the hashes and the destination index of the piles from scratch"""
+        self._zobrist_keys = [zobrist_keys('tableau {}'.format(pile_num)) for pile_num in range(len(self._piles))]
+        self._state_hash = 0
+        for keys, pile in zip(self._zobrist_keys, self._piles):
+            self._state_hash ^= keys.hash(pile, track_revealed=True)
+        self._pile_hashes = [zobrist_keys('tableau').hash(pile, track_revealed=True) for pile in self._piles]
+
+        self._destinations = {}
+        self._wanted = [()] * len(self._piles)
+        for pile_num in range(len(self._piles)):
+            self._index(pile_num)
+        self._is_stale = False
+        return self._state_hash
+
+    def _refresh(self) -> NoReturn:
+        """
+        Rebuild the hashes and the destination index if the piles may have been changed directly.
+        Intended for internal use only.
+        """
+        if self._is_stale:
+            self.rehash()
+
+    def _index(self, pile_num: int) -> NoReturn:
+        """
+        Update the destination index after the top of a pile changes.  An empty pile wants any King, a revealed top
+        card wants the two cards of the other color and one rank lower, and a concealed top card wants nothing.
+        Intended for internal use only.
+        :param pile_num: The pile that changed
+        """
+        destinations = self._destinations
+        for code in self._wanted[pile_num]:
+            destinations[code].discard(pile_num)
+        pile = self._piles[pile_num]
+        if not pile:
+            wanted = KING_CODES
+        elif pile[-1].is_revealed:
+            wanted = TABLEAU_BUILDS[pile[-1].code]
+        else:
+            wanted = ()
+        for code in wanted:
+            destinations.setdefault(code, set()).add(pile_num)
+        self._wanted[pile_num] = wanted
+
+    def _xor_hash(self, pile_num: int, position: int, cards: List[Card]) -> NoReturn:
+        """
+        Add cards to, or remove them from, the hash.
+        Intended for internal use only.
+        :param pile_num: The pile holding the cards
+        :param position: The position of the first card in the pile
+        :param cards: The cards, in pile order
+        """
+        keys = self._zobrist_keys[pile_num]
+        pile_keys = zobrist_keys('tableau')
+        for card_num, card in enumerate(cards, position):
+            self._state_hash ^= keys.key(card_num, card.code, card.is_revealed)
+            self._pile_hashes[pile_num] ^= pile_keys.key(card_num, card.code, card.is_revealed)
+
+    def canonical_key(self) -> bytes:
+        """
+        A compact key for the piles that doesn't depend on their order.  Each pile is packed as its length, its
+        number of concealed cards and its card codes, and the packed piles are joined in sorted order.
+        :return: The canonical key
+        """
+        return b''.join(sorted(bytes([len(pile) - 1]) + pile for pile in self.pack()))
+
     def dump(self) -> object:
         """
         Dumps the current state of the Tableau
@@ -111,7 +379,7 @@ class Tableau(Undoable):
         return {
             "piles": [
                 list(map(str, pile))
-                for pile in self.piles
+                for pile in self._piles
             ],
             "undo_stack": self.dump_undo_stack()
         }
@@ -124,8 +392,75 @@ class Tableau(Undoable):
         self.piles = [[Card.parse_card(card_string) for card_string in pile] for pile in tableau_dump["piles"]]
         self.load_undo_stack(tableau_dump["undo_stack"])
 
+    def load_legacy_undo_action(self, action: dict) -> NoReturn:
+        args = action["args"]
+        if action["action"] == "undo_put":
+            pile_num, num_cards = args
+            self.undo_log.push(UndoOp.TableauPut, pile_num, num_cards)
+        elif action["action"] == "undo_get":
+            pile_num, card_strings, re_conceal = args
+            self.undo_log.hand.extend(map(Card.parse_card, card_strings))
+            self.undo_log.push(UndoOp.TableauGet, pile_num, len(card_strings), re_conceal)
+        else:
+            super().load_legacy_undo_action(action)
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes the piles compactly: each pile is its number of cards, one byte, followed by its cards, bottom card
+        first, as encoded by encode_cards().  The undo log is not included.
+        :return: The encoded piles
+        """
+        return b''.join(bytes([len(pile)]) + encode_cards(pile) for pile in self._piles)
+
+    def load_bytes(self, tableau_bytes: bytes) -> NoReturn:
+        """
+        Replace the piles with those previously encoded by to_bytes()
+        :param tableau_bytes: The encoded piles
+        """
+        piles = []
+        position = 0
+        while position < len(tableau_bytes):
+            end = position + 1 + tableau_bytes[position]
+            piles.append(decode_cards(tableau_bytes[position + 1:end]))
+            position = end
+        self.piles = piles
+
+    def pack(self) -> Tuple[bytes]:
+        """
+        Packs the piles into one bytes object each.  The first byte is the number of concealed cards at the bottom of
+        the pile, followed by one byte per card code.  The undo stack is not included.
+        :return: A tuple of packed piles
+        """
+        packed = []
+        for pile in self._piles:
+            num_concealed = 0
+            while num_concealed < len(pile) and pile[num_concealed].is_concealed:
+                num_concealed += 1
+            if any(card.is_concealed for card in pile[num_concealed:]):
+                raise ValueError('Concealed tableau cards must be at the bottom of the pile.')
+            packed.append(bytes([num_concealed]) + pack_cards(pile))
+        return tuple(packed)
+
+    def unpack(self, packed: Tuple[bytes]) -> NoReturn:
+        """
+        Replace the piles with those previously packed by pack()
+        :param packed: A tuple of packed piles
+        """
+        self.piles = [
+            unpack_cards(pile[1:pile[0] + 1]) + unpack_cards(pile[pile[0] + 1:], is_revealed=True)
+            for pile in packed
+        ]
+
     def __repr__(self):
-        return str([len(p) for p in self.piles])
+        return str([len(p) for p in self._piles])
 
     def __len__(self):
-        return len(self.piles)
+        return len(self._piles)
+
+    def __getitem__(self, pile_num: int) -> List[Card]:
+        """Read-only access to a pile, bottom card first.  Change piles through the piles property."""
+        return self._piles[pile_num]
+
+    def __iter__(self) -> Iterator[List[Card]]:
+        """Read-only access to the piles.  Change piles through the piles property."""
+        return iter(self._piles)
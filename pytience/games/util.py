@@ -1,42 +1,511 @@
-from typing import List, Callable, NoReturn, Any
-from dataclasses import dataclass, field
+from abc import ABC, abstractmethod
+import sys
+from array import array
+from base64 import b64decode, b64encode
+from struct import Struct
+from typing import Callable, Dict, List, Mapping, NoReturn, Optional, Tuple
 
+from pytience.cards.deck import Card, decode_cards, encode_cards
 
-@dataclass
-class UndoAction:
-    function: Callable
-    args: List[Any] = field(default_factory=list)
+# Each undo record is RECORD_SIZE unsigned 2-byte fields: op, pile, count and flag, so piles of wide tableaus fit.  The
+# STEP_START bit of the op marks the first record of an undo step.  Records are encoded little-endian.
+RECORD_SIZE = 4
+RECORD_TYPECODE = 'H'
+STEP_START = 0x80
 
-    def dump(self):
-        return {'action': self.function.__name__, 'args': self.args}
+# The cursor, the number of folded steps, and the number of cards in the hand and the discards, in UndoLog.to_bytes()
+_UNDO_LOG_HEADER = Struct('<IIHH')
+# The ops that don't start a step, deleted from a log's ops to count its steps
+_STEP_CONTINUATION_OPS = bytes(range(STEP_START))
+# The attributes of a loaded log that are decoded the first time it's used
+_DECODED_ATTRIBUTES = frozenset({'records', 'hand', 'discards', '_num_steps', '_num_redo_steps'})
 
-    def __call__(self, *_, **__):
-        self.function(*self.args)
 
+def _encode_records(records: array) -> bytes:
+    """Encode records little-endian, whatever the platform's byte order"""
+    if sys.byteorder == 'big':  # pragma: no cover
+        records = records[:]
+        records.byteswap()
+    return records.tobytes()
+
+
+def _decode_records(records_bytes: bytes) -> array:
+    """Decode records encoded by _encode_records()"""
+    records = array(RECORD_TYPECODE, records_bytes)
+    if sys.byteorder == 'big':  # pragma: no cover
+        records.byteswap()
+    return records
+
+
+class UndoLog:
+    """
+    A compact log of the changes made to one or more Undoable objects, which may share it.  Each change is a fixed-size
+    record of (op, pile, count, flag) in an array, and the records for one user-level move form a single undo step.
+    Records hold no cards.  Cards taken from a pile are kept in the hand, which is where the next put finds them, and
+    undoing a put moves its cards back into the hand for the matching get to return to their pile.
+
+    Undone steps stay in the log after a cursor, so they can be redone until a new change is recorded.  Snapshots of
+    the full state may be stored as checkpoints every checkpoint_interval steps, to jump through long histories.
+
+    With a max_depth, the oldest steps are folded away once there are more than max_depth of them, so the log stays the
+    same size however long it runs.  Steps are folded up to the oldest checkpoint that keeps no more than max_depth
+    steps, which becomes the start of the history, or one at a time when there is no such checkpoint.  Steps are
+    numbered from the start of the whole history, including the folded steps.
+
+    A loaded log keeps what it was loaded from, and only decodes its records and cards the first time it's used, so
+    resuming a game costs the same however long its history is.  Until then, dump() and to_bytes() return what was
+    loaded.
+    """
+
+    def __init__(self, checkpoint_interval: int = 64, max_depth: Optional[int] = None):
+        self.records = array(RECORD_TYPECODE)
+        self.hand: List[Card] = []
+        # Cards removed by undoing puts that didn't come from the hand, kept for redoing them
+        self.discards: List[Card] = []
+        self.checkpoint_interval = checkpoint_interval
+        self.max_depth = max_depth
+        self._handlers: Dict[int, Tuple[Callable[[int, int, int], NoReturn], Callable[[int, int, int], NoReturn]]] = {}
+        self._cursor = 0
+        self._num_steps = 0
+        self._num_redo_steps = 0
+        self._num_folded_steps = 0
+        self._checkpoints: Dict[int, Tuple[int, object]] = {}
+        self._depth = 0
+        self._is_step_open = False
+
+    def __getattr__(self, name: str):
+        """Decode a loaded log the first time one of the decoded attributes is needed"""
+        if name in _DECODED_ATTRIBUTES and '_encoded' in self.__dict__:
+            self._decode()
+            return self.__dict__[name]
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def register(self, op: int, undo_handler: Callable[[int, int, int], NoReturn],
+                 redo_handler: Callable[[int, int, int], NoReturn]) -> NoReturn:
+        """
+        Set the functions that undo and redo records of an op.
+        :param op: The op, from 0 to 127
+        :param undo_handler: Called with the pile, count and flag of each record to undo
+        :param redo_handler: Called with the pile, count and flag of each record to redo
+        """
+        self._handlers[op] = (undo_handler, redo_handler)
+
+    def push(self, op: int, pile: int = 0, count: int = 0, flag: int = 0) -> NoReturn:
+        """
+        Record a change, dropping any undone steps.  Outside of a group(), each record is an undo step of its own.
+        :param op: The op, from 0 to 127
+        :param pile: The pile that changed, from 0 to 65535
+        :param count: The number of cards or points involved, from 0 to 65535
+        :param flag: Any other detail needed to undo the change, from 0 to 65535
+        """
+        if self._num_redo_steps:
+            self._truncate()
+        if not self._is_step_open:
+            if self.max_depth is not None and self._num_steps >= self.max_depth:
+                self._fold()
+            op |= STEP_START
+            self._num_steps += 1
+            self._is_step_open = self._depth > 0
+        self.records.extend((op, pile, count, flag))
+        self._cursor += RECORD_SIZE
+
+    def _truncate(self) -> NoReturn:
+        """
+        Drop the undone steps, and the checkpoints taken after the cursor.
+        Intended for internal use only.
+        """
+        interval = self.checkpoint_interval
+        step = self.step
+        for checkpoint_step in range(step - step % interval + interval, step + self._num_redo_steps + 1, interval):
+            self._checkpoints.pop(checkpoint_step, None)
+        del self.records[self._cursor:]
+        self.discards.clear()
+        self._num_redo_steps = 0
+
+    def _fold(self) -> NoReturn:
+        """
+        Drop the oldest steps to make room for a new one, up to the oldest checkpoint that leaves fewer than max_depth
+        steps, or just enough steps to leave max_depth - 1 when there isn't one.
+        Intended for internal use only.
+        """
+        step = self.step
+        base_step = step - max(self.max_depth, 1) + 1
+        interval = self.checkpoint_interval
+        for checkpoint_step in range(base_step + -base_step % interval, step + 1, interval):
+            if checkpoint_step in self._checkpoints:
+                base_step = checkpoint_step
+                break
+        records = self.records
+        num_folded_steps = base_step - self._num_folded_steps
+        cursor = 0
+        while num_folded_steps:
+            cursor += RECORD_SIZE
+            if cursor == self._cursor or records[cursor] & STEP_START:
+                num_folded_steps -= 1
+        del records[:cursor]
+        self._cursor -= cursor
+        self._num_steps = step - base_step
+        self._num_folded_steps = base_step
+        self._checkpoints = {checkpoint_step: (checkpoint_cursor - cursor, state)
+                             for checkpoint_step, (checkpoint_cursor, state) in self._checkpoints.items()
+                             if checkpoint_step >= base_step}
+
+    def group(self) -> 'UndoLog':
+        """
+        Use in a with statement to record every change made within the block, including those in nested groups, as a
+        single undo step.  The log is its own context manager, since a generator-based one costs more than most moves.
+        """
+        return self
+
+    def __enter__(self) -> 'UndoLog':
+        if self._depth == 0:
+            self._is_step_open = False
+        self._depth += 1
+        return self
+
+    def __exit__(self, *_):
+        self._depth -= 1
+        if self._depth == 0:
+            self._is_step_open = False
+
+    def undo(self) -> bool:
+        """
+        Undo the records of the last step, newest first
+        :return: True if there was a step to undo
+        """
+        records = self.records
+        cursor = self._cursor
+        while cursor:
+            cursor -= RECORD_SIZE
+            op, pile, count, flag = records[cursor:cursor + RECORD_SIZE]
+            self._cursor = cursor
+            self._handlers[op & ~STEP_START][0](pile, count, flag)
+            if op & STEP_START:
+                self._num_steps -= 1
+                self._num_redo_steps += 1
+                return True
+        return False
+
+    def redo(self) -> bool:
+        """
+        Redo the records of the last step undone, oldest first
+        :return: True if there was a step to redo
+        """
+        if not self._num_redo_steps:
+            return False
+        records = self.records
+        cursor = self._cursor
+        end = len(records)
+        while True:
+            op, pile, count, flag = records[cursor:cursor + RECORD_SIZE]
+            cursor += RECORD_SIZE
+            self._cursor = cursor
+            self._handlers[op & ~STEP_START][1](pile, count, flag)
+            if cursor == end or records[cursor] & STEP_START:
+                break
+        self._num_steps += 1
+        self._num_redo_steps -= 1
+        return True
+
+    @property
+    def num_redo_steps(self) -> int:
+        """The number of undone steps that may be redone"""
+        return self._num_redo_steps
+
+    @property
+    def num_folded_steps(self) -> int:
+        """The number of steps folded away to keep within max_depth, which can no longer be undone"""
+        return self._num_folded_steps
+
+    @property
+    def step(self) -> int:
+        """The number of steps taken from the start of the history, including the folded steps"""
+        return self._num_folded_steps + self._num_steps
+
+    @property
+    def is_checkpoint_due(self) -> bool:
+        """Checks whether the state between steps should be stored with checkpoint() before the next step starts"""
+        step = self.step
+        return not self._depth and not step % self.checkpoint_interval and step not in self._checkpoints
+
+    def checkpoint(self, state: object) -> NoReturn:
+        """
+        Store a snapshot of the full state as it is after the current step.
+        :param state: Any object that restores the state, such as a packed position
+        """
+        self._checkpoints[self.step] = (self._cursor, state)
+
+    def nearest_checkpoint(self, step: int) -> Optional[int]:
+        """
+        :param step: The step to seek
+        :return: The step of the latest checkpoint at or before the given step, or None if there isn't one
+        """
+        for checkpoint_step in range(step - step % self.checkpoint_interval, self._num_folded_steps - 1,
+                                     -self.checkpoint_interval):
+            if checkpoint_step in self._checkpoints:
+                return checkpoint_step
+        return None
+
+    def restore_checkpoint(self, step: int) -> object:
+        """
+        Move the cursor to a checkpoint without undoing or redoing anything.  The caller must restore the state.
+        :param step: The step of the checkpoint, as returned by nearest_checkpoint()
+        :return: The state stored by checkpoint()
+        """
+        self._cursor, state = self._checkpoints[step]
+        self._num_redo_steps += self.step - step
+        self._num_steps = step - self._num_folded_steps
+        self.hand.clear()
+        self.discards.clear()
+        return state
+
+    def take(self, count: int) -> List[Card]:
+        """
+        Remove cards from the top of the hand.
+        :param count: The number of cards
+        :return: The cards, in the order they were added
+        """
+        cards = self.hand[len(self.hand) - count:]
+        del self.hand[len(self.hand) - count:]
+        return cards
+
+    def holds(self, cards: List[Card]) -> bool:
+        """Checks whether the cards are the ones on top of the hand"""
+        hand = self.hand
+        return len(hand) >= len(cards) and all(a is b for a, b in zip(hand[len(hand) - len(cards):], cards))
+
+    def clear(self) -> NoReturn:
+        """Forget every record and checkpoint, and any cards in the hand"""
+        if self.__dict__.pop('_encoded', None) is None:
+            del self.records[:]
+            self.hand.clear()
+            self.discards.clear()
+        else:
+            self.records = array(RECORD_TYPECODE)
+            self.hand = []
+            self.discards = []
+        self._checkpoints.clear()
+        self._cursor = 0
+        self._num_steps = 0
+        self._num_redo_steps = 0
+        self._num_folded_steps = 0
+
+    def clone(self) -> 'UndoLog':
+        """
+        Copies the records, the hand, the discards and the checkpoints, but not the handlers, which the copy's
+        Undoable objects register when they join it.
+        :return: The new log
+        """
+        # pylint: disable=protected-access
+        clone = object.__new__(UndoLog)
+        clone.__dict__.update(self.__dict__)
+        if '_encoded' not in self.__dict__:
+            clone.records = self.records[:]
+            clone.hand = self.hand.copy()
+            clone.discards = self.discards.copy()
+        clone._handlers = {}
+        clone._checkpoints = self._checkpoints.copy()
+        return clone
+
+    def __len__(self) -> int:
+        """The number of undo steps"""
+        return self._num_steps
+
+    def dump(self) -> object:
+        """
+        Dumps the records, including any undone ones, the cursor, the number of folded steps and the cards in the hand.
+        Checkpoints aren't included.
+        :return: A JSON-ready object
+        """
+        encoded = self.__dict__.get('_encoded')
+        if isinstance(encoded, dict):
+            return {
+                "records": encoded["records"],
+                "cursor": self._cursor,
+                "folded": self._num_folded_steps,
+                "hand": list(encoded["hand"]),
+                "discards": list(encoded.get("discards", list()))
+            }
+        return {
+            "records": b64encode(_encode_records(self.records)).decode('ascii'),
+            "cursor": self._cursor,
+            "folded": self._num_folded_steps,
+            "hand": list(map(str, self.hand)),
+            "discards": list(map(str, self.discards))
+        }
+
+    def load(self, undo_log_dump: object) -> NoReturn:
+        """
+        Replace the records and the hand with those previously exported by dump(), which are decoded when the log is
+        first used.  Handlers are kept.
+        :param undo_log_dump: An object previously exported by dump()
+        """
+        self.clear()
+        self._num_folded_steps = undo_log_dump.get("folded", 0)
+        if "cursor" in undo_log_dump:
+            self._cursor = undo_log_dump["cursor"]
+            self._defer(undo_log_dump)
+        else:
+            self._decode_dump(undo_log_dump)
+            self._cursor = len(self.records)
+            self._count_steps()
+
+    def to_bytes(self) -> bytes:
+        """
+        Encodes what dump() exports compactly: the cursor and the number of folded steps as 4-byte integers, the number
+        of cards in the hand and the discards as 2-byte integers, the cards themselves as encoded by encode_cards(), and
+        the records, as 2-byte integers.  Checkpoints aren't included.
+        :return: The encoded log
+        """
+        encoded = self.__dict__.get('_encoded')
+        if isinstance(encoded, bytes):
+            return encoded
+        return _UNDO_LOG_HEADER.pack(self._cursor, self._num_folded_steps, len(self.hand), len(self.discards)) + \
+            encode_cards(self.hand) + encode_cards(self.discards) + _encode_records(self.records)
+
+    def load_bytes(self, undo_log_bytes: bytes) -> NoReturn:
+        """
+        Replace the records and the hand with those previously encoded by to_bytes(), which are decoded when the log
+        is first used.  Handlers are kept.
+        :param undo_log_bytes: The encoded log
+        """
+        self.clear()
+        self._cursor, self._num_folded_steps, _, _ = _UNDO_LOG_HEADER.unpack_from(undo_log_bytes)
+        self._defer(bytes(undo_log_bytes))
+
+    def _defer(self, encoded: object) -> NoReturn:
+        """
+        Drop the decoded attributes, leaving them to be decoded from what the log was loaded from when it's first used.
+        Intended for internal use only.
+        :param encoded: An object exported by dump(), or bytes encoded by to_bytes()
+        """
+        for name in _DECODED_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+        self._encoded = encoded
+
+    def _decode(self) -> NoReturn:
+        """
+        Decode the records and the cards of a loaded log, and count its steps.
+        Intended for internal use only.
+        """
+        encoded = self.__dict__.pop('_encoded')
+        if isinstance(encoded, bytes):
+            _, _, hand_size, num_discards = _UNDO_LOG_HEADER.unpack_from(encoded)
+            position = _UNDO_LOG_HEADER.size
+            self.hand = decode_cards(encoded[position:position + hand_size])
+            position += hand_size
+            self.discards = decode_cards(encoded[position:position + num_discards])
+            position += num_discards
+            self.records = _decode_records(encoded[position:])
+        else:
+            self._decode_dump(encoded)
+        self._count_steps()
+
+    def _decode_dump(self, undo_log_dump: object) -> NoReturn:
+        """
+        Decode the records and the cards exported by dump().
+        Intended for internal use only.
+        """
+        self.records = _decode_records(b64decode(undo_log_dump["records"]))
+        self.hand = list(map(Card.parse_card, undo_log_dump["hand"]))
+        self.discards = list(map(Card.parse_card, undo_log_dump.get("discards", list())))
+
+    def _count_steps(self) -> NoReturn:
+        """
+        Count the steps before and after the cursor of newly loaded records.
+        Intended for internal use only.
+        """
+        ops = array('B', self.records[::RECORD_SIZE]).tobytes()
+        num_steps = len(ops[:self._cursor // RECORD_SIZE].translate(None, _STEP_CONTINUATION_OPS))
+        self._num_steps = num_steps
+        self._num_redo_steps = len(ops.translate(None, _STEP_CONTINUATION_OPS)) - num_steps
+
+
+class Undoable(ABC):
+    # Maps each undo op to the names of the methods that undo and redo it
+    UNDO_HANDLERS: Mapping[int, Tuple[str, str]] = {}
 
-class Undoable:
     def __init__(self):
-        self.undo_stack: List[Callable] = []
+        self.join_undo_log(UndoLog())
+        self.owns_undo_log = True
+
+    def join_undo_log(self, undo_log: UndoLog) -> NoReturn:
+        """
+        Record changes in another object's log from now on, so they can be undone together with that object's changes.
+        The current log is dropped, and the log is left out of dumps, which are expected to come from its owner.
+        :param undo_log: The log to share
+        """
+        self.undo_log = undo_log
+        self.owns_undo_log = False
+        for op, (undo_name, redo_name) in self.UNDO_HANDLERS.items():
+            undo_log.register(op, getattr(self, undo_name), getattr(self, redo_name))
+
+    @property
+    def undo_stack(self) -> UndoLog:
+        """The undo log, whose length is the number of undo steps"""
+        return self.undo_log
+
+    def undo(self) -> bool:
+        """
+        Undo the last step in the undo log
+        :return: True if there was a step to undo
+        """
+        return self.undo_log.undo()
+
+    def redo(self) -> bool:
+        """
+        Redo the last step undone, unless something was changed since
+        :return: True if there was a step to redo
+        """
+        return self.undo_log.redo()
+
+    def clone(self, with_undo_log: bool = True) -> 'Undoable':
+        """
+        Copies the object without dumping or deep copying it.  Cards are shared, and piles are shared until either
+        copy changes them.
+        :param with_undo_log: Give the copy a copy of the undo log, so it can undo and redo the same moves.  Otherwise
+        the copy starts with an empty log, which is cheaper for searches that only need the position.
+        :return: The new object, with its own undo log
+        """
+        clone = self._copy()
+        undo_log = self.undo_log
+        clone.join_undo_log(undo_log.clone() if with_undo_log else UndoLog(undo_log.checkpoint_interval,
+                                                                           undo_log.max_depth))
+        clone.owns_undo_log = True
+        return clone
 
-    def undo(self) -> NoReturn:
-        """Undo the last event on the undo stack"""
-        if self.undo_stack:
-            undo_action = self.undo_stack.pop()
-            undo_action()
+    @abstractmethod
+    def _copy(self) -> 'Undoable':
+        """
+        Copies everything but the undo log for clone().
+        Intended for internal use only.
+        """
 
     def dump_undo_stack(self) -> object:
         """
-        Creates a serialization-friendly representation of the undo stack using
-        function names and args instead of partials
-        :return: A language-agnostic object representing the undo stack
+        Creates a serialization-friendly representation of the undo log
+        :return: A JSON-ready object, or None if the log belongs to another object
+        """
+        return self.undo_log.dump() if self.owns_undo_log else None
+
+    def load_undo_stack(self, undo_stack: object) -> NoReturn:
+        """
+        Replace the undo log with one exported by dump_undo_stack(), or with one converted from the list of
+        {'action', 'args'} dicts that earlier versions exported.
+        :param undo_stack: The exported undo log.  None leaves the log as it is.
         """
-        return [action.dump() for action in self.undo_stack]
+        if undo_stack is None:
+            return
+        if isinstance(undo_stack, list):
+            self.undo_log.clear()
+            for action in undo_stack:
+                self.load_legacy_undo_action(action)
+        else:
+            self.undo_log.load(undo_stack)
 
-    def load_undo_stack(self, undo_stack) -> NoReturn:
+    def load_legacy_undo_action(self, action: dict) -> NoReturn:
         """
-        Turn a list of lists of serialized functions from `export_undo_stack` into partials.
-        Since the function_names are relative to self, care must be made not to create UndoActions with
-        function calls outside the current class
-        :param undo_stack: A list of serialized UndoAction object from dump_undo_stack()
+        Append the records equivalent to one undo action exported by earlier versions.
+        :param action: An {'action', 'args'} dict
         """
-        self.undo_stack = [UndoAction(getattr(self, action['action']), action['args']) for action in undo_stack]
+        raise ValueError('Unknown undo action: {}'.format(action.get('action')))
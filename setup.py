@@ -19,12 +19,18 @@ setup(
     author_email='james.boehmer@jamesboehmer.com',
     description='A collection of patience solitaire card games.',
     entry_points={
-        'console_scripts': ['klondike = pytience.cmd.klondike:play']
+        'console_scripts': [
+            'klondike = pytience.cmd.klondike:play',
+            'klondike-classify = pytience.cmd.classify:main'
+        ]
     },
     long_description=long_description,
     long_description_content_type="text/markdown",
     python_requires='>=3.7',
     install_requires=requirements,
+    extras_require={
+        'batch': ['numpy']
+    },
     tests_require=test_requirements,
     test_suite='nose.collector',
     classifiers=[
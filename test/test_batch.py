@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pytience.cards.batch import random_deal_numbers, deal_decks, shuffled_decks, klondike_deal_order, \
+    klondike_layouts, klondike_packed
+from pytience.cards.deck import MAX_DEAL_NUMBER, deal_permutation
+from pytience.games.solitaire.klondike import KlondikeGame
+
+
+class BatchTestCase(TestCase):
+    def test_deal_decks(self):
+        deal_numbers = np.array([0, 1, 12345, MAX_DEAL_NUMBER], dtype=np.uint64)
+        decks = deal_decks(deal_numbers)
+        self.assertEqual((4, 52), decks.shape, "There should be one row of 52 cards per deal number")
+        self.assertEqual(np.uint8, decks.dtype, "Card codes should be uint8")
+        for deal_number, deck in zip(deal_numbers, decks):
+            self.assertEqual(deal_permutation(int(deal_number)), deck.tolist(),
+                             "Batch deal {} should match deal_permutation".format(deal_number))
+
+    def test_shuffled_decks(self):
+        deal_numbers, decks = shuffled_decks(100, seed=42)
+        self.assertEqual((100,), deal_numbers.shape, "There should be one deal number per deck")
+        self.assertEqual(np.uint64, deal_numbers.dtype, "Deal numbers should be uint64")
+        self.assertTrue(np.array_equal(deal_numbers, random_deal_numbers(100, seed=42)),
+                        "The same seed should give the same deal numbers")
+        self.assertTrue(np.array_equal(decks, shuffled_decks(100, seed=42)[1]),
+                        "The same seed should give the same decks")
+        self.assertFalse(np.array_equal(decks, shuffled_decks(100, seed=43)[1]),
+                         "Different seeds should give different decks")
+        self.assertTrue((np.sort(decks, axis=1) == np.arange(52)).all(), "Every deck should hold each card once")
+
+    def test_klondike_deal_order(self):
+        self.assertEqual([0], klondike_deal_order(1).tolist(), "A single pile gets the top card")
+        self.assertEqual([0, 1, 3, 2, 4, 5], klondike_deal_order(3).tolist(),
+                         "Cards should be dealt one per pile, one pile further right each round")
+        self.assertEqual(28, len(klondike_deal_order()), "The Klondike tableau should hold 28 cards")
+
+    def test_klondike_layouts(self):
+        deal_numbers, decks = shuffled_decks(20, seed=1)
+        tableau, stock = klondike_layouts(decks)
+        self.assertEqual((20, 28), tableau.shape, "Each tableau should hold 28 cards")
+        self.assertEqual((20, 24), stock.shape, "Each stock should hold 24 cards")
+        for deal_number, tableau_row, stock_row in zip(deal_numbers, tableau, stock):
+            self.assertEqual(KlondikeGame(deal_number=int(deal_number)).pack(), klondike_packed(tableau_row, stock_row),
+                             "Batch layout of deal {} should match KlondikeGame".format(deal_number))
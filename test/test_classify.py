@@ -0,0 +1,56 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from pytience.cmd.classify import classify, classify_range, pending_ranges, main
+from pytience.games.solitaire.klondike import KlondikeGame
+from pytience.games.solitaire.solver import SolverStatus, unpack_moves
+
+
+class ClassifyTestCase(TestCase):
+    def test_classify_range(self):
+        results = classify_range((3, 6), max_nodes=500)
+        self.assertListEqual([result[0] for result in results], [3, 4, 5])
+        for deal_number, status, nodes, _, moves in results:
+            self.assertLessEqual(nodes, 500)
+            if status == SolverStatus.Solved.value:
+                klondike = KlondikeGame(deal_number=deal_number)
+                for move in unpack_moves(moves):
+                    klondike.apply(move)
+                self.assertTrue(klondike.is_solved(), "Packed solutions should replay.")
+            else:
+                self.assertEqual(moves, b'')
+
+    def test_pending_ranges(self):
+        self.assertListEqual(list(pending_ranges(0, 10, set(), 4)), [(0, 4), (4, 8), (8, 10)])
+        self.assertListEqual(list(pending_ranges(0, 10, {0, 1, 5, 9}, 4)), [(2, 5), (6, 9)],
+                             "Done deals should be skipped.")
+        self.assertListEqual(list(pending_ranges(5, 5, set())), [])
+
+    def test_classify(self):
+        with TemporaryDirectory() as directory:
+            output = Path(directory).joinpath('deals.jsonl')
+            counts = classify(0, 6, output, max_nodes=300, workers=2, chunk_size=2)
+            self.assertEqual(sum(counts.values()), 6)
+            with open(output) as f:
+                records = [json.loads(line) for line in f]
+            self.assertListEqual(sorted(record["deal_number"] for record in records), list(range(6)))
+            self.assertTrue(all(record["status"] in SolverStatus.__members__ for record in records))
+
+            # Drop the last two results and leave half a line, as an interrupted run would
+            with open(output) as f:
+                lines = f.readlines()
+            with open(output, 'w') as f:
+                f.writelines(lines[:4])
+                f.write(lines[4][:10])
+            counts = classify(0, 8, output, max_nodes=300, workers=1, resume=True)
+            self.assertEqual(sum(counts.values()), 4, "Resuming should only classify the missing deals.")
+            with open(output) as f:
+                resumed = [json.loads(line) for line in f]
+            self.assertListEqual(sorted(record["deal_number"] for record in resumed), list(range(8)))
+            self.assertListEqual(resumed[:4], records[:4], "Resuming should keep the earlier results.")
+
+            main(['8', '9', '-o', str(output), '-n', '100', '-w', '1', '-r'])
+            with open(output) as f:
+                self.assertEqual(len(f.readlines()), 9)
@@ -2,7 +2,8 @@ from collections import Counter
 from itertools import product
 from unittest import TestCase
 
-from pytience.cards.deck import Deck, Pip, Suit, Color, Card
+from pytience.cards.deck import Deck, Pip, Suit, Color, Card, CARD_IDENTITIES, JOKER_CODE, pack_cards, unpack_cards, \
+    PARSED_CARD_STRINGS, MAX_DEAL_NUMBER, deal_permutation, Shoe, encode_cards, decode_cards
 from pytience.cards.exception import NoCardsRemainingException
 
 
@@ -164,6 +165,17 @@ class DeckTestCase(TestCase):
             self.assertIsNone(card.suit, "Joker should have no suit")
             self.assertEqual(card.is_revealed, revealed, "The parsed card should have the correct reveal state.")
 
+    def test_card_strings(self):
+        self.assertEqual(len(PARSED_CARD_STRINGS), 106, "There should be a string for every revealed/concealed card.")
+        for card_string, (code, revealed) in PARSED_CARD_STRINGS.items():
+            card = Card.parse_card(card_string)
+            self.assertEqual(card.code, code)
+            self.assertEqual(card.is_revealed, revealed)
+            self.assertEqual(str(card), card_string, "Card strings should survive a round trip.")
+        for card_string in ("", "|", "1♣", "A", "A♣♣", "||A♣"):
+            with self.assertRaises(ValueError, msg="Invalid card strings should raise an exception."):
+                Card.parse_card(card_string)
+
     def test_dump(self):
         deck = Deck().shuffle()
         cards = list(map(str, deck.cards))
@@ -183,3 +195,145 @@ class DeckTestCase(TestCase):
         self.assertEqual(deck.num_jokers, dump["num_jokers"])
         self.assertEqual(deck.is_shuffled, dump["is_shuffled"])
 
+    def test_card_codes(self):
+        self.assertEqual(len(CARD_IDENTITIES), 53, "There should be exactly 53 card identities including the joker.")
+        for code, identity in enumerate(CARD_IDENTITIES):
+            self.assertEqual(identity.code, code, "Card identities should be indexed by their code.")
+            for revealed in (True, False):
+                card = Card.from_code(code, revealed)
+                self.assertEqual(card.code, code, "A card created from a code should have the same code.")
+                self.assertIs(card.identity, identity, "Card identities should be interned.")
+                self.assertEqual(card.is_revealed, revealed, "A card created from a code should keep its state.")
+        self.assertEqual(Card(None, None).code, JOKER_CODE, "The joker should have the joker code.")
+        self.assertEqual(Card(Pip.Ace, Suit.Spades).identity.rank, 1, "Aces should have rank 1.")
+        self.assertEqual(Card(Pip.King, Suit.Hearts).identity.rank, 13, "Kings should have rank 13.")
+        self.assertEqual(str(Card(Pip.Ten, Suit.Clubs).identity), "10♣")
+
+    def test_pack(self):
+        deck = Deck(num_jokers_per_deck=1).shuffle()
+        packed = deck.pack()
+        self.assertEqual(len(packed), 53, "Packed decks should use one byte per card.")
+        self.assertEqual(packed, pack_cards(deck.cards))
+        for card, revealed_card in zip(deck.cards, unpack_cards(packed, is_revealed=True)):
+            self.assertEqual(card.code, revealed_card.code)
+            self.assertTrue(revealed_card.is_revealed)
+
+        unpacked = Deck(packed=packed)
+        self.assertListEqual(list(map(str, deck.cards)), list(map(str, unpacked.cards)),
+                             "Unpacked decks should have the same cards in the same order.")
+        self.assertTrue(all(card.is_concealed for card in unpacked.cards), "Unpacked deck cards should be concealed.")
+
+        deck = Deck(num_decks=2)
+        self.assertEqual(len(set(map(id, deck.cards))), 104, "Multiple decks should not share card objects.")
+
+    def test_to_bytes(self):
+        cards = [Card.parse_card(card_string) for card_string in ('A♠', '|10♥', 'K♦', '|Q♣')]
+        encoded = encode_cards(cards)
+        self.assertEqual(len(encoded), 4, "Encoded cards should use one byte per card.")
+        decoded = decode_cards(encoded)
+        self.assertListEqual(list(map(str, decoded)), list(map(str, cards)), "Decoding should keep concealment.")
+
+        for deck_class in Deck, Shoe:
+            deck = deck_class(num_decks=2, num_jokers_per_deck=1, seed=5).shuffle()
+            deck.deal()
+            loaded = Deck(packed=b'')
+            loaded.load_bytes(deck.to_bytes())
+            self.assertEqual(len(deck.to_bytes()), 5 + 2 * 53 - 1)
+            self.assertEqual(loaded.pack(), deck.pack(), "Loaded decks should have the same cards in the same order.")
+            self.assertEqual((loaded.num_decks, loaded.num_jokers, loaded.is_shuffled), (2, 1, True))
+            self.assertEqual(loaded.state_hash, deck.state_hash, "Loading should rehash the deck.")
+
+        for deck in Shoe(num_decks=300, seed=5).shuffle(), Deck(num_jokers_per_deck=300):
+            loaded = Shoe(packed=b'')
+            loaded.load_bytes(deck.to_bytes())
+            self.assertEqual(loaded.pack(), deck.pack(), "Large shoes should be encoded.")
+            self.assertEqual((loaded.num_decks, loaded.num_jokers), (deck.num_decks, deck.num_jokers))
+
+    def test_state_hash(self):
+        deck = Deck().shuffle()
+        original_hash = deck.state_hash
+        self.assertEqual(original_hash, Deck(packed=deck.pack()).state_hash, "Equal decks should hash equally.")
+        card = deck.deal()
+        self.assertNotEqual(deck.state_hash, original_hash, "Dealing should change the hash.")
+        self.assertEqual(deck.state_hash, Deck(packed=deck.pack()).state_hash, "Dealing should update the hash.")
+        deck.undeal(card)
+        self.assertEqual(deck.state_hash, original_hash, "Undealing should restore the hash.")
+        cards = list(deck.deal_all())
+        self.assertEqual(deck.state_hash, 0, "Empty decks should hash to 0.")
+        deck.replenish(cards)
+        self.assertEqual(deck.state_hash, original_hash, "Replenishing should update the hash.")
+        deck.cards.rotate()
+        self.assertEqual(deck.state_hash, original_hash, "Changing the cards directly doesn't update the hash.")
+        self.assertNotEqual(deck.rehash(), original_hash, "Rehashing should pick up direct changes.")
+
+    def test_seed(self):
+        first, second = Deck(seed=42).shuffle(), Deck(seed=42).shuffle()
+        self.assertEqual(first.pack(), second.pack(), "Decks with the same seed should shuffle the same way.")
+        self.assertEqual(first.shuffle().pack(), second.shuffle().pack(), "Reshuffles should be reproducible.")
+        self.assertNotEqual(Deck(seed=43).shuffle().pack(), Deck(seed=42).shuffle().pack(),
+                            "Decks with different seeds should shuffle differently.")
+
+    def test_deal_number(self):
+        self.assertListEqual(deal_permutation(0)[:8], [46, 36, 8, 40, 14, 24, 44, 9],
+                             "Deal numbers must give the same deal everywhere.")
+        self.assertListEqual(deal_permutation(MAX_DEAL_NUMBER)[:8], [10, 51, 45, 3, 13, 36, 17, 27])
+        self.assertListEqual(sorted(deal_permutation(7, 104)), list(range(104)), "Deals should be permutations.")
+        for deal_number in (-1, MAX_DEAL_NUMBER + 1):
+            with self.assertRaises(ValueError, msg="Deal numbers must fit in 64 bits."):
+                deal_permutation(deal_number)
+
+        deck = Deck().shuffle(12345)
+        self.assertTrue(deck.is_shuffled)
+        self.assertListEqual(list(map(str, list(deck.cards)[:5])), ["|6♣", "|9♣", "|6♥", "|9♥", "|A♥"])
+        self.assertEqual(deck.pack(), Deck().shuffle().shuffle(12345).pack(),
+                         "A deal shouldn't depend on the order of the cards beforehand.")
+        self.assertEqual(deck.state_hash, deck.rehash(), "Shuffling should update the hash.")
+        deck = Deck(num_decks=2).shuffle(12345)
+        self.assertEqual(Counter(deck.pack()), Counter(bytes(range(52)) * 2), "Every card should still be dealt.")
+
+    def test_shoe(self):
+        shoe = Shoe(num_decks=8, num_jokers_per_deck=1, seed=42).shuffle()
+        deck = Deck(num_decks=8, num_jokers_per_deck=1, seed=42).shuffle()
+        self.assertEqual(shoe.pack(), deck.pack(), "Shoes should shuffle like decks with the same seed.")
+        self.assertEqual(shoe.state_hash, deck.state_hash, "Shoes should hash like decks.")
+        self.assertEqual(len(shoe), 8 * 53, "Shoes should have every card of every deck.")
+
+        dealt = [shoe.deal() for _ in range(10)]
+        self.assertListEqual(dealt, [deck.deal() for _ in range(10)], "Shoes should deal like decks.")
+        self.assertTrue(all(card.is_concealed for card in dealt), "Dealt cards should be concealed.")
+        self.assertEqual(shoe.remaining, 8 * 53 - 10, "Dealing should leave fewer cards.")
+        self.assertEqual(shoe.state_hash, deck.state_hash, "Dealing should update the hash.")
+        self.assertListEqual(shoe.cards, list(deck.cards), "Shoe cards should be built from the remaining codes.")
+
+        for card in reversed(dealt + dealt):
+            shoe.undeal(card)
+            deck.undeal(card)
+        self.assertEqual(shoe.pack(), deck.pack(), "Undealing past the original top card should still work.")
+        self.assertEqual(shoe.state_hash, shoe.rehash(), "Undealing should update the hash.")
+
+        cards = list(shoe.deal_all())
+        self.assertEqual(shoe.remaining, 0, "Dealing all should empty the shoe.")
+        with self.assertRaises(NoCardsRemainingException):
+            shoe.deal()
+        shoe.replenish(cards)
+        self.assertEqual(shoe.pack(), deck.pack(), "Replenishing should restore the cards.")
+        self.assertEqual(shoe.state_hash, deck.state_hash, "Replenishing should update the hash.")
+
+        self.assertEqual(Shoe(num_decks=2).shuffle(12345).pack(), Deck(num_decks=2).shuffle(12345).pack(),
+                         "Shoes should deal by deal number like decks.")
+        restored = Shoe(deck_dump=shoe.dump())
+        self.assertEqual(restored.pack(), shoe.pack(), "Shoes should load their own dumps.")
+        self.assertEqual(Deck(deck_dump=shoe.dump()).pack(), shoe.pack(), "Decks should load shoe dumps.")
+
+    def test_clone(self):
+        for deck_class in Deck, Shoe:
+            deck = deck_class(seed=3).shuffle()
+            deck.deal()
+            clone = deck.clone()
+            self.assertEqual(clone.pack(), deck.pack(), "Clones should have the same cards.")
+            self.assertEqual(clone.state_hash, deck.state_hash)
+            self.assertEqual(clone.deal(), deck.deal(), "Clones should deal the same cards.")
+            clone.deal()
+            self.assertEqual(deck.remaining, clone.remaining + 1, "Dealing from a clone should not change the deck.")
+            deck.deal()
+            self.assertEqual(clone.shuffle().pack(), deck.shuffle().pack(), "Seeded clones should shuffle alike.")
@@ -97,7 +97,7 @@ class FoundationTestCase(TestCase):
         clubs = list(map(str, foundation.piles[Suit.Clubs]))
         diamonds = list(map(str, foundation.piles[Suit.Diamonds]))
         spades = list(map(str, foundation.piles[Suit.Spades]))
-        undo_stack = list(map(lambda u: {'action': u.function.__name__, 'args': u.args}, foundation.undo_stack))
+        undo_stack = foundation.dump_undo_stack()
         return (keys, hearts, clubs, diamonds, spades, undo_stack)
 
     def test_dump(self):
@@ -113,7 +113,13 @@ class FoundationTestCase(TestCase):
         self.assertListEqual(clubs, dump["piles"][Suit.Clubs.value])
         self.assertListEqual(diamonds, dump["piles"][Suit.Diamonds.value])
         self.assertListEqual(spades, dump["piles"][Suit.Spades.value])
-        self.assertListEqual(undo_stack, dump["undo_stack"])
+        self.assertDictEqual(undo_stack, dump["undo_stack"])
+
+        foundation = Foundation(foundation_dump=dump)
+        self.assertEqual(len(foundation.undo_stack), 52, "Loaded foundations should keep their undo history.")
+        foundation.undo()
+        self.assertListEqual(list(map(str, foundation.piles[Suit.Hearts]))[-1:], ["Q♥"],
+                             "Undo should work after loading.")
 
     def test_load(self):
         # TODO: externalize this fixture
@@ -129,18 +135,135 @@ class FoundationTestCase(TestCase):
         self.assertListEqual(list(map(str, foundation.piles[Suit.Clubs])), dump["piles"][Suit.Clubs.value])
         self.assertListEqual(list(map(str, foundation.piles[Suit.Diamonds])), dump["piles"][Suit.Diamonds.value])
         self.assertListEqual(list(map(str, foundation.piles[Suit.Spades])), dump["piles"][Suit.Spades.value])
-        self.assertListEqual(dump["undo_stack"], undo_stack)
+        self.assertEqual(len(foundation.undo_stack), 4, "Old undo stacks should be converted.")
+        for _ in range(4):
+            foundation.undo()
+        self.assertFalse(any(foundation.piles.values()), "Converted undo stacks should undo every put.")
 
     def test_undo_put(self):
         foundation = Foundation()
         foundation.piles[Suit.Clubs].append(Card.parse_card("A♣"))
         self.assertEqual(len(foundation.piles[Suit.Clubs]), 1)
-        foundation.undo_put(str(Suit.Clubs))
+        foundation.undo_put(list(foundation).index(Suit.Clubs))
         self.assertEqual(len(foundation.piles[Suit.Clubs]), 0)
+        self.assertListEqual(foundation.undo_log.hand, [], "Cards that didn't come from the hand aren't kept.")
+
+        card = Card.parse_card("A♣")
+        foundation.put(card)
+        foundation.undo_put(list(foundation).index(Suit.Clubs), 1, True)
+        self.assertIs(foundation.undo_log.hand[-1], card, "Cards that came from the hand should go back to it.")
 
     def test_undo_get(self):
         foundation = Foundation()
         self.assertEqual(len(foundation.piles[Suit.Clubs]), 0)
-        foundation.undo_get("A♣")
+        card = Card.parse_card("A♣")
+        foundation.undo_log.hand.append(card)
+        foundation.undo_get(list(foundation).index(Suit.Clubs))
         self.assertEqual(len(foundation.piles[Suit.Clubs]), 1)
-        self.assertEqual(str(foundation.piles[Suit.Clubs][0]), "A♣")
+        self.assertIs(foundation.piles[Suit.Clubs][0], card, "The card should be taken from the hand.")
+        self.assertListEqual(foundation.undo_log.hand, [])
+
+        foundation.get(Suit.Clubs)
+        foundation.undo()
+        self.assertIs(foundation.piles[Suit.Clubs][0], card, "Undoing a get should return the same card.")
+
+    def test_pack(self):
+        foundation = Foundation()
+        for pip in [Pip.Ace, Pip.Two, Pip.Three]:
+            foundation.put(Card(pip, Suit.Diamonds, True))
+        foundation.put(Card(Pip.Ace, Suit.Hearts, True))
+        packed = foundation.pack()
+        self.assertEqual(packed, (b'', bytes([13, 14, 15]), b'', bytes([39])))
+
+        unpacked = Foundation(packed=packed)
+        for suit in Suit:
+            self.assertListEqual(list(map(str, foundation.piles[suit])), list(map(str, unpacked.piles[suit])))
+        self.assertEqual(len(unpacked.undo_stack), 0, "Unpacked foundations should have no undo history.")
+
+    def test_can_put(self):
+        foundation = Foundation()
+        self.assertFalse(foundation.can_put(Card(Pip.Ace, Suit.Hearts)), "Concealed cards can't be built.")
+        self.assertFalse(foundation.can_put(Card(Pip.Two, Suit.Hearts, True)), "Empty piles only accept aces.")
+        self.assertFalse(foundation.can_put(Card(None, None, True)), "Jokers have no foundation pile.")
+        self.assertTrue(foundation.can_put(Card(Pip.Ace, Suit.Hearts, True)), "Empty piles accept aces.")
+        foundation.put(Card(Pip.Ace, Suit.Hearts, True))
+        self.assertFalse(foundation.can_put(Card(Pip.Ace, Suit.Hearts, True)), "Aces only go on empty piles.")
+        self.assertFalse(foundation.can_put(Card(Pip.Three, Suit.Hearts, True)), "Piles are built sequentially.")
+        self.assertTrue(foundation.can_put(Card(Pip.Two, Suit.Hearts, True)), "Piles are built sequentially.")
+        self.assertEqual(len(foundation.undo_stack), 1, "Checking a put should not record an undo action.")
+
+    def test_can_get(self):
+        foundation = Foundation()
+        self.assertFalse(foundation.can_get(Suit.Hearts), "Empty piles can't be taken from.")
+        self.assertFalse(foundation.can_get("foo"), "Nonexistent suits can't be taken from.")
+        foundation.put(Card(Pip.Ace, Suit.Hearts, True))
+        self.assertTrue(foundation.can_get(Suit.Hearts))
+        self.assertEqual(str(foundation.peek(Suit.Hearts)), "A♥", "Peek should return the top card.")
+        self.assertEqual(len(foundation.piles[Suit.Hearts]), 1, "Peek should not remove the card.")
+        with self.assertRaises(NoSuchSuitException, msg="Peek should raise the same exceptions as get."):
+            foundation.peek("foo")
+
+    def test_state_hash(self):
+        foundation = Foundation()
+        self.assertEqual(foundation.state_hash, 0, "Empty foundations should hash to 0.")
+        foundation.put(Card(Pip.Ace, Suit.Hearts, True))
+        foundation.put(Card(Pip.Two, Suit.Hearts, True))
+        ace_hash = Foundation(packed=(b'', b'', b'', bytes([39]))).state_hash
+        self.assertEqual(foundation.state_hash, foundation.rehash(), "Putting cards should update the hash.")
+        foundation.undo()
+        self.assertEqual(foundation.state_hash, ace_hash, "Undoing a put should update the hash.")
+        foundation.get(Suit.Hearts)
+        self.assertEqual(foundation.state_hash, 0, "Getting cards should update the hash.")
+        foundation.undo()
+        self.assertEqual(foundation.state_hash, ace_hash, "Undoing a get should update the hash.")
+
+    def test_can_put_safely(self):
+        foundation = Foundation(packed=(bytes(range(0, 3)), bytes(range(13, 15)), bytes(range(26, 28)),
+                                        bytes(range(39, 42))))
+        self.assertTrue(Foundation().can_put_safely(Card(Pip.Ace, Suit.Clubs, True)), "Aces are always safe.")
+        self.assertTrue(foundation.can_put_safely(Card(Pip.Three, Suit.Diamonds, True)), "Black twos are home.")
+        self.assertFalse(foundation.can_put_safely(Card(Pip.Four, Suit.Spades, True)), "The red threes aren't home.")
+        self.assertFalse(foundation.can_put_safely(Card(Pip.Four, Suit.Hearts, True)), "The black threes aren't home.")
+        self.assertFalse(foundation.can_put_safely(Card(Pip.Five, Suit.Hearts, True)), "Piles are built sequentially.")
+        foundation.put(Card(Pip.Three, Suit.Diamonds, True))
+        self.assertTrue(foundation.can_put_safely(Card(Pip.Four, Suit.Spades, True)), "The red threes are home.")
+
+    def test_wanted_index(self):
+        foundation = Foundation()
+        two_hearts = Card(Pip.Two, Suit.Hearts, True)
+        foundation.piles[Suit.Hearts].append(Card(Pip.Ace, Suit.Hearts, True))
+        self.assertTrue(foundation.can_put(two_hearts), "Direct changes should be picked up.")
+        foundation.put(two_hearts)
+        self.assertFalse(foundation.can_put(two_hearts), "Puts should update the index.")
+        self.assertTrue(foundation.can_put(Card(Pip.Three, Suit.Hearts, True)), "Puts should update the index.")
+        foundation.undo()
+        self.assertTrue(foundation.can_put(two_hearts), "Undoing a put should update the index.")
+        foundation.get(Suit.Hearts)
+        self.assertTrue(foundation.can_put(Card(Pip.Ace, Suit.Hearts, True)), "Gets should update the index.")
+        self.assertFalse(foundation.can_put(two_hearts), "Gets should update the index.")
+        foundation.undo()
+        self.assertTrue(foundation.can_put(two_hearts), "Undoing a get should update the index.")
+        self.assertListEqual(list(foundation), list(Suit), "Iterating should list the suits in order.")
+        self.assertEqual(len(foundation[Suit.Hearts]), 1)
+
+    def test_clone(self):
+        foundation = Foundation(Suit)
+        foundation.put(Card(Pip.Ace, Suit.Spades, True))
+        clone = foundation.clone()
+        self.assertIs(clone[Suit.Spades], foundation[Suit.Spades], "Clones should share piles until they change.")
+        clone.put(Card(Pip.Two, Suit.Spades, True))
+        clone.put(Card(Pip.Ace, Suit.Hearts, True))
+        self.assertEqual(len(foundation[Suit.Spades]), 1, "Changing a clone should not change the original.")
+        self.assertTrue(foundation.can_put(Card(Pip.Two, Suit.Spades, True)))
+        self.assertFalse(foundation.can_put(Card(Pip.Three, Suit.Spades, True)))
+        self.assertTrue(clone.can_put(Card(Pip.Three, Suit.Spades, True)))
+        self.assertEqual(clone.state_hash, clone.rehash())
+        self.assertEqual(foundation.state_hash, foundation.rehash())
+
+        foundation.get(Suit.Spades)
+        self.assertEqual(len(clone[Suit.Spades]), 2, "Changing the original should not change a clone.")
+        clone.undo()
+        clone.undo()
+        clone.undo()
+        self.assertListEqual(list(map(len, clone.piles.values())), [0, 0, 0, 0], "Clones should undo their history.")
+        self.assertEqual(len(foundation.clone(with_undo_log=False).undo_stack), 0)
@@ -0,0 +1,98 @@
+from unittest import TestCase
+
+import numpy as np
+
+from pytience.games.solitaire import TABLEAU_BUILDS
+from pytience.games.solitaire.batch import ACTIONS, NUM_ACTIONS, KlondikeBatch, random_actions
+from pytience.games.solitaire.exception import IllegalMoveException
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType
+
+EMPTY_TABLEAU = tuple(bytes([0]) for _ in range(7))
+
+
+class KlondikeBatchTestCase(TestCase):
+    def test_from_deals(self):
+        batch = KlondikeBatch.from_deals([0, 1, 12345])
+        self.assertEqual(3, len(batch))
+        for game_num, deal_number in enumerate([0, 1, 12345]):
+            self.assertEqual(KlondikeGame(deal_number=deal_number).pack(), batch.pack(game_num),
+                             "Batch deal {} should match KlondikeGame".format(deal_number))
+            self.assertEqual(KlondikeGame(deal_number=deal_number).dump(), batch.to_game(game_num).dump())
+
+    def test_lockstep(self):
+        games = [KlondikeGame(deal_number=deal_number) for deal_number in range(30)]
+        batch = KlondikeBatch.from_games(games)
+        rng = np.random.default_rng(1)
+        for _ in range(200):
+            masks = batch.legal_masks()
+            self.assertEqual((30, NUM_ACTIONS), masks.shape)
+            for game_num, game in enumerate(games):
+                actions = np.flatnonzero(masks[game_num]).tolist()
+                self.assertEqual(game.legal_moves(), [batch.to_move(game_num, action) for action in actions],
+                                 "Legal actions should be the game's legal moves, in the same order")
+                self.assertEqual(actions, [batch.from_move(game_num, move) for move in game.legal_moves()])
+            actions = random_actions(masks, rng)
+            self.assertTrue(masks[np.arange(30), actions].all(), "Random actions should be legal")
+            for game_num, game in enumerate(games):
+                game.apply(batch.to_move(game_num, actions[game_num]))
+            batch.apply(actions, masks)
+            for game_num, game in enumerate(games):
+                self.assertEqual(game.pack(), batch.pack(game_num), "Batch moves should match KlondikeGame")
+        self.assertEqual([game.is_solved() for game in games], batch.is_solved().tolist())
+
+    def test_from_packed(self):
+        # Every card in the stock, in foundation order, so each deal goes straight to the foundation
+        batch = KlondikeBatch.from_packed([(0, bytes(range(52)), b'', (b'', b'', b'', b''), EMPTY_TABLEAU)] * 2)
+        waste_to_foundation = ACTIONS.index((MoveType.WasteToFoundation, 0, 1, 0))
+        for _ in range(52):
+            batch.apply([NUM_ACTIONS - 1, -1])
+            batch.apply([waste_to_foundation, -1])
+        self.assertEqual([True, False], batch.is_solved().tolist())
+        self.assertEqual(520, batch.scores[0])
+        self.assertEqual((0, bytes(range(52)), b'', (b'', b'', b'', b''), EMPTY_TABLEAU), batch.pack(1),
+                         "Negative actions should leave their games unchanged")
+        self.assertEqual(KlondikeGame(packed=batch.pack(0)).legal_moves(),
+                         [batch.to_move(0, action) for action in np.flatnonzero(batch.legal_masks()[0])],
+                         "Kings may be moved back from the foundation to empty tableau piles")
+
+        batch = KlondikeBatch.from_packed([(0, b'', b'', (b'', b'', b'', b''), EMPTY_TABLEAU),
+                                           (0, b'\0', b'', (b'', b'', b'', b''), EMPTY_TABLEAU)])
+        self.assertEqual([-1, NUM_ACTIONS - 1], random_actions(batch.legal_masks(), np.random.default_rng()).tolist(),
+                         "Games without legal moves should get no action")
+
+        # The waste is recycled when the stock runs out
+        batch = KlondikeBatch.from_packed([(0, b'', bytes([5, 6, 7]), (b'', b'', b'', b''), EMPTY_TABLEAU)])
+        batch.apply([NUM_ACTIONS - 1])
+        self.assertEqual((0, bytes([6, 7]), bytes([5]), (b'', b'', b'', b''), EMPTY_TABLEAU), batch.pack(0))
+
+        with self.assertRaises(ValueError):
+            KlondikeBatch.from_packed([(0, b'', b'', (b'', b'', b'', b''), EMPTY_TABLEAU[:6])])
+        king, not_a_build = 12, 0
+        self.assertNotIn(not_a_build, TABLEAU_BUILDS[king])
+        with self.assertRaises(ValueError):
+            KlondikeBatch.from_packed([(0, b'', b'', (b'', b'', b'', b''), (bytes([0, king, not_a_build]),) * 7)])
+
+    def test_apply(self):
+        batch = KlondikeBatch.from_deals([3, 4])
+        packed = batch.pack(0), batch.pack(1)
+        masks = batch.legal_masks()
+        illegal = int(np.flatnonzero(~masks[1])[0])
+        with self.assertRaises(IllegalMoveException):
+            batch.apply([NUM_ACTIONS - 1, illegal])
+        self.assertEqual(packed, (batch.pack(0), batch.pack(1)), "Illegal actions should change no games")
+        batch.apply([NUM_ACTIONS - 1, NUM_ACTIONS - 1], masks)
+        self.assertEqual(1, batch.waste_sizes[0])
+
+        with self.assertRaises(IllegalMoveException):
+            batch.from_move(0, Move(MoveType.TableauToTableau, 0, 0, 0))
+
+    def test_reset(self):
+        batch = KlondikeBatch.from_deals([5, 6, 7])
+        rng = np.random.default_rng(2)
+        for _ in range(50):
+            batch.apply(random_actions(batch.legal_masks(), rng))
+        batch.reset([8, 9], [0, 2])
+        self.assertEqual(KlondikeGame(deal_number=8).pack(), batch.pack(0))
+        self.assertEqual(KlondikeGame(deal_number=9).pack(), batch.pack(2))
+        self.assertEqual(8, batch.to_game(0).deal_number)
+        self.assertEqual(6, batch.deal_numbers[1], "Games that aren't reset should carry on")
@@ -1,10 +1,14 @@
 from io import StringIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Event, enumerate as enumerate_threads
 from unittest import TestCase
 from unittest.mock import patch, mock_open
 
 from pytience.cards.deck import Suit
-from pytience.cmd.klondike import KlondikeCmd, DEFAULT_SAVE_FILE
+from pytience.cmd.klondike import KlondikeCmd, DEFAULT_SAVE_FILE, MAX_UNDO_DEPTH, JOURNAL_WRITER_THREAD_NAME, \
+    JournalWriter
+from pytience.games.solitaire.journal import KlondikeJournal
 from pytience.games.solitaire.klondike import KlondikeGame
 
 ORIGINAL_KLONDIKECMD_LOAD = KlondikeCmd.load
@@ -12,10 +16,25 @@ ORIGINAL_KLONDIKECMD_LOAD = KlondikeCmd.load
 
 @patch('pytience.cmd.klondike.KlondikeCmd.load', side_effect=FileNotFoundError)
 class KlondikeCmdTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.journal_file = Path(directory.name).joinpath('klondike.journal')
+        journal_file_patch = patch('pytience.cmd.klondike.DEFAULT_JOURNAL_FILE', self.journal_file)
+        journal_file_patch.start()
+        self.addCleanup(journal_file_patch.stop)
+
+    def tearDown(self):
+        for thread in enumerate_threads():
+            if thread.name == JOURNAL_WRITER_THREAD_NAME:
+                thread.join()
+
     def test_init(self, cmd_load):
         klondike = KlondikeCmd()
         self.assertEqual(len(klondike.errors), 0)
         cmd_load.assert_called_once()
+        klondike.writer.flush()
+        self.journal_file.unlink()
         cmd_load.side_effect = Exception()
         klondike = KlondikeCmd()
         self.assertEqual(len(klondike.errors), 1)
@@ -45,6 +64,9 @@ class KlondikeCmdTestCase(TestCase):
         self.assertTrue(klondike.do_new('') is not True)
         self.assertIsNotNone(klondike.klondike)
         self.assertEqual(len(klondike.errors), 0)
+        self.assertTrue(klondike.do_new('1234') is not True)
+        self.assertEqual(klondike.klondike.deal_number, 1234)
+        self.assertEqual(len(klondike.errors), 0)
 
     @patch('pytience.games.solitaire.klondike.KlondikeGame.undo')
     def test_do_undo(self, game_undo, _cmd_load):
@@ -110,6 +132,12 @@ class KlondikeCmdTestCase(TestCase):
         self.assertTrue(KlondikeCmd().do_solve('') is not True)
         game_solve.assert_called_once()
 
+    @patch('pytience.games.solitaire.klondike.KlondikeGame.autoplay')
+    def test_do_autoplay(self, game_autoplay, _cmd_load):
+        game_autoplay.assert_not_called()
+        self.assertTrue(KlondikeCmd().do_autoplay('') is not True)
+        game_autoplay.assert_called_once()
+
     @patch('json.dump')
     @patch('builtins.open', new_callable=mock_open)
     @patch('pathlib.Path.mkdir')
@@ -119,6 +147,14 @@ class KlondikeCmdTestCase(TestCase):
         path_mkdir.assert_called_once()
         _mock_open.assert_called_with(Path('resources/foobar.json'), 'w')
 
+    @patch('builtins.open', new_callable=mock_open)
+    @patch('pathlib.Path.mkdir')
+    def test_save_bytes(self, _path_mkdir, _mock_open, _cmd_load):
+        klondike = KlondikeCmd()
+        KlondikeCmd.save(klondike.klondike, 'resources/foobar.bin')
+        _mock_open.assert_called_with(Path('resources/foobar.bin'), 'wb')
+        _mock_open().write.assert_called_with(klondike.klondike.to_bytes())
+
     @patch('pytience.cmd.klondike.KlondikeCmd.save')
     def test_do_save(self, cmd_save, _cmd_load):
         klondike = KlondikeCmd()
@@ -134,6 +170,14 @@ class KlondikeCmdTestCase(TestCase):
         klondike = ORIGINAL_KLONDIKECMD_LOAD('resources/foobar.json')
         self.assertIsInstance(klondike, KlondikeGame)
 
+    def test_load_bytes(self, _cmd_load):
+        game = KlondikeGame(deal_number=12)
+        game.deal()
+        with patch('builtins.open', mock_open(read_data=game.to_bytes())) as _mock_open:
+            klondike = ORIGINAL_KLONDIKECMD_LOAD('resources/foobar.bin')
+        _mock_open.assert_called_with(Path('resources/foobar.bin'), 'rb')
+        self.assertDictEqual(klondike.dump(), game.dump())
+
     def test_do_load(self, _cmd_load):
         klondike = KlondikeCmd()
         self.assertTrue(klondike.do_load('') is not True)
@@ -145,13 +189,114 @@ class KlondikeCmdTestCase(TestCase):
     @patch('pytience.cmd.klondike.KlondikeCmd.save')
     def test_postcmd(self, cmd_save, cmd_print_game, _cmd_load):
         klondike = KlondikeCmd()
-        cmd_save.assert_not_called()
         cmd_print_game.assert_not_called()
         self.assertTrue(klondike.postcmd(False, None) is False)
-        cmd_save.assert_called_once()
+        cmd_save.assert_not_called()
         cmd_print_game.assert_called_once()
         self.assertTrue(klondike.postcmd(True, None) is True)
 
+    def test_journal(self, cmd_load):
+        klondike = KlondikeCmd()
+        klondike.writer.flush()
+        self.assertEqual(KlondikeJournal(self.journal_file).load().pack(), klondike.klondike.pack(),
+                         "Games started with nothing to resume should be snapshotted.")
+        klondike.do_new('1234')
+        klondike.writer.flush()
+        self.assertEqual(klondike.journal.num_records, 0, "New games should be snapshotted.")
+        klondike.do_undo('')
+        klondike.do_redo('')
+        klondike.do_goto('0')
+        klondike.do_autoplay('')
+        klondike.writer.flush()
+        self.assertEqual(klondike.journal.num_records, 0, "Commands that change nothing should not be journaled.")
+        self.assertEqual(len(self.journal_file.read_text().splitlines()), 1)
+        klondike.do_deal('')
+        klondike.do_deal('')
+        klondike.do_undo('')
+        klondike.do_tableau('9')
+        self.assertTrue(klondike.do_quit(''))
+        self.assertEqual(len(klondike.errors), 1)
+        self.assertEqual(klondike.journal.num_records, 3, "Only changes should be journaled.")
+
+        resumed = KlondikeCmd()
+        self.assertDictEqual(resumed.klondike.dump(), klondike.klondike.dump(), "Games should resume from the journal.")
+        self.assertEqual(resumed.klondike.undo_log.max_depth, MAX_UNDO_DEPTH)
+        cmd_load.assert_called_once_with(DEFAULT_SAVE_FILE)
+        resumed.do_deal('')
+        resumed.close()
+        self.assertEqual(resumed.journal.num_records, 0, "Resumed games should start a new snapshot.")
+
+    def test_journal_writer_no_changes(self, _cmd_load):
+        klondike = KlondikeCmd()
+        klondike.do_new('1234')  # a deal with nothing to autoplay
+        klondike.writer.flush()
+        with patch.object(klondike.writer, 'record') as writer_record, \
+                patch('pytience.games.solitaire.klondike.KlondikeGame.clone') as game_clone:
+            klondike.do_undo('')
+            klondike.do_redo('')
+            klondike.do_goto('0')
+            klondike.do_autoplay('')
+            writer_record.assert_not_called()
+            game_clone.assert_not_called()
+            klondike.do_deal('')
+            writer_record.assert_called_once_with(klondike.klondike, 'deal')
+        self.assertEqual(len(klondike.errors), 0)
+
+    def test_journal_writer(self, _cmd_load):
+        journal = KlondikeJournal(self.journal_file, snapshot_interval=4)
+        errors = []
+        writer = JournalWriter(journal, errors)
+        game = KlondikeGame(deal_number=77)
+        is_writing, can_write = Event(), Event()
+        snapshots = []
+
+        def snapshot(snapshot_game):
+            snapshots.append(snapshot_game.pack())
+            is_writing.set()
+            can_write.wait()
+            KlondikeJournal.snapshot(journal, snapshot_game)
+
+        with patch.object(journal, 'snapshot', side_effect=snapshot):
+            writer.snapshot(game)
+            is_writing.wait()
+            for _ in range(3):
+                game.deal()
+                writer.record(game, 'deal')
+            self.assertFalse(self.journal_file.exists(), "Commands should not wait for the journal.")
+            game = KlondikeGame(deal_number=78)
+            writer.snapshot(game)
+            game.deal()
+            writer.record(game, 'deal')
+            can_write.set()
+            writer.flush()
+            self.assertEqual(len(snapshots), 2, "Changes before a snapshot should not be written.")
+            self.assertEqual(journal.num_records, 1)
+            self.assertDictEqual(journal.load().dump(), game.dump())
+
+            for _ in range(3):
+                game.deal()
+                writer.record(game, 'deal')
+            writer.flush()
+            self.assertEqual(len(snapshots), 2)
+            self.assertEqual(journal.num_records, 4)
+            game.deal()
+            writer.record(game, 'deal')
+            writer.flush()
+            self.assertEqual(len(snapshots), 3, "Journals should be compacted.")
+            self.assertDictEqual(journal.load().dump(), game.dump())
+
+        with patch.object(journal, 'record', side_effect=OSError):
+            game.deal()
+            writer.record(game, 'deal')
+            writer.flush()
+        self.assertEqual(len(errors), 1, "Errors should be reported.")
+        game.deal()
+        writer.record(game, 'deal')
+        writer.flush()
+        self.assertEqual(journal.num_records, 0, "Journals should start again after an error.")
+        self.assertDictEqual(journal.load().dump(), game.dump())
+        journal.close()
+
     @patch('pytience.cmd.klondike.KlondikeCmd.do_tableau')
     @patch('pytience.cmd.klondike.KlondikeCmd.print_dump')
     @patch('builtins.input', side_effect=EOFError)
@@ -189,5 +334,9 @@ class KlondikeCmdTestCase(TestCase):
     def test_print_game(self, sys_stdout, _cmd_load):
         klondike = KlondikeCmd()
         self.assertEqual(sys_stdout.getvalue(), '')
-        klondike.print_game()
+        klondike.klondike.state_hash  # pylint: disable=pointless-statement
+        with patch('pytience.games.solitaire.tableau.Tableau.rehash', side_effect=AssertionError), \
+                patch('pytience.games.solitaire.foundation.Foundation.rehash', side_effect=AssertionError):
+            klondike.print_game()
+            klondike.klondike.state_hash  # pylint: disable=pointless-statement
         self.assertNotEqual(sys_stdout.getvalue(), '')
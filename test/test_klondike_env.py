@@ -0,0 +1,85 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from pytience.games.solitaire.batch import ACTIONS, NUM_ACTIONS, move_to_action
+from pytience.games.solitaire.env import CONCEALED_CARD, FOUNDATION_START, NO_CARD, OBSERVATION_SIZE, \
+    STOCK_SIZE_INDEX, TABLEAU_DEPTH, WASTE_SIZE_INDEX, WASTE_START, KlondikeEnv
+from pytience.games.solitaire.exception import IllegalMoveException
+from pytience.games.solitaire.klondike import KlondikeGame, MoveType
+
+
+def observe(game: KlondikeGame) -> np.ndarray:
+    """Build an observation from scratch"""
+    _, stock, waste, foundation, tableau = game.pack()
+    observation = np.full(OBSERVATION_SIZE, NO_CARD, dtype=np.uint8)
+    for pile_num, pile in enumerate(tableau):
+        start = pile_num * TABLEAU_DEPTH
+        observation[start:start + pile[0]] = CONCEALED_CARD
+        observation[start + pile[0]:start + len(pile) - 1] = list(pile[pile[0] + 1:])
+    observation[WASTE_START:WASTE_START + len(waste)] = list(waste)
+    observation[FOUNDATION_START:FOUNDATION_START + 4] = [len(pile) for pile in foundation]
+    observation[STOCK_SIZE_INDEX] = len(stock)
+    observation[WASTE_SIZE_INDEX] = len(waste)
+    return observation
+
+
+class KlondikeEnvTestCase(TestCase):
+    def test_reset(self):
+        env = KlondikeEnv()
+        observation, info = env.reset(deal_number=7)
+        self.assertEqual((OBSERVATION_SIZE,), observation.shape)
+        self.assertEqual(np.uint8, observation.dtype)
+        self.assertTrue(np.array_equal(observe(KlondikeGame(deal_number=7)), observation))
+        self.assertEqual(7, info["deal_number"])
+        self.assertEqual(sorted(move_to_action(move, [pile_num + 1 for pile_num in range(7)])
+                                for move in KlondikeGame(deal_number=7).legal_moves()),
+                         np.flatnonzero(info["action_mask"]).tolist())
+
+        game = env.game
+        self.assertIs(observation, env.reset(seed=3)[0], "The observation should be updated in place")
+        self.assertIs(game, env.game, "The game should be reused")
+        self.assertTrue(np.array_equal(observe(KlondikeGame(seed=3)), observation))
+
+    def test_step(self):
+        env = KlondikeEnv(max_steps=150)
+        rng = np.random.default_rng(5)
+        for deal_number in range(10):
+            observation, info = env.reset(deal_number=deal_number)
+            terminated = truncated = False
+            while not (terminated or truncated):
+                action = rng.choice(np.flatnonzero(info["action_mask"]))
+                score = env.game.score
+                observation, reward, terminated, truncated, info = env.step(action)
+                self.assertEqual(env.game.score - score, reward, "The reward should be the points scored")
+                self.assertTrue(np.array_equal(observe(env.game), observation),
+                                "The observation should match the game after {}".format(ACTIONS[action]))
+                self.assertEqual(sorted(move_to_action(move, [len(pile) for pile in env.game.tableau])
+                                        for move in env.game.legal_moves()),
+                                 np.flatnonzero(info["action_mask"]).tolist())
+            self.assertTrue(truncated or env.game.is_solved() or not info["action_mask"].any())
+            self.assertLessEqual(env.num_steps, 150)
+
+    def test_illegal(self):
+        env = KlondikeEnv()
+        _, info = env.reset(deal_number=1)
+        illegal = int(np.flatnonzero(~info["action_mask"])[0])
+        with self.assertRaises(IllegalMoveException):
+            env.step(illegal)
+        self.assertEqual(0, env.num_steps)
+        self.assertTrue(info["action_mask"][NUM_ACTIONS - 1], "Dealing should be legal")
+        self.assertEqual(MoveType.Deal, ACTIONS[NUM_ACTIONS - 1][0])
+
+    def test_action_mask_without_moves(self):
+        env = KlondikeEnv(max_steps=50)
+        rng = np.random.default_rng(11)
+        with patch.object(KlondikeGame, 'legal_moves', side_effect=AssertionError('Moves should not be listed')):
+            _, info = env.reset(deal_number=3)
+            for _ in range(50):
+                if not info["action_mask"].any():
+                    break
+                _, _, terminated, truncated, info = env.step(rng.choice(np.flatnonzero(info["action_mask"])))
+                if terminated or truncated:
+                    break
+        self.assertGreater(env.num_steps, 0)
@@ -1,13 +1,20 @@
 from unittest import TestCase
 from unittest.mock import patch
 import itertools
+import json
 
 from pytience.games.solitaire.klondike import KlondikeGame, POINTS_TABLEAU_FOUNDATION, POINTS_WASTE_TABLEAU, \
-    POINTS_WASTE_FOUNDATION
+    POINTS_WASTE_FOUNDATION, Move, MoveType
 from pytience.cards.deck import Card, Pip, Suit
 from pytience.games.exception import IllegalMoveException
 from pytience.cards.exception import NoCardsRemainingException
 from pytience.games.solitaire.exception import NoSuchSuitException, TableauPileIndexError
+from pytience.games.util import Undoable
+
+
+def position(game_dump: dict) -> dict:
+    """A game dump without its undo log, which keeps undone steps for redo"""
+    return {key: value for key, value in game_dump.items() if key != 'undo_stack'}
 
 
 class KlondikeGameTestCase(TestCase):
@@ -20,6 +27,18 @@ class KlondikeGameTestCase(TestCase):
         self.assertEqual(len(klondike.foundation.piles), 4, "Klondike foundation should have 4 piles.")
         self.assertEqual(len(klondike.undo_stack), 0, "Klondike undo stack should be empty.")
 
+
+    def test_deal_number(self):
+        klondike = KlondikeGame(deal_number=12345)
+        self.assertEqual(klondike.deal_number, 12345)
+        self.assertEqual(klondike.pack(), KlondikeGame(deal_number=12345).pack(), "Deals should be reproducible.")
+        self.assertListEqual(list(map(str, klondike.tableau[6])), ["|K♦", "|8♦", "|3♠", "|4♦", "|10♥", "|A♦", "J♦"])
+        self.assertEqual(KlondikeGame(game_dump=klondike.dump()).deal_number, 12345, "Deal numbers should be saved.")
+        self.assertIsNone(KlondikeGame(game_dump={"score": 0}).deal_number, "Old saves have no deal number.")
+
+        self.assertEqual(KlondikeGame(seed=1).deal_number, KlondikeGame(seed=1).deal_number,
+                         "Seeded deals should be reproducible.")
+        self.assertNotEqual(KlondikeGame(seed=1).deal_number, KlondikeGame(seed=2).deal_number)
     def test_deal(self):
         klondike = KlondikeGame()
         self.assertEqual(len(klondike.stock), 24, "Klondike starting stock should have 24 cards remaining.")
@@ -410,10 +429,18 @@ class KlondikeGameTestCase(TestCase):
 
         self.assertFalse(klondike.foundation.is_full, "Foundation should be empty.")
 
-        for _ in range(52):
-            klondike.solve()
-
+        before = klondike.dump()
+        moves = klondike.solve()
+        self.assertEqual(len(moves), 52, "Solving should move every card.")
         self.assertTrue(klondike.foundation.is_full, "Foundation should be full.")
+        self.assertEqual(klondike.score, 52 * POINTS_TABLEAU_FOUNDATION)
+        self.assertListEqual(klondike.solve(), [], "Solving a solved game should do nothing.")
+
+        self.assertEqual(len(klondike.undo_stack), 1, "Solving should record a single undo action.")
+        klondike = KlondikeGame(game_dump=klondike.dump())
+        klondike.undo()
+        self.assertDictEqual(position(klondike.dump()), position(before),
+                             "A single undo should take back the whole solve.")
 
     def test_dump(self):
         klondike = KlondikeGame()
@@ -429,12 +456,12 @@ class KlondikeGameTestCase(TestCase):
         klondike.tableau.piles = list(map(lambda p: list(map(Card.parse_card, p)), piles))
         klondike.select_tableau(0, 2, 5)
         self.assertEqual(len(klondike.undo_stack), 1, "There should be exactly 1 undo action in the game.")
-        undo_stack = list(map(lambda u: {'action': u.function.__name__, 'args': u.args}, klondike.undo_stack))
+        undo_stack = klondike.dump_undo_stack()
 
         dump = klondike.dump()
         self.assertEqual(dump["score"], klondike.score)
         self.assertListEqual(dump["waste"], klondike.waste)
-        self.assertListEqual(dump["undo_stack"], undo_stack)
+        self.assertDictEqual(dump["undo_stack"], undo_stack)
         # Don't bother with equivalence testing, just make sure these objects exist and aren't empty
         self.assertTrue(dump["stock"])
         self.assertTrue(dump["foundation"])
@@ -458,46 +485,18 @@ class KlondikeGameTestCase(TestCase):
                 "undo_stack": [{"action": "undo_select_tableau", "args": [False]}]}
 
         klondike = KlondikeGame(game_dump=dump)
-        undo_stack = list(map(lambda u: {'action': u.function.__name__, 'args': u.args}, klondike.undo_stack))
 
         self.assertEqual(dump["score"], klondike.score)
         self.assertListEqual(dump["waste"], klondike.waste)
-        self.assertListEqual(dump["undo_stack"], undo_stack)
+        self.assertEqual(len(klondike.undo_stack), 1, "Old undo stacks should be converted.")
         # Don't bother with equivalence testing, just make sure these objects exist and aren't empty
         self.assertTrue(klondike.stock)
         self.assertTrue(klondike.foundation)
         self.assertTrue(klondike.tableau)
 
-    @patch('pytience.games.solitaire.foundation.Foundation.undo')
-    @patch('pytience.games.solitaire.tableau.Tableau.undo')
-    def test_undo_select_foundation(self, tableau_undo, foundation_undo):
-        klondike = KlondikeGame()
-        self.assertEqual(klondike.score, 0)
-        foundation_undo.assert_not_called()
-        tableau_undo.assert_not_called()
-        klondike.undo_select_foundation()
-        self.assertEqual(klondike.score, POINTS_TABLEAU_FOUNDATION)
-        foundation_undo.assert_called_once()
-        tableau_undo.assert_called_once()
-
-    @patch('pytience.games.solitaire.foundation.Foundation.undo')
-    @patch('pytience.games.solitaire.tableau.Tableau.undo')
-    def test_undo_select_waste(self, tableau_undo, foundation_undo):
-        klondike = KlondikeGame()
-        card_string = "K♣"
-        self.assertEqual(klondike.score, 0)
-        foundation_undo.assert_not_called()
-        tableau_undo.assert_not_called()
-        klondike.undo_select_waste(undo_foundation=True, card_string=card_string)
-        self.assertEqual(klondike.score, -POINTS_WASTE_FOUNDATION)
-        foundation_undo.assert_called_once()
-        tableau_undo.assert_not_called()
-
-        klondike = KlondikeGame()
-        klondike.undo_select_waste(undo_foundation=False, card_string=card_string)
-        self.assertEqual(klondike.score, -POINTS_WASTE_TABLEAU)
-        foundation_undo.assert_called_once()
-        tableau_undo.assert_called_once()
+        klondike.undo()
+        self.assertListEqual(list(map(str, klondike.tableau.piles[0])), ["K♣", "Q♥", "J♣", "10♥", "9♣"])
+        self.assertListEqual(list(map(str, klondike.tableau.piles[5])), ["|3♣", "K♠", "Q♦"])
 
     def test_undo_deal(self):
         klondike = KlondikeGame()
@@ -506,41 +505,483 @@ class KlondikeGameTestCase(TestCase):
         self.assertEqual(len(klondike.stock.cards), 23)
         self.assertEqual(len(klondike.waste), 1)
 
-        klondike.undo_deal(undo_replenish=False)
+        klondike.undo_deal(0, 0, False)
         self.assertEqual(len(klondike.stock.cards), 24)
         self.assertEqual(len(klondike.waste), 0)
 
         klondike.waste.append(klondike.stock.deal().reveal())
-        klondike.undo_deal(undo_replenish=True)
+        klondike.undo_deal(0, 0, True)
         self.assertEqual(len(klondike.stock.cards), 0)
         self.assertEqual(len(klondike.waste), 24)
 
-    @patch('pytience.games.solitaire.foundation.Foundation.undo')
-    @patch('pytience.games.solitaire.tableau.Tableau.undo')
-    def test_undo_seek_tableau_to_foundation(self, tableau_undo, foundation_undo):
+    def test_undo_score(self):
+        klondike = KlondikeGame()
+        klondike.undo_score(0, POINTS_TABLEAU_FOUNDATION, False)
+        self.assertEqual(klondike.score, -POINTS_TABLEAU_FOUNDATION, "Added points should be subtracted.")
+        klondike.undo_score(0, POINTS_TABLEAU_FOUNDATION, True)
+        self.assertEqual(klondike.score, 0, "Subtracted points should be added back.")
+
+    def test_undo_log(self):
+        klondike = KlondikeGame(deal_number=1)
+        for _ in range(200):
+            moves = klondike.legal_moves()
+            if not moves:
+                break
+            klondike.apply(moves[0])
+        self.assertLessEqual(len(klondike.undo_log.records), 4 * 3 * len(klondike.undo_log),
+                             "Each move should take at most three 4-byte records.")
+        self.assertListEqual(klondike.undo_log.hand, [], "Every card taken should have been put somewhere.")
+        self.assertIsNone(klondike.dump()["tableau"]["undo_stack"], "The shared log is only dumped by the game.")
+
+        with patch('pytience.cards.deck.Card.parse_card', side_effect=AssertionError("Undo parsed a card")), \
+                patch('pytience.cards.deck.Card.from_code', side_effect=AssertionError("Undo created a card")):
+            while klondike.undo_stack:
+                self.assertTrue(klondike.undo())
+        self.assertEqual(klondike.pack(), KlondikeGame(deal_number=1).pack(), "Undo should restore the deal.")
+        self.assertFalse(klondike.undo(), "Undo with nothing to undo should do nothing.")
+
+    def test_lazy_undo_log(self):
+        klondike = KlondikeGame(deal_number=9)
+        positions = [klondike.pack()]
+        for move_num in range(120):
+            moves = klondike.legal_moves()
+            klondike.apply(moves[move_num % len(moves)])
+            positions.append(klondike.pack())
+        for _ in range(5):
+            klondike.undo()
+        game_dump = klondike.dump()
+
+        game_bytes = klondike.to_bytes()
+        for loaded, save, saved in ((KlondikeGame(game_dump=game_dump), KlondikeGame.dump, game_dump),
+                                    (KlondikeGame.from_bytes(game_bytes), KlondikeGame.to_bytes, game_bytes)):
+            with patch('pytience.cards.deck.Card.parse_card', side_effect=AssertionError("Loading parsed a card")), \
+                    patch('pytience.games.util.decode_cards', side_effect=AssertionError("Loading decoded cards")):
+                self.assertEqual(save(loaded), saved, "Loaded logs should be saved again without being decoded.")
+                clone = loaded.clone()
+            self.assertNotIn('records', loaded.undo_log.__dict__, "Loaded logs should not be decoded until used.")
+            self.assertEqual(len(loaded.undo_stack), 115)
+            self.assertEqual(loaded.undo_log.num_redo_steps, 5)
+            loaded.goto(40)
+            self.assertEqual(loaded.pack(), positions[40], "Decoded logs should undo every move.")
+            loaded.deal()
+            clone.goto(120)
+            self.assertEqual(clone.pack(), positions[120], "Clones of loaded logs should be decoded separately.")
+
+        loaded = KlondikeGame(game_dump=game_dump)
+        loaded.undo_log.clear()
+        self.assertEqual(len(loaded.undo_stack), 0)
+        self.assertEqual(loaded.undo_log.num_redo_steps, 0)
+        loaded.deal()
+        loaded.undo()
+        self.assertEqual(loaded.pack(), klondike.pack(), "Cleared logs should not decode what was loaded.")
+        with self.assertRaises(AttributeError):
+            _ = loaded.undo_log.no_such_attribute
+
+    def test_redo(self):
+        klondike = KlondikeGame(deal_number=2)
+        positions = [klondike.pack()]
+        for _ in range(20):
+            klondike.apply(klondike.legal_moves()[0])
+            positions.append(klondike.pack())
+        if klondike.autoplay():
+            positions.append(klondike.pack())
+
+        while klondike.undo_stack:
+            klondike.undo()
+        self.assertEqual(klondike.undo_log.num_redo_steps, len(positions) - 1)
+        for packed in positions[1:]:
+            klondike.redo()
+            self.assertEqual(klondike.pack(), packed, "Redo should replay each step.")
+            self.assertEqual(klondike.state_hash, KlondikeGame(packed=packed).state_hash)
+        self.assertFalse(klondike.redo())
+        self.assertEqual(klondike.pack(), positions[-1], "Redo with nothing undone should do nothing.")
+        self.assertTrue(klondike.undo())
+        self.assertTrue(klondike.redo())
+
+        klondike.undo()
+        klondike.undo()
+        klondike = KlondikeGame(game_dump=klondike.dump())
+        self.assertEqual(klondike.undo_log.num_redo_steps, 2, "Undone steps should be saved.")
+        klondike.redo()
+        self.assertEqual(klondike.pack(), positions[-2])
+
+        klondike.deal()
+        self.assertEqual(klondike.undo_log.num_redo_steps, 0, "A new move should drop the undone steps.")
+        klondike.redo()
+        klondike.undo()
+        self.assertEqual(klondike.pack(), positions[-2])
+
+    def test_goto(self):
+        klondike = KlondikeGame(deal_number=3)
+        positions = [klondike.pack()]
+        for _ in range(150):
+            moves = klondike.legal_moves()
+            klondike.apply(moves[len(positions) % len(moves)])
+            positions.append(klondike.pack())
+
+        for move_index in [0, 150, 70, 140, 1, 129, 64, 65, 150, 3]:
+            self.assertTrue(klondike.goto(move_index), "Goto should report that steps were undone or redone.")
+            self.assertEqual(len(klondike.undo_stack), move_index)
+            self.assertEqual(klondike.pack(), positions[move_index], "Goto should reach the position at the index.")
+            self.assertEqual(klondike.state_hash, KlondikeGame(packed=positions[move_index]).state_hash)
+        self.assertFalse(klondike.goto(3), "Goto the current step should change nothing.")
+        with self.assertRaises(IllegalMoveException):
+            klondike.goto(151)
+        with self.assertRaises(IllegalMoveException):
+            klondike.goto(-1)
+
+        klondike = KlondikeGame(game_dump=klondike.dump())
+        klondike.goto(150)
+        self.assertEqual(klondike.pack(), positions[150], "Goto should work without checkpoints.")
+        klondike.goto(100)
+        klondike.deal()
+        with self.assertRaises(IllegalMoveException):
+            klondike.goto(102)
+        klondike.goto(64)
+        self.assertEqual(klondike.pack(), positions[64], "Checkpoints before a new move should be kept.")
+
+    def test_clone(self):
+        klondike = KlondikeGame(deal_number=4)
+        for _ in range(30):
+            klondike.apply(klondike.legal_moves()[0])
+        before = klondike.dump()
+        clone = klondike.clone()
+        self.assertDictEqual(clone.dump(), before, "Clones should be identical, including the undo log.")
+        self.assertEqual(clone.state_hash, klondike.state_hash)
+
+        for _ in range(60):
+            moves = clone.legal_moves()
+            clone.apply(moves[-1])
+            self.assertEqual(clone.state_hash, KlondikeGame(packed=clone.pack()).state_hash,
+                             "Clones should keep their hashes up to date.")
+        self.assertDictEqual(klondike.dump(), before, "Playing a clone should not change the original.")
+        self.assertEqual(klondike.state_hash, KlondikeGame(packed=klondike.pack()).state_hash)
+        while len(clone.undo_stack) > 30:
+            clone.undo()
+        self.assertEqual(clone.pack(), klondike.pack(), "Clones should undo back to where they were cloned.")
+
+        clone = klondike.clone(with_undo_log=False)
+        self.assertEqual(clone.pack(), klondike.pack())
+        self.assertEqual(len(clone.undo_stack), 0, "The undo log may be skipped.")
+        clone.deal()
+        clone.undo()
+        self.assertEqual(clone.pack(), klondike.pack(), "Clones without history should still undo their own moves.")
+        klondike.apply(klondike.legal_moves()[0])
+        self.assertEqual(clone.pack(), KlondikeGame(game_dump=before).pack(),
+                         "Playing the original should not change a clone.")
+
+    def test_undoable_without_copy(self):
+        class Uncopyable(Undoable):
+            pass
+        with self.assertRaises(TypeError, msg="Undoables that can't be copied should not be created."):
+            Uncopyable()
+
+    def test_max_undo_depth(self):
+        klondike = KlondikeGame(deal_number=3, max_undo_depth=100)
+        positions = [klondike.pack()]
+        for _ in range(400):
+            moves = klondike.legal_moves()
+            klondike.apply(moves[len(positions) % len(moves)])
+            positions.append(klondike.pack())
+            self.assertLessEqual(len(klondike.undo_stack), 100, "The undo depth should be limited.")
+            self.assertGreaterEqual(len(klondike.undo_stack), min(len(positions) - 1, 100 - 64),
+                                    "Folding should stop at the oldest checkpoint within the limit.")
+            self.assertLessEqual(len(klondike.undo_log.records), 4 * 3 * 100, "The log should stop growing.")
+        self.assertEqual(klondike.undo_log.step, 400)
+        self.assertEqual(klondike.undo_log.num_folded_steps % klondike.undo_log.checkpoint_interval, 0,
+                         "Old steps should be folded into a checkpoint.")
+
+        first_move = klondike.undo_log.num_folded_steps
+        klondike.goto(first_move)
+        self.assertEqual(klondike.pack(), positions[first_move])
+        klondike.undo()
+        self.assertEqual(klondike.pack(), positions[first_move], "Folded moves can't be undone.")
+        with self.assertRaises(IllegalMoveException):
+            klondike.goto(first_move - 1)
+
+        klondike = KlondikeGame(game_dump=klondike.dump(), max_undo_depth=100)
+        klondike.goto(400)
+        self.assertEqual(klondike.pack(), positions[400], "Folded logs should be saved.")
+        klondike.goto(first_move)
+        self.assertEqual(klondike.pack(), positions[first_move])
+
+        for _ in range(3):
+            moves = klondike.legal_moves()
+            klondike.apply(moves[-1])
+        self.assertEqual(len(klondike.undo_stack), 3)
+        klondike.undo_log.max_depth = 2
+        klondike.deal()
+        self.assertEqual(len(klondike.undo_stack), 2, "Without a checkpoint, steps should be folded one at a time.")
+
+    def test_to_bytes(self):
+        klondike = KlondikeGame(deal_number=6, max_undo_depth=100)
+        for move_num in range(150):
+            moves = klondike.legal_moves()
+            klondike.apply(moves[move_num % len(moves)])
+        for _ in range(10):
+            klondike.undo()
+        klondike.redo()
+
+        game_bytes = klondike.to_bytes()
+        loaded = KlondikeGame.from_bytes(game_bytes, max_undo_depth=100)
+        self.assertDictEqual(loaded.dump(), klondike.dump(), "Binary saves should keep the whole game.")
+        self.assertEqual(loaded.state_hash, klondike.state_hash)
+        self.assertLess(len(game_bytes), len(json.dumps(klondike.dump())), "Binary saves should be smaller.")
+        loaded.redo()
+        klondike.redo()
+        self.assertEqual(loaded.pack(), klondike.pack(), "Loaded games should redo undone moves.")
+        loaded.goto(loaded.undo_log.num_folded_steps)
+        klondike.goto(klondike.undo_log.num_folded_steps)
+        self.assertEqual(loaded.pack(), klondike.pack(), "Loaded games should undo every move that was saved.")
+
+        new_game = KlondikeGame(packed=KlondikeGame(deal_number=2).pack())
+        self.assertIsNone(KlondikeGame.from_bytes(new_game.to_bytes()).deal_number)
+        self.assertEqual(KlondikeGame(game_bytes=new_game.to_bytes()).pack(), new_game.pack())
+        with self.assertRaises(ValueError):
+            KlondikeGame.from_bytes(json.dumps(klondike.dump()).encode())
+
+    def test_load_legacy_undo_stacks(self):
+        # Played with an earlier version, which kept separate undo stacks of bound method names and card strings
+        dump = {"deal_number": None, "score": 60,
+                "stock": {"num_decks": 1, "num_jokers": 0, "is_shuffled": False, "cards": []},
+                "waste": [],
+                "foundation": {
+                    "piles": {"♠": ["A♠", "2♠"], "♦": ["A♦", "2♦"], "♣": [], "♥": []},
+                    "undo_stack": [{"action": "undo_put", "args": ["♠"]}, {"action": "undo_put", "args": ["♠"]},
+                                   {"action": "undo_get", "args": ["2♠"]}, {"action": "undo_put", "args": ["♦"]},
+                                   {"action": "undo_put", "args": ["♠"]}, {"action": "undo_put", "args": ["♦"]}]},
+                "tableau": {
+                    "piles": [[], [], ["K♣"], ["3♥"], ["K♥"], ["8♦", "7♣"], []],
+                    "undo_stack": [{"action": "undo_get", "args": [0, ["A♠"], False]},
+                                   {"action": "undo_get", "args": [1, ["2♠"], True]},
+                                   {"action": "undo_put", "args": [3, 1]},
+                                   {"action": "undo_get", "args": [1, ["K♥"], False]},
+                                   {"action": "undo_put", "args": [4, 1]}, {"action": "undo_put", "args": [5, 1]},
+                                   {"action": "undo_get", "args": [3, ["2♠"], False]},
+                                   {"action": "undo_get", "args": [6, ["2♦"], False]}]},
+                "undo_stack": [{"action": "undo_select_tableau", "args": [True]},
+                               {"action": "undo_select_tableau", "args": [True]},
+                               {"action": "undo_select_foundation", "args": []},
+                               {"action": "undo_deal", "args": [False]},
+                               {"action": "undo_select_waste", "args": [True, "A♦"]},
+                               {"action": "undo_deal", "args": [False]},
+                               {"action": "undo_deal", "args": [True]},
+                               {"action": "undo_select_tableau", "args": [False]},
+                               {"action": "undo_select_waste", "args": [False, "7♣"]},
+                               {"action": "undo_autoplay", "args": [[
+                                   {"action": "undo_select_tableau", "args": [True]},
+                                   {"action": "undo_select_tableau", "args": [True]}]]}]}
+
+        # Replay the same moves with this version
+        start = (0, bytes([13, 32]), b'', (b'', b'', b'', b''), (
+            bytes([0, 0]), bytes([1, 51, 1]), bytes([0, 38]), bytes([0, 41]), bytes([0]), bytes([0, 20]), bytes([0, 14])
+        ))
+        klondike = KlondikeGame(packed=start)
+        positions = [klondike.pack()]
+        for command in (lambda: klondike.select_tableau(0, -1), klondike.seek_tableau_to_foundation,
+                        lambda: klondike.select_foundation(Suit.Spades, 3), klondike.deal, klondike.select_waste,
+                        klondike.deal, klondike.deal, lambda: klondike.select_tableau(1, -1, 4),
+                        lambda: klondike.select_waste(5), klondike.autoplay):
+            command()
+            positions.append(klondike.pack())
+
+        loaded = KlondikeGame(game_dump=dump)
+        self.assertEqual(loaded.pack(), klondike.pack())
+        self.assertDictEqual(loaded.dump_undo_stack(), klondike.dump_undo_stack(),
+                             "Old undo stacks should convert to the records this version would have made.")
+        positions.pop()
+        while loaded.undo_stack:
+            loaded.undo()
+            self.assertEqual(loaded.pack(), positions.pop(), "Each undo should take back one old undo action.")
+        self.assertFalse(positions)
+        self.assertListEqual(loaded.undo_log.hand, [])
+
+    def test_pack(self):
+        klondike = KlondikeGame()
+        klondike.deal()
+        klondike.score = 25
+        packed = klondike.pack()
+        score, stock, waste, foundation, tableau = packed
+        self.assertEqual(score, 25)
+        self.assertEqual(len(stock), 23, "The packed stock should use one byte per card.")
+        self.assertEqual(len(waste), 1, "The packed waste should use one byte per card.")
+
+        unpacked = KlondikeGame(packed=packed)
+        self.assertEqual(unpacked.pack(), packed, "Unpacking and repacking should be lossless.")
+        self.assertEqual(len(unpacked.undo_stack), 0, "Unpacked games should have no undo history.")
+        dump, unpacked_dump = klondike.dump(), unpacked.dump()
+        for key in ("score", "waste"):
+            self.assertEqual(dump[key], unpacked_dump[key])
+        self.assertListEqual(dump["stock"]["cards"], unpacked_dump["stock"]["cards"])
+        self.assertDictEqual(dump["foundation"]["piles"], unpacked_dump["foundation"]["piles"])
+        self.assertListEqual(dump["tableau"]["piles"], unpacked_dump["tableau"]["piles"])
+
+    def test_legal_moves(self):
+        klondike = KlondikeGame()
+        for pile_num, card in enumerate(["10♦", "9♠", "J♦", "6♣", "3♦", "9♥", "A♦"]):
+            klondike.tableau.piles[pile_num][-1] = Card.parse_card(card)
+        klondike.tableau.piles[0].clear()
+        klondike.tableau.piles[1][0] = Card.parse_card("10♥")
+        klondike.waste.append(Card.parse_card("K♣"))
+        klondike.foundation.piles[Suit.Clubs].append(Card.parse_card("5♣"))
+
+        moves = klondike.legal_moves()
+        self.assertCountEqual(moves, [
+            Move(MoveType.WasteToTableau, destination=0),
+            Move(MoveType.TableauToFoundation, 3, 3),
+            Move(MoveType.TableauToFoundation, 6, 6),
+            Move(MoveType.Deal),
+        ], "Only the waste king, the 6♣, the A♦ and a deal should be legal.")
+        self.assertEqual(moves[-1], Move(MoveType.Deal), "Deals should be listed last.")
+        self.assertEqual(len(klondike.undo_stack), 0, "Listing moves should not record undo actions.")
+
+        klondike.tableau.piles[4][-1] = Card.parse_card("Q♠")
+        klondike.tableau.piles[5][-1] = Card.parse_card("J♣")
+        klondike.tableau.piles[6][-1] = Card.parse_card("6♦")
+        self.assertIn(Move(MoveType.TableauToTableau, 2, 2, 4), klondike.legal_moves())
+        self.assertIn(Move(MoveType.TableauToTableau, 1, 0, 5), klondike.legal_moves(), "Runs should move together.")
+        self.assertIn(Move(MoveType.FoundationToTableau, Suit.Clubs, destination=6), klondike.legal_moves())
+        klondike.stock.cards.clear()
+        klondike.waste.clear()
+        self.assertNotIn(Move(MoveType.Deal), klondike.legal_moves(), "There's nothing left to deal.")
+
+    def test_apply_unapply(self):
+        for _ in range(10):
+            klondike = KlondikeGame()
+            for _ in range(100):
+                moves = klondike.legal_moves()
+                if not moves:
+                    break
+                before = klondike.dump()
+                num_steps = len(klondike.undo_stack)
+                for move in moves:
+                    klondike.apply(move)
+                    self.assertEqual(len(klondike.undo_stack), num_steps + 1,
+                                     "Each move should record exactly one undo action.")
+                    klondike.unapply(move)
+                    self.assertEqual(position(klondike.dump()), position(before),
+                                     "Unapplying a move should restore the position.")
+                    self.assertEqual(len(klondike.undo_stack), num_steps)
+                klondike.apply(moves[0])
+
+    def test_apply_illegal(self):
+        klondike = KlondikeGame()
+        for pile_num, card in enumerate(["10♦", "9♠", "J♦", "6♣", "3♦", "9♥", "2♦"]):
+            klondike.tableau.piles[pile_num][-1] = Card.parse_card(card)
+        before = klondike.dump()
+        for move in [Move(MoveType.WasteToFoundation),
+                     Move(MoveType.WasteToTableau, destination=0),
+                     Move(MoveType.TableauToFoundation, 3, -1),
+                     Move(MoveType.TableauToTableau, 1, -1, 1),
+                     Move(MoveType.TableauToTableau, 1, -1, 2),
+                     Move(MoveType.TableauToTableau, 1, -1, 7),
+                     Move(MoveType.FoundationToTableau, Suit.Clubs, destination=0)]:
+            with self.assertRaises((IllegalMoveException, NoCardsRemainingException),
+                                   msg="Illegal moves should raise an exception."):
+                klondike.apply(move)
+            self.assertEqual(klondike.dump(), before, "Illegal moves should not change the position.")
+        with self.assertRaises(IllegalMoveException, msg="There's nothing to take back."):
+            klondike.unapply(Move(MoveType.Deal))
+
+    def test_apply_without_destination(self):
+        klondike = KlondikeGame(deal_number=5)
+        klondike.deal()
+        klondike.foundation.piles[Suit.Spades] = [Card.parse_card('A♠')]
+        before = klondike.dump()
+        records = klondike.undo_log.records.tobytes()
+        for move in [Move(MoveType.WasteToTableau),
+                     Move(MoveType.WasteToTableau, destination=-8),
+                     Move(MoveType.TableauToTableau, 6, -1),
+                     Move(MoveType.TableauToTableau, 6, -1, 9),
+                     Move(MoveType.FoundationToTableau, Suit.Spades)]:
+            with self.assertRaises(TableauPileIndexError, msg="Moves to the tableau need a pile."):
+                klondike.apply(move)
+            self.assertDictEqual(klondike.dump(), before, "Moves without a pile should not change the game.")
+            self.assertListEqual(klondike.undo_log.hand, [], "Moves without a pile should not take any cards.")
+            self.assertEqual(klondike.undo_log.records.tobytes(), records,
+                             "Moves without a pile should not record anything.")
+
+    def test_move_commands(self):
+        self.assertEqual(str(Move(MoveType.Deal)), "deal")
+        self.assertEqual(str(Move(MoveType.WasteToFoundation)), "waste")
+        self.assertEqual(str(Move(MoveType.WasteToTableau, destination=3)), "waste 3")
+        self.assertEqual(str(Move(MoveType.TableauToFoundation, 2, 4)), "tableau 2 4")
+        self.assertEqual(str(Move(MoveType.TableauToTableau, 2, 4, 6)), "tableau 2 4 6")
+        self.assertEqual(str(Move(MoveType.FoundationToTableau, Suit.Hearts, destination=1)), "foundation h 1")
+        self.assertEqual(str(Move(MoveType.FoundationToTableau)), "foundation None None")
+
+    def test_state_hash(self):
         klondike = KlondikeGame()
-        self.assertEqual(klondike.score, 0)
-        foundation_undo.assert_not_called()
-        tableau_undo.assert_not_called()
-        klondike.undo_seek_tableau_to_foundation()
-        self.assertEqual(klondike.score, -POINTS_TABLEAU_FOUNDATION)
-        foundation_undo.assert_called_once()
-        tableau_undo.assert_called_once()
-
-    @patch('pytience.games.solitaire.foundation.Foundation.undo')
-    @patch('pytience.games.solitaire.tableau.Tableau.undo')
-    def test_undo_select_tableau(self, tableau_undo, foundation_undo):
+        original_hash = klondike.state_hash
+        self.assertEqual(original_hash, KlondikeGame(packed=klondike.pack()).state_hash,
+                         "Equal positions should hash equally.")
+        self.assertEqual(original_hash, KlondikeGame(game_dump=klondike.dump()).state_hash,
+                         "Loaded games should hash equally.")
+        hashes = [original_hash]
+        for _ in range(200):
+            moves = klondike.legal_moves()
+            if not moves:
+                break
+            klondike.apply(moves[0])
+            self.assertEqual(klondike.state_hash, KlondikeGame(packed=klondike.pack()).state_hash,
+                             "Every move should update the hash: {}".format(moves[0]))
+            hashes.append(klondike.state_hash)
+        while klondike.undo_stack:
+            self.assertEqual(klondike.state_hash, hashes.pop(), "Every undo should restore the hash.")
+            klondike.undo()
+        self.assertEqual(klondike.state_hash, original_hash, "Undoing everything should restore the hash.")
+
+        klondike.score = 100
+        self.assertEqual(klondike.state_hash, original_hash, "The score isn't part of the position.")
+        klondike.waste.append(klondike.stock.deal().reveal())
+        self.assertEqual(klondike.rehash(), klondike.state_hash, "Rehashing should pick up direct changes.")
+        self.assertNotEqual(klondike.state_hash, original_hash)
+
+    def test_canonical_key(self):
         klondike = KlondikeGame()
-        self.assertEqual(klondike.score, 0)
-        foundation_undo.assert_not_called()
-        tableau_undo.assert_not_called()
-
-        klondike.undo_select_tableau(undo_foundation=False)
-        self.assertEqual(klondike.score, 0)
-        foundation_undo.assert_not_called()
-        self.assertEqual(tableau_undo.call_count, 2)
-
-        klondike.undo_select_tableau(undo_foundation=True)
-        self.assertEqual(klondike.score, -POINTS_TABLEAU_FOUNDATION)
-        foundation_undo.assert_called_once()
-        self.assertEqual(tableau_undo.call_count, 3)
+        klondike.deal()
+        swapped = KlondikeGame(packed=klondike.pack())
+        piles = swapped.tableau.piles
+        piles[1], piles[4] = piles[4], piles[1]
+        swapped.rehash()
+        self.assertEqual(klondike.canonical_key(), swapped.canonical_key(), "Pile order shouldn't matter.")
+        self.assertEqual(klondike.canonical_hash, swapped.canonical_hash, "Pile order shouldn't matter.")
+        self.assertNotEqual(klondike.state_hash, swapped.state_hash, "The state hash includes the pile order.")
+
+        stock, waste, foundation, tableau = klondike.canonical_key()
+        self.assertEqual(len(stock), 23)
+        self.assertEqual(len(waste), 1)
+        self.assertEqual(foundation, bytes(4), "The foundation should be reduced to a count per suit.")
+
+        klondike.undo()
+        self.assertNotEqual(klondike.canonical_key(), swapped.canonical_key(), "The stock and waste should matter.")
+        self.assertNotEqual(klondike.canonical_hash, swapped.canonical_hash, "The stock and waste should matter.")
+
+    def test_autoplay(self):
+        klondike = KlondikeGame(packed=(0, b'', b'', (b'', bytes(range(13, 16)), b'', bytes(range(39, 42))), (
+            bytes([0, 4, 3, 2, 1, 0]),  # 5♠ 4♠ 3♠ 2♠ A♠
+            bytes([0, 29, 28]),  # 4♣ 3♣
+            bytes([1, 42, 26]),  # |4♥ A♣
+        )))
+        klondike.waste.append(Card.parse_card("4♦"))
+        klondike.rehash()
+        before = klondike.dump()
+
+        moves = klondike.autoplay()
+        self.assertListEqual(list(map(str, moves)),
+                             ["tableau 0 4", "tableau 0 3", "tableau 0 2", "tableau 0 1", "tableau 2 1"],
+                             "Cards should be moved while they're safe.")
+        self.assertListEqual(list(map(str, klondike.tableau.piles[0])), ["5♠"],
+                             "5♠ isn't safe until both red fours are home.")
+        self.assertListEqual(list(map(str, klondike.tableau.piles[2])), ["4♥"],
+                             "4♥ isn't safe until both black threes are home.")
+        self.assertListEqual(list(map(str, klondike.waste)), ["4♦"], "4♦ isn't safe until both black threes are home.")
+        self.assertEqual(len(klondike.undo_stack), 1, "Autoplay should record a single undo action.")
+        self.assertEqual(klondike.state_hash, KlondikeGame(packed=klondike.pack()).state_hash)
+
+        klondike.undo()
+        self.assertDictEqual(position(klondike.dump()), position(before),
+                             "A single undo should take back every autoplay move.")
+        self.assertListEqual(KlondikeGame(packed=(0, b'', b'', (b'',) * 4, (bytes([0, 51]),))).autoplay(), [],
+                             "Nothing should happen when nothing fits.")
+        self.assertEqual(len(klondike.undo_stack), 0, "No undo action should be recorded when nothing moves.")
@@ -0,0 +1,78 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from pytience.games.solitaire.journal import KlondikeJournal
+from pytience.games.solitaire.klondike import KlondikeGame, MoveType
+
+
+class KlondikeJournalTestCase(TestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = Path(directory.name).joinpath('saves', 'klondike.journal')
+
+    @staticmethod
+    def play(journal: KlondikeJournal, game: KlondikeGame, num_moves: int) -> set:
+        """
+        Make legal moves the way the klondike command does, journaling each one
+        :return: The actions journaled
+        """
+        actions = set()
+        for move_num in range(num_moves):
+            moves = game.legal_moves()
+            move = moves[move_num * 7 % len(moves)]
+            action, *args = {
+                MoveType.Deal: ('deal',),
+                MoveType.WasteToFoundation: ('select_waste', None),
+                MoveType.WasteToTableau: ('select_waste', move.destination),
+                MoveType.TableauToFoundation: ('select_tableau', move.origin, move.card_num),
+                MoveType.TableauToTableau: ('select_tableau', move.origin, move.card_num, move.destination),
+                MoveType.FoundationToTableau: ('select_foundation', move.origin, move.destination)
+            }[move.kind]
+            getattr(game, action)(*args)
+            journal.record(game, action, *args)
+            actions.add(action)
+        return actions
+
+    def test_load(self):
+        game = KlondikeGame(deal_number=8)
+        journal = KlondikeJournal(self.filename, snapshot_interval=10)
+        actions = self.play(journal, game, 300)
+        self.assertIn('select_foundation', actions)
+        game.undo()
+        journal.record(game, 'undo')
+        game.goto(game.undo_log.step - 5)
+        journal.record(game, 'goto', game.undo_log.step)
+        game.redo()
+        journal.record(game, 'redo')
+        game.autoplay()
+        journal.record(game, 'autoplay')
+        journal.close()
+        self.assertDictEqual(KlondikeJournal(self.filename).load().dump(), game.dump(),
+                             "Loading should replay every change after the snapshot.")
+        self.assertLessEqual(len(self.filename.read_text().splitlines()), 11, "Journals should be compacted.")
+        self.assertFalse(self.filename.with_name('klondike.journal.tmp').exists())
+
+        loaded = KlondikeJournal(self.filename).load(max_undo_depth=10)
+        self.assertEqual(loaded.pack(), game.pack())
+        self.assertEqual(loaded.undo_log.max_depth, 10)
+
+    def test_partly_written(self):
+        game = KlondikeGame(deal_number=3)
+        journal = KlondikeJournal(self.filename)
+        self.play(journal, game, 5)
+        before = game.dump()
+        self.play(journal, game, 1)
+        journal.close()
+        text = self.filename.read_text()
+        for end in range(len(text) - 1, len(text) - len(text.splitlines()[-1]) - 1, -1):
+            self.filename.write_text(text[:end])
+            self.assertDictEqual(KlondikeJournal(self.filename).load().dump(), before,
+                                 "Partly written changes should be ignored.")
+        self.filename.write_text(text + '["quit"]\n["deal"]\n')
+        self.assertDictEqual(KlondikeJournal(self.filename).load().dump(), game.dump(),
+                             "Unknown changes should end the journal.")
+
+        with self.assertRaises(FileNotFoundError):
+            KlondikeJournal(self.filename.with_name('missing')).load()
@@ -0,0 +1,92 @@
+import random
+from unittest import TestCase
+
+from pytience.cards.deck import Suit
+from pytience.cards.exception import NoCardsRemainingException
+from pytience.games.exception import IllegalMoveException
+from pytience.games.solitaire.exception import IllegalTableauBuildOrderException, TableauCardNotAvailableException, \
+    IllegalFoundationBuildOrderException, TableauPileIndexError
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType
+from pytience.games.solitaire.position import KlondikePosition
+
+
+class KlondikePositionTestCase(TestCase):
+    def test_play_like_klondike_game(self):
+        for deal_number in range(10):
+            klondike = KlondikeGame(deal_number=deal_number)
+            position = KlondikePosition.from_game(klondike)
+            choose = random.Random(deal_number).choice
+            for _ in range(200):
+                moves = klondike.legal_moves()
+                self.assertListEqual(position.legal_moves(), moves, "Positions should list the same moves.")
+                move = choose(moves)
+                klondike.apply(move)
+                position = position.apply(move)
+                self.assertEqual(position, KlondikePosition.from_game(klondike), "Moves should play the same.")
+            self.assertEqual(position.is_solved(), klondike.is_solved())
+
+    def test_negative_destinations(self):
+        klondike = KlondikeGame(deal_number=2)
+        position = KlondikePosition.from_game(klondike)
+        for engine in klondike, position:
+            with self.assertRaises(TableauPileIndexError):
+                engine.apply(Move(MoveType.TableauToTableau, 0, -1, -8))
+        choose = random.Random(2).choice
+        for _ in range(100):
+            move = choose(klondike.legal_moves())
+            if move.destination is not None:
+                move = move._replace(destination=move.destination - 7)
+            klondike.apply(move)
+            position = position.apply(move)
+            self.assertEqual(position, KlondikePosition.from_game(klondike),
+                             "Piles numbered from the end should play the same in both engines.")
+
+    def test_apply(self):
+        position = KlondikePosition.from_game(KlondikeGame(deal_number=1))
+        before = tuple(position)
+        dealt = position.apply(Move(MoveType.Deal))
+        self.assertTupleEqual(tuple(position), before, "Positions should never change.")
+        self.assertIs(dealt.tableau, position.tableau, "Unchanged piles should be shared.")
+        self.assertIs(dealt.foundation, position.foundation)
+        self.assertEqual(dealt.waste, position.stock[:1])
+        self.assertNotEqual(hash(dealt), hash(position))
+        self.assertEqual(len({position, dealt, position.apply(Move(MoveType.Deal))}), 2, "Positions are values.")
+
+        for move in position.legal_moves():
+            moved = position.apply(move)
+            changed = [pile_num for pile_num in range(7) if moved.tableau[pile_num] is not position.tableau[pile_num]]
+            self.assertLessEqual(len(changed), 2, "Only the piles a move touches should be copied.")
+
+    def test_illegal_moves(self):
+        position = KlondikePosition(0, b'', b'', (b'', b'', b'', b''), (bytes([1, 12, 25]), bytes([0])))
+        with self.assertRaises(IllegalMoveException):
+            position.apply(Move(MoveType.Deal))
+        with self.assertRaises(IllegalMoveException):
+            position.apply(Move(MoveType.WasteToFoundation))
+        with self.assertRaises(TableauCardNotAvailableException):
+            position.apply(Move(MoveType.TableauToTableau, 0, 0, 1))
+        with self.assertRaises(IllegalFoundationBuildOrderException):
+            position.apply(Move(MoveType.TableauToFoundation, 0, 1))
+        with self.assertRaises(IllegalTableauBuildOrderException):
+            position.apply(Move(MoveType.TableauToTableau, 0, 1, 0))
+        with self.assertRaises(NoCardsRemainingException):
+            position.apply(Move(MoveType.FoundationToTableau, Suit.Spades, destination=1))
+
+        moved = position.apply(Move(MoveType.TableauToTableau, 0, 1, 1))
+        self.assertTupleEqual(moved.tableau, (bytes([0, 12]), bytes([0, 25])), "The card beneath should be revealed.")
+
+    def test_dump(self):
+        klondike = KlondikeGame(deal_number=7)
+        for _ in range(20):
+            klondike.apply(klondike.legal_moves()[0])
+        position = KlondikePosition.from_dump(klondike.dump())
+        self.assertEqual(position, KlondikePosition.from_game(klondike))
+        self.assertEqual(position.deal_number, 7)
+
+        game_dump = klondike.dump()
+        position_dump = position.to_dump()
+        self.assertEqual(len(KlondikeGame(game_dump=position_dump).undo_stack), 0, "Positions have no undo log.")
+        del game_dump["undo_stack"], position_dump["undo_stack"]
+        self.assertDictEqual(position_dump, game_dump, "Positions should dump like the game.")
+        self.assertEqual(KlondikePosition.from_dump(position.to_dump()), position, "Dumps should round trip.")
+        self.assertEqual(position.to_game().pack(), klondike.pack())
@@ -0,0 +1,75 @@
+import random
+from unittest import TestCase
+from unittest.mock import patch
+
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType
+from pytience.games.solitaire.simulation import GreedyPolicy, Policy, RandomPolicy, ScriptedPolicy, SimulationReport, \
+    play, play_deals, simulate
+from pytience.games.solitaire.solver import KlondikeSolver
+
+EMPTY_TABLEAU = tuple(bytes([0]) for _ in range(7))
+
+
+class SimulationTestCase(TestCase):
+    def test_reset(self):
+        klondike = KlondikeGame(deal_number=1)
+        tableau, foundation, stock = klondike.tableau, klondike.foundation, klondike.stock
+        play(klondike, GreedyPolicy(), random.Random(1))
+        klondike.reset(deal_number=2)
+        self.assertDictEqual(klondike.dump(), KlondikeGame(deal_number=2).dump(), "Resetting should start a new deal.")
+        self.assertEqual(klondike.state_hash, KlondikeGame(deal_number=2).state_hash)
+        self.assertIs(klondike.tableau, tableau, "Resetting should reuse the piles.")
+        self.assertIs(klondike.foundation, foundation)
+        self.assertIs(klondike.stock, stock)
+        self.assertEqual(len(klondike.undo_stack), 0, "Resetting should clear the undo log.")
+        klondike.reset(seed=5)
+        self.assertEqual(klondike.pack(), KlondikeGame(seed=5).pack())
+
+    def test_policies(self):
+        klondike = KlondikeGame(deal_number=3)
+        moves = klondike.legal_moves()
+        rng = random.Random(0)
+        self.assertIn(RandomPolicy().choose(klondike, moves, rng), moves)
+        self.assertEqual(ScriptedPolicy([MoveType.Deal]).choose(klondike, moves, rng), Move(MoveType.Deal))
+        self.assertIsNone(ScriptedPolicy([MoveType.FoundationToTableau]).choose(klondike, moves, rng),
+                          "Scripted policies should only make the moves listed.")
+        self.assertEqual(GreedyPolicy().choose(klondike, moves, rng), KlondikeSolver.candidate_moves(klondike)[0])
+        with patch.object(KlondikeGame, 'legal_moves', side_effect=AssertionError('Moves should not be listed again')):
+            best = KlondikeSolver.candidate_moves(klondike, moves)[0]
+            self.assertEqual(GreedyPolicy().choose(klondike, moves, rng), best, "Policies should rank the given moves.")
+
+        # Every card in the stock, in foundation order, so each deal goes straight to the foundation
+        klondike = KlondikeGame(packed=(0, bytes(range(52)), b'', (b'', b'', b'', b''), EMPTY_TABLEAU))
+        won, num_moves = play(klondike, ScriptedPolicy([MoveType.WasteToFoundation, MoveType.Deal]), rng)
+        self.assertTrue(won)
+        self.assertEqual(num_moves, 104)
+
+        klondike = KlondikeGame(packed=(0, bytes(range(1, 52)), b'', (b'', b'', b'', b''), EMPTY_TABLEAU))
+        won, num_moves = play(klondike, ScriptedPolicy([MoveType.Deal]), rng)
+        self.assertFalse(won, "A policy that only deals can't win.")
+        self.assertLess(num_moves, 60, "Deterministic policies should stop when they loop.")
+        won, num_moves = play(KlondikeGame(packed=klondike.pack()), RandomPolicy(), rng, max_moves=30)
+        self.assertEqual(num_moves, 30, "Games should stop after the most moves.")
+
+        class Undecided(Policy):
+            pass
+        with self.assertRaises(TypeError, msg="Policies that can't choose should not be created."):
+            Undecided()
+
+    def test_simulate(self):
+        report = simulate(GreedyPolicy(), 12, seed=4)
+        self.assertEqual(report.games, 12)
+        self.assertGreater(report.games_per_second, 0)
+        self.assertGreater(report.mean_moves, 0)
+        self.assertLessEqual(report.wins, 12)
+        self.assertEqual(report.win_rate, report.wins / 12)
+        self.assertEqual(report.mean_score, report.total_score / 12)
+
+        threaded = simulate(GreedyPolicy(), 12, seed=4, workers=3)
+        self.assertEqual((threaded.games, threaded.wins, threaded.total_score, threaded.total_moves),
+                         (report.games, report.wins, report.total_score, report.total_moves),
+                         "Seeded simulations should play the same games however they're split.")
+        forked = simulate(GreedyPolicy(), 12, seed=4, workers=2, use_processes=True)
+        self.assertEqual(forked.total_moves, report.total_moves)
+
+        self.assertEqual(str(play_deals(RandomPolicy(), [], 10)), str(SimulationReport()))
@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+from pytience.cards.deck import Suit
+from pytience.games.solitaire.klondike import KlondikeGame, Move, MoveType
+from pytience.games.solitaire.solver import KlondikeSolver, SolverStatus, solve, pack_moves, unpack_moves
+
+EMPTY_TABLEAU = tuple(bytes([0]) for _ in range(7))
+
+
+class KlondikeSolverTestCase(TestCase):
+    def test_solve_ordered_stock(self):
+        # Every card in the stock, in foundation order, so each deal goes straight to the foundation
+        klondike = KlondikeGame(packed=(0, bytes(range(52)), b'', (b'', b'', b'', b''), EMPTY_TABLEAU))
+        before = klondike.pack()
+        result = solve(klondike)
+        self.assertEqual(result.status, SolverStatus.Solved, "An ordered stock should be solvable.")
+        self.assertTrue(result.is_solved)
+        self.assertEqual(klondike.pack(), before, "Solving should not change the game.")
+        self.assertEqual(len(result.moves), 104, "Each card should be dealt and moved to the foundation.")
+        self.assertGreater(result.nodes, 0)
+        for move in result.moves:
+            klondike.apply(move)
+        self.assertTrue(klondike.is_solved(), "Replaying the solution should solve the game.")
+
+    def test_solve_revealed_tableau(self):
+        klondike = KlondikeGame(packed=(0, b'', b'', (bytes(range(12)), b'', b'', b''), (bytes([0, 12]),) * 1 +
+                                        tuple(bytes([0, suit * 13 + 12]) + bytes(range(suit * 13 + 11, suit * 13 - 1, -1))
+                                              for suit in range(1, 4)) + (bytes([0]),) * 3))
+        result = solve(klondike, max_nodes=0)
+        self.assertEqual(result.status, SolverStatus.Solved, "A revealed tableau should be finished without search.")
+        self.assertEqual(result.nodes, 0, "No search should be needed.")
+        self.assertTrue(all(move.kind == MoveType.TableauToFoundation for move in result.moves))
+        self.assertEqual(len(result.moves), 40)
+
+    def test_solve_unsolvable(self):
+        # The 2♠ is stuck on top of the A♠ with nowhere to go
+        klondike = KlondikeGame(packed=(0, b'', b'', (b'', bytes(range(13, 26)), bytes(range(26, 39)),
+                                                      bytes(range(39, 52))), (bytes([1, 0, 1]),)))
+        self.assertListEqual(klondike.legal_moves(), [])
+        result = KlondikeSolver().solve(klondike)
+        self.assertEqual(result.status, SolverStatus.Unsolvable)
+        self.assertListEqual(result.moves, [])
+
+    def test_solve_not_found(self):
+        # The 2♠ is stuck as before, and the only move splits the 10♥ 9♠ run without freeing the 10♥
+        klondike = KlondikeGame(packed=(0, b'', b'', (b'', bytes(range(13, 20)), bytes(range(26, 39)),
+                                                      bytes(range(39, 46))),
+                                        (bytes([1, 0, 1]), bytes([0, 48, 8]), bytes([0, 22]))))
+        self.assertListEqual(klondike.legal_moves(), [Move(MoveType.TableauToTableau, 1, 1, 2)])
+        result = KlondikeSolver().solve(klondike)
+        self.assertEqual(result.status, SolverStatus.NotFound, "Skipping a move should not prove a deal unsolvable.")
+        self.assertListEqual(result.moves, [])
+
+    def test_solve_budget(self):
+        klondike = KlondikeGame()
+        result = KlondikeSolver(max_nodes=1).solve(klondike)
+        self.assertEqual(result.status, SolverStatus.BudgetExceeded, "A new game can't be solved in one move.")
+        self.assertLessEqual(result.nodes, 1)
+
+        result = KlondikeSolver(max_nodes=None, max_seconds=0).solve(klondike)
+        self.assertEqual(result.status, SolverStatus.BudgetExceeded, "A new game can't be solved in no time.")
+
+    def test_candidate_moves(self):
+        klondike = KlondikeGame(packed=(0, b'', b'', (b'', b'', b'', b''), (
+            bytes([0, 12, 50, 10, 48]),  # K♠ Q♥ J♠ 10♥
+            bytes([1, 0, 36]),  # |A♠ J♣
+            bytes([0]),
+            bytes([0, 24]),  # Q♦
+        )))
+        moves = KlondikeSolver.candidate_moves(klondike)
+        self.assertNotIn(Move(MoveType.TableauToTableau, 0, 0, 2), moves, "Kings at the bottom stay put.")
+        self.assertNotIn(Move(MoveType.TableauToTableau, 0, 2, 3), moves, "Runs aren't split for no reason.")
+        self.assertNotIn(Move(MoveType.TableauToTableau, 0, 3, 1), moves, "Runs aren't split for no reason.")
+        self.assertListEqual(moves, [Move(MoveType.TableauToTableau, 1, 1, 3)], "Only the revealing move is left.")
+
+    def test_pack_moves(self):
+        moves = [Move(MoveType.Deal), Move(MoveType.WasteToFoundation), Move(MoveType.WasteToTableau, destination=3),
+                 Move(MoveType.TableauToFoundation, 2, 5), Move(MoveType.TableauToTableau, 6, 4, 0),
+                 Move(MoveType.FoundationToTableau, Suit.Hearts, destination=1)]
+        packed = pack_moves(moves)
+        self.assertEqual(len(packed), 4 * len(moves), "Each move should pack into 4 bytes.")
+        self.assertListEqual(unpack_moves(packed), moves)
@@ -6,6 +6,7 @@ from pytience.cards.deck import Suit, Pip, Card, Deck
 from pytience.games.solitaire.exception import IllegalTableauBuildOrderException, TableauCardIndexError, \
     ConcealedCardNotAllowedException, TableauPileIndexError, TableauCardNotAvailableException
 from pytience.games.solitaire.tableau import Tableau
+from pytience.games.util import UndoLog
 
 
 class TableauTestCase(TestCase):
@@ -176,13 +177,20 @@ class TableauTestCase(TestCase):
         tableau.piles = list(map(lambda p: list(map(Card.parse_card, p)), piles))
         tableau.put(tableau.get(0, 2), 5)
         self.assertEqual(len(tableau.undo_stack), 2, "There should be exactly 2 undo actions in the tableau.")
-        undo_stack = list(map(lambda u: {'action': u.function.__name__, 'args': u.args}, tableau.undo_stack))
+        undo_stack = tableau.dump_undo_stack()
 
         dump = tableau.dump()
         self.assertEqual(len(dump["piles"]), len(tableau.piles))
         for pile_num, tableau_pile in enumerate(tableau.piles):
             self.assertListEqual(list(map(str, tableau_pile)), dump["piles"][pile_num])
-        self.assertListEqual(dump["undo_stack"], undo_stack)
+        self.assertDictEqual(dump["undo_stack"], undo_stack)
+        self.assertListEqual(dump["undo_stack"]["hand"], [], "Cards put back on the tableau should leave the hand.")
+
+        tableau = Tableau(tableau_dump=dump)
+        tableau.undo()
+        tableau.undo()
+        self.assertListEqual(list(map(str, tableau.piles[0])), piles[0], "Undo should work after loading.")
+        self.assertListEqual(list(map(str, tableau.piles[5])), piles[5], "Undo should work after loading.")
 
     def test_load(self):
         dump = {"piles": [["K♣", "Q♥"], ["K♦"], ["|A♣", "|2♣", "10♦"], [],
@@ -191,11 +199,14 @@ class TableauTestCase(TestCase):
                 "undo_stack": [{"action": "undo_get", "args": [0, ["J♣", "10♥", "9♣"], False]},
                                {"action": "undo_put", "args": [5, 3]}]}
         tableau = Tableau(tableau_dump=dump)
-        undo_stack = list(map(lambda u: {'action': u.function.__name__, 'args': u.args}, tableau.undo_stack))
         self.assertEqual(len(tableau.piles), len(dump["piles"]))
         for pile_num, tableau_pile in enumerate(tableau.piles):
             self.assertListEqual(list(map(str, tableau_pile)), dump["piles"][pile_num])
-        self.assertListEqual(dump["undo_stack"], undo_stack)
+        self.assertEqual(len(tableau.undo_stack), 2, "Old undo stacks should be converted.")
+        tableau.undo()
+        tableau.undo()
+        self.assertListEqual(list(map(str, tableau.piles[0])), ["K♣", "Q♥", "J♣", "10♥", "9♣"])
+        self.assertListEqual(list(map(str, tableau.piles[5])), ["|3♣", "K♠", "Q♦"])
 
     def test_undo_put(self):
         tableau = Tableau()
@@ -216,12 +227,197 @@ class TableauTestCase(TestCase):
         self.assertTrue(tableau.piles[0][3].is_revealed)
 
         # First undo it without re-concealing the top card
-        tableau.undo_get(0, gotten_card_strings, False)
+        gotten_cards = list(map(Card.parse_card, gotten_card_strings))
+        tableau.undo_log.hand.extend(gotten_cards)
+        tableau.undo_get(0, len(gotten_cards), False)
         self.assertEqual(len(tableau.piles[0]), 8)
         self.assertTrue(tableau.piles[0][3].is_revealed)
+        self.assertListEqual(tableau.piles[0][4:], gotten_cards, "The cards should be taken from the hand.")
+        self.assertListEqual(tableau.undo_log.hand, [])
 
         tableau.piles[0] = list(map(Card.parse_card, remaining_cards))
-        tableau.undo_get(0, gotten_card_strings, True)
+        tableau.undo_log.hand.extend(gotten_cards)
+        tableau.undo_get(0, len(gotten_cards), True)
         self.assertEqual(len(tableau.piles[0]), 8)
         self.assertFalse(tableau.piles[0][3].is_revealed)
 
+    def test_wide_tableau(self):
+        tableau = Tableau(300)
+        king = Card(Pip.King, Suit.Spades, True)
+        tableau.put([king], 299)
+        tableau.put(tableau.get(299, 0), 298)
+        self.assertListEqual(tableau[298], [king])
+        self.assertListEqual(tableau[299], [])
+
+        undo_log = UndoLog()
+        undo_log.load_bytes(tableau.undo_log.to_bytes())
+        self.assertEqual(undo_log.records, tableau.undo_log.records, "Wide pile numbers should be encoded.")
+        undo_log.load(tableau.undo_log.dump())
+        self.assertEqual(undo_log.records, tableau.undo_log.records, "Wide pile numbers should be dumped.")
+
+        with tableau.undo_log.group():
+            tableau.put(tableau.get(298, 0), 297)
+        tableau.undo()
+        self.assertListEqual(tableau[297], [])
+        self.assertListEqual(tableau[298], [king])
+        tableau.undo()
+        tableau.undo()
+        tableau.undo()
+        self.assertListEqual(tableau[298], [])
+        self.assertListEqual(tableau[299], [])
+        self.assertEqual(tableau.state_hash, Tableau(300).state_hash)
+        for _ in range(3):
+            tableau.redo()
+        self.assertListEqual(tableau[298], [king])
+        self.assertIn(298, tableau.destinations(Card(Pip.Queen, Suit.Hearts, True)))
+
+    def test_pack(self):
+        tableau = Tableau(7, Deck().shuffle())
+        packed = tableau.pack()
+        self.assertEqual(len(packed), 7, "There should be one packed pile per tableau pile.")
+        for pile_num, packed_pile in enumerate(packed):
+            self.assertEqual(packed_pile[0], pile_num, "Each pile should start with its number of concealed cards.")
+            self.assertEqual(len(packed_pile), pile_num + 2, "Packed piles should use one byte per card.")
+
+        unpacked = Tableau(packed=packed)
+        for pile, unpacked_pile in zip(tableau.piles, unpacked.piles):
+            self.assertListEqual(list(map(str, pile)), list(map(str, unpacked_pile)))
+        self.assertEqual(len(unpacked.undo_stack), 0, "Unpacked tableaus should have no undo history.")
+
+        tableau.piles[6][-1].conceal()
+        tableau.piles[6][0].reveal()
+        with self.assertRaises(ValueError, msg="Concealed cards above revealed cards can't be packed."):
+            tableau.pack()
+
+    def test_can_put(self):
+        tableau = Tableau()
+        king, queen = Card(Pip.King, Suit.Spades).reveal(), Card(Pip.Queen, Suit.Hearts).reveal()
+        self.assertFalse(tableau.can_put([Card(Pip.King, Suit.Spades)], 0), "Concealed cards can't be built.")
+        self.assertFalse(tableau.can_put([queen], 0), "Only kings can be built on empty piles.")
+        self.assertFalse(tableau.can_put([king], 7), "Nonexistent piles can't be built on.")
+        self.assertTrue(tableau.can_put([king], 0), "Kings can be built on empty piles.")
+        tableau.put([king], 0)
+        self.assertTrue(tableau.can_put([queen], 0), "Alternating descending cards can be built.")
+        self.assertFalse(tableau.can_put([Card(Pip.Queen, Suit.Clubs).reveal()], 0), "Colors must alternate.")
+        self.assertFalse(tableau.can_put([Card(Pip.Jack, Suit.Hearts).reveal()], 0), "Ranks must descend by one.")
+        self.assertEqual(len(tableau.undo_stack), 1, "Checking a put should not record an undo action.")
+
+    def test_can_get(self):
+        tableau = Tableau(7, Deck().shuffle())
+        self.assertFalse(tableau.can_get(0, None), "A card num must be given.")
+        self.assertFalse(tableau.can_get(7, -1), "Nonexistent piles can't be taken from.")
+        self.assertFalse(tableau.can_get(6, 0), "Concealed cards can't be taken.")
+        self.assertFalse(tableau.can_get(0, 1), "Nonexistent cards can't be taken.")
+        self.assertTrue(tableau.can_get(6, -1), "Top cards can be taken.")
+        self.assertTrue(tableau.can_get(6, 6), "Revealed cards can be taken by index.")
+        self.assertFalse(tableau.can_get(6, -100), "Out of range negative card nums include the concealed cards.")
+        self.assertListEqual(tableau.peek(6, -1), tableau.piles[6][-1:], "Peek should return the cards get would.")
+        self.assertEqual(len(tableau.piles[6]), 7, "Checking a get should not remove cards.")
+        self.assertEqual(len(tableau.undo_stack), 0, "Checking a get should not record an undo action.")
+        with self.assertRaises(TableauCardNotAvailableException, msg="Peek should raise the same exceptions as get."):
+            tableau.peek(6, 0)
+
+    def test_state_hash(self):
+        tableau = Tableau(7, Deck().shuffle())
+        original_hash = tableau.state_hash
+        self.assertEqual(original_hash, Tableau(packed=tableau.pack()).state_hash, "Equal piles should hash equally.")
+        tableau.piles[0] = [Card(Pip.King, Suit.Spades, True)]
+        tableau.piles[1] = [Card(Pip.Ace, Suit.Spades), Card(Pip.Queen, Suit.Hearts, True)]
+        tableau.rehash()
+        tableau.put(tableau.get(1, -1), 0)
+        self.assertEqual(tableau.state_hash, Tableau(packed=tableau.pack()).state_hash,
+                         "Moving and revealing cards should update the hash.")
+        tableau.undo()
+        tableau.undo()
+        self.assertEqual(tableau.state_hash, Tableau(packed=tableau.pack()).state_hash,
+                         "Undoing moves should update the hash.")
+        state_hash = tableau.state_hash
+        tableau.piles[1][0].reveal()
+        self.assertNotEqual(tableau.state_hash, state_hash, "Changes made through piles should be picked up.")
+        self.assertEqual(tableau.state_hash, tableau.rehash())
+
+    def test_canonical_key(self):
+        tableau = Tableau(7, Deck().shuffle())
+        swapped = Tableau(packed=tableau.pack())
+        swapped.piles[0], swapped.piles[6] = swapped.piles[6], swapped.piles[0]
+        swapped.rehash()
+        self.assertEqual(tableau.canonical_key(), swapped.canonical_key(), "Pile order shouldn't matter.")
+        self.assertEqual(tableau.canonical_hash, swapped.canonical_hash, "Pile order shouldn't matter.")
+        self.assertNotEqual(tableau.state_hash, swapped.state_hash, "The state hash includes the pile order.")
+
+        swapped.piles[6][-1].conceal()
+        swapped.rehash()
+        self.assertNotEqual(tableau.canonical_key(), swapped.canonical_key(), "Revealed cards should matter.")
+        self.assertNotEqual(tableau.canonical_hash, swapped.canonical_hash, "Revealed cards should matter.")
+
+        tableau = Tableau(packed=(bytes([0, 12]), bytes([0]), bytes([0])))
+        moved = Tableau(packed=(bytes([0]), bytes([0]), bytes([0])))
+        moved.put([Card(Pip.King, Suit.Spades, True)], 2)
+        self.assertEqual(tableau.canonical_key(), bytes([0, 0, 0, 0, 1, 0, 12]),
+                         "Piles should be sorted, with their lengths and concealed counts.")
+        self.assertEqual(tableau.canonical_key(), moved.canonical_key(), "Kings may be moved to any empty pile.")
+        self.assertEqual(tableau.canonical_hash, moved.canonical_hash, "Puts should update the canonical hash.")
+
+    def test_destinations(self):
+        tableau = Tableau(size=30)
+        king, queen = Card(Pip.King, Suit.Spades, True), Card(Pip.Queen, Suit.Hearts, True)
+        self.assertSetEqual(set(tableau.destinations(king)), set(range(30)), "Kings fit on every empty pile.")
+        self.assertSetEqual(set(tableau.destinations(queen)), set(), "Only Kings fit on empty piles.")
+        self.assertSetEqual(set(tableau.destinations(Card(Pip.King, Suit.Hearts))), set(),
+                            "Concealed cards don't fit anywhere.")
+
+        tableau.put([king], 12)
+        self.assertSetEqual(set(tableau.destinations(queen)), {12}, "Puts should update the index.")
+        self.assertNotIn(12, tableau.destinations(king), "Puts should update the index.")
+        self.assertIn(queen.code, tableau.destination_index)
+        tableau.put([queen], 12)
+        self.assertSetEqual(set(tableau.destinations(queen)), set(), "Puts should update the index.")
+        tableau.undo()
+        self.assertSetEqual(set(tableau.destinations(queen)), {12}, "Undoing a put should update the index.")
+        tableau.get(12, 0)
+        self.assertSetEqual(set(tableau.destinations(king)), set(range(30)), "Gets should update the index.")
+        tableau.undo()
+        self.assertSetEqual(set(tableau.destinations(queen)), {12}, "Undoing a get should update the index.")
+
+        tableau.piles[3].append(Card(Pip.King, Suit.Clubs, True))
+        self.assertSetEqual(set(tableau.destinations(queen)), {3, 12}, "Direct changes should be picked up.")
+        tableau.piles[3][-1].conceal()
+        self.assertSetEqual(set(tableau.destinations(queen)), {12}, "Concealed cards don't accept builds.")
+        tableau.put(tableau.get(12, 0), 29)
+        self.assertTrue(tableau.piles[3][-1].is_concealed)
+        self.assertSetEqual(set(tableau.destinations(queen)), {29})
+
+    def test_clone(self):
+        tableau = Tableau(3)
+        tableau.piles = [[], [Card(Pip.Two, Suit.Clubs), Card(Pip.Queen, Suit.Hearts, True)],
+                         [Card(Pip.Ace, Suit.Spades), Card(Pip.Jack, Suit.Spades, True)]]
+        before = tableau.pack()
+        clone = tableau.clone()
+        self.assertEqual(clone.pack(), before)
+        self.assertEqual(clone.state_hash, tableau.state_hash)
+        self.assertIs(clone[2][0], tableau[2][0], "Clones should share cards.")
+
+        clone.put([Card(Pip.King, Suit.Spades, True)], 0)
+        clone.put(clone.get(1, 1), 0)
+        self.assertEqual(tableau.pack(), before, "Changing a clone should not change the original.")
+        self.assertEqual(tableau.state_hash, tableau.rehash())
+        self.assertTrue(tableau[1][0].is_concealed, "Revealing a clone's card should not reveal the original's.")
+        self.assertTrue(clone[1][0].is_revealed)
+        self.assertIs(clone[2], tableau[2], "Unchanged piles should stay shared.")
+        self.assertEqual(clone.state_hash, clone.rehash(), "Clones should keep their hashes up to date.")
+        self.assertSetEqual(set(clone.destinations(Card(Pip.Ten, Suit.Hearts, True))), {2})
+        self.assertSetEqual(set(clone.destinations(Card(Pip.Jack, Suit.Clubs, True))), {0})
+        self.assertSetEqual(set(tableau.destinations(Card(Pip.Jack, Suit.Clubs, True))), {1})
+
+        tableau.put(tableau.get(2, 1), 1)
+        self.assertEqual(clone.pack()[2], before[2], "Changing the original should not change a clone.")
+        clone.undo()
+        clone.undo()
+        clone.undo()
+        self.assertEqual(clone.pack(), before, "Clones should undo their own moves.")
+        self.assertEqual(len(tableau.clone(with_undo_log=False).undo_stack), 0, "The undo log may be skipped.")
+        self.assertEqual(len(tableau.clone().undo_stack), 2, "Clones should copy the undo log by default.")
+
+        clone = tableau.clone()
+        clone.piles[1].clear()
+        self.assertEqual(len(tableau[1]), 3, "Direct changes to a clone's piles should not change the original.")